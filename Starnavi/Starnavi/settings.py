@@ -51,6 +51,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'posts.instrumentation.InstrumentationMiddleware',
+    'posts.profiling.ProfilingMiddleware',
+    'posts.routers.StickyPrimaryMiddleware',
 ]
 
 ROOT_URLCONF = 'Starnavi.urls'
@@ -77,22 +80,74 @@ WSGI_APPLICATION = 'Starnavi.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-# DATABASES = {
-#     'default': {
-#         'ENGINE': 'django.db.backends.sqlite3',
-#         'NAME': BASE_DIR / 'db.sqlite3',
-#     }
-# }
-
-DATABASES = {
-     'default': {
-         'ENGINE': 'django.db.backends.postgresql',
-         'NAME': os.getenv('POSTGRES_DB'),
-         'USER': os.getenv('POSTGRES_USER'),
-         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
-         'HOST': 'db',
-         'PORT': '5432',
-     }
+# Set DJANGO_DB=sqlite to run locally (e.g. tests and benchmarks) without
+# a PostgreSQL server.
+
+# Set DJANGO_DB_REPLICA to the host (PostgreSQL) or file (SQLite) of a read
+# replica to serve list and analytics reads from it. With SQLite the
+# ``replica`` alias always exists so tests can use two databases, but it is
+# only read from when DJANGO_DB_REPLICA is set.
+
+DB_REPLICA = os.getenv('DJANGO_DB_REPLICA')
+
+if os.getenv('DJANGO_DB') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        },
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': DB_REPLICA or BASE_DIR / 'db.replica.sqlite3',
+        },
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB'),
+            'USER': os.getenv('POSTGRES_USER'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
+            'HOST': 'db',
+            'PORT': '5432',
+        }
+    }
+
+    if DB_REPLICA:
+        DATABASES['replica'] = {**DATABASES['default'], 'HOST': DB_REPLICA}
+
+DATABASE_ROUTERS = ['posts.routers.ReplicaRouter']
+
+# Alias that reads of ``replica_reads`` views go to; None reads the primary.
+POSTS_READ_REPLICA = 'replica' if DB_REPLICA else None
+
+# Seconds a user reads from the primary after a write (read-your-writes).
+POSTS_REPLICA_STICKY_SECONDS = 5
+
+# Cache alias remembering recent writers. Must be shared by every worker,
+# since a write and the next read may be served by different ones.
+POSTS_REPLICA_STICKY_CACHE_ALIAS = 'shared'
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+# 'default' is local to each process. 'shared' is seen by every worker:
+# Redis when REDIS_URL is set (needs the redis package), otherwise a table
+# in the primary database created by ``manage.py createcachetable``.
+
+REDIS_URL = os.getenv('REDIS_URL')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'posts_cache',
+    },
 }
 
 # Password validation
@@ -135,3 +190,263 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Logging
+# https://docs.djangoproject.com/en/5.1/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'posts': {
+            'handlers': ['console'],
+            'level': os.getenv('POSTS_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
+
+# Request instrumentation (posts.instrumentation)
+
+# Requests issuing more database queries than this are logged as warnings.
+POSTS_QUERY_BUDGET = int(os.getenv('POSTS_QUERY_BUDGET', '30'))
+
+# Emit per-request timings in a Server-Timing response header.
+POSTS_SERVER_TIMING = True
+
+
+# Metrics (posts.metrics)
+
+# Directory shared by all worker processes for aggregating /api/metrics.
+# When unset, only the serving process is reported.
+POSTS_METRICS_DIR = os.getenv('POSTS_METRICS_DIR')
+
+# Bearer token Prometheus presents to scrape /api/metrics. Staff users
+# may read the metrics with their JWT whether or not it is set.
+POSTS_METRICS_TOKEN = os.getenv('POSTS_METRICS_TOKEN')
+
+# Minimum number of seconds between two snapshots of a process's metrics.
+POSTS_METRICS_FLUSH_INTERVAL = 1.0
+
+
+# Request profiling (posts.profiling)
+
+POSTS_PROFILING_ENABLED = os.getenv('POSTS_PROFILING_ENABLED') == '1'
+
+# Fraction of requests profiled with cProfile.
+POSTS_PROFILING_SAMPLE_RATE = float(os.getenv('POSTS_PROFILING_SAMPLE_RATE', '0'))
+
+# Requests slower than this have their stacks sampled every INTERVAL_MS.
+POSTS_PROFILING_SLOW_MS = 1000
+POSTS_PROFILING_INTERVAL_MS = 10
+
+# Number of profiles kept per process and the size of each profile.
+POSTS_PROFILING_BUFFER_SIZE = 50
+POSTS_PROFILING_TOP_FRAMES = 25
+POSTS_PROFILING_MAX_QUERIES = 100
+
+
+# Background workers (posts.tasks)
+
+# Run background work inline in the submitting thread.
+POSTS_BACKGROUND_TASKS_EAGER = False
+
+
+# Home feed
+
+# Authors with more followers than this are not fanned out on write; their
+# posts are merged into followers' feeds at read time instead.
+POSTS_FEED_FANOUT_LIMIT = 10_000
+
+# Feed entries inserted per statement during fan-out.
+POSTS_FEED_FANOUT_BATCH_SIZE = 1000
+
+# Number of an author's latest posts copied into a new follower's feed.
+POSTS_FEED_BACKFILL = 20
+
+
+# Auto-replies
+
+# Replies due within the same tick (in seconds) are sent in one batch.
+POSTS_AUTO_REPLY_TICK = 0.1
+
+# Replies held by the scheduler of one process; further ones are dropped.
+# A pending reply takes about 170 bytes.
+POSTS_AUTO_REPLY_MAX_PENDING = 100_000
+
+# Commenters mentioned by name in a coalesced auto-reply.
+POSTS_AUTO_REPLY_MAX_MENTIONS = 10
+
+
+# Moderation cache
+
+# Verdicts cached per process, keyed by a 16-byte hash of the normalized
+# text (about 150 bytes per entry).
+POSTS_MODERATION_CACHE_SIZE = 50_000
+
+# Django cache alias sharing verdicts between processes; None keeps them
+# per process.
+POSTS_MODERATION_CACHE_ALIAS = os.getenv('POSTS_MODERATION_CACHE_ALIAS')
+POSTS_MODERATION_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+# Near-duplicate comments
+
+# Comments shorter than this (after normalization) are not checked.
+POSTS_DUPLICATE_MIN_LENGTH = 40
+
+# Comments within this many differing SimHash bits (of 64) of a comment
+# created in the last POSTS_DUPLICATE_WINDOW seconds are duplicates.
+# Rewording one word of a 20-word comment changes about 7 bits; unrelated
+# comments differ by about 32.
+POSTS_DUPLICATE_MAX_DISTANCE = 6
+POSTS_DUPLICATE_WINDOW = 24 * 60 * 60
+
+# Candidates sharing a band compared per new comment.
+POSTS_DUPLICATE_MAX_CANDIDATES = 200
+
+# 'flag' marks duplicates with is_duplicate; 'block' also blocks them.
+POSTS_DUPLICATE_ACTION = os.getenv('POSTS_DUPLICATE_ACTION', 'flag')
+
+
+# Rate limiting
+
+# Requests per user and scope, as "<count>/<s|m|h|d>". A scope without a
+# rate is not limited. Bursts of up to <count> requests are allowed.
+POSTS_RATE_LIMITS = {
+    'posts': os.getenv('POSTS_RATE_LIMIT_POSTS', '30/m'),
+    'comments': os.getenv('POSTS_RATE_LIMIT_COMMENTS', '120/m'),
+    'reactions': os.getenv('POSTS_RATE_LIMIT_REACTIONS', '300/m'),
+}
+
+# 'memory' limits every worker separately; 'cache' shares the limits
+# between workers through the POSTS_RATE_LIMIT_CACHE_ALIAS cache, which
+# must then be shared too (e.g. Redis or Memcached).
+POSTS_RATE_LIMIT_BACKEND = os.getenv('POSTS_RATE_LIMIT_BACKEND', 'memory')
+POSTS_RATE_LIMIT_CACHE_ALIAS = os.getenv('POSTS_RATE_LIMIT_CACHE_ALIAS',
+                                         'default')
+
+
+# Post views
+
+# Views are counted in memory and added to Post.view_count every
+# POSTS_VIEW_FLUSH_INTERVAL seconds and at exit, so a worker that is
+# killed loses at most that many seconds of views.
+POSTS_VIEW_FLUSH_INTERVAL = 5.0
+
+# Posts updated per UPDATE statement when flushing.
+POSTS_VIEW_FLUSH_BATCH_SIZE = 500
+
+
+# Trending posts
+
+# A comment adds 1 to its post's trending score, halving every
+# POSTS_TRENDING_HALF_LIFE seconds; comments older than
+# POSTS_TRENDING_WINDOW seconds no longer count. Scores decay when
+# `manage.py update_trending` runs, e.g. every 10 minutes from cron.
+POSTS_TRENDING_HALF_LIFE = 6 * 60 * 60
+POSTS_TRENDING_WINDOW = 24 * 60 * 60
+
+# Seconds GET /api/posts/trending/ is served from the cache.
+POSTS_TRENDING_CACHE_TIMEOUT = 30
+
+
+# Startup
+
+# Load the URLconf, the moderation wordlist and the JWT algorithms when a
+# serving process (ASGI or WSGI, runserver included) starts instead of on
+# its first requests. Management commands never warm up; set
+# POSTS_WARM_UP=0 to skip it in servers too.
+POSTS_WARM_UP = os.getenv('POSTS_WARM_UP', '1') == '1'
+
+
+# JWT keys
+
+# JSON list of {"kid", "alg", "secret" | "public_key"[, "private_key"]},
+# see posts.keys; `manage.py generate_jwt_key` prints new entries. Without
+# it tokens are signed with HS256 and the SECRET_KEY under kid "default".
+# A path is read by posts.keys, so keys stay out of the environment.
+POSTS_JWT_KEYS = os.getenv('POSTS_JWT_KEYS_FILE')
+
+# Key signing new tokens; every other key only verifies.
+POSTS_JWT_SIGNING_KID = os.getenv('POSTS_JWT_SIGNING_KID', 'default')
+
+# The "default" SECRET_KEY key keeps verifying the tokens issued before
+# POSTS_JWT_KEYS was set. Set POSTS_JWT_RETIRE_DEFAULT_KEY=1 to drop it
+# once they have expired.
+POSTS_JWT_RETIRE_DEFAULT_KEY = (
+    os.getenv('POSTS_JWT_RETIRE_DEFAULT_KEY', '0') == '1')
+
+
+# Comment counts
+
+# Most post ids GET /api/posts/comment-counts/ accepts per request.
+POSTS_COMMENT_COUNTS_MAX_IDS = 100
+
+
+# Comment streams
+
+# How new comments reach the streams of other worker processes: 'local'
+# (this process only) or 'postgres' (LISTEN/NOTIFY on
+# POSTS_STREAM_CHANNEL), see posts.streams.
+POSTS_STREAM_BACKEND = os.getenv(
+    'POSTS_STREAM_BACKEND',
+    'local' if os.getenv('DJANGO_DB') == 'sqlite' else 'postgres')
+POSTS_STREAM_CHANNEL = 'posts_comments'
+
+# Streams open per process; more are refused with 503.
+POSTS_STREAM_MAX_SUBSCRIBERS = 1000
+
+# Comments buffered per stream; clients falling further behind are
+# disconnected and catch up with Last-Event-ID when they reconnect.
+POSTS_STREAM_QUEUE_SIZE = 100
+
+# Most missed comments sent to a reconnecting client; when more were
+# missed, the stream ends after them and the client reconnects.
+POSTS_STREAM_BACKLOG = 100
+
+# Seconds between keep-alive comments on idle streams.
+POSTS_STREAM_KEEPALIVE = 15
+
+
+# Reactions
+
+# Count rows per liked post or comment. More shards let more concurrent
+# likes of one target proceed without waiting on each other's row lock,
+# at the cost of summing more rows per read until `manage.py
+# compact_reactions` (e.g. hourly from cron) folds them into one.
+POSTS_REACTION_SHARDS = 8
+
+# Most ids GET /api/reactions/ accepts per request.
+POSTS_REACTIONS_MAX_IDS = 100
+
+
+# Notifications
+
+# Comments on a post are collapsed into the recipient's unread digest for
+# it until the digest is this many seconds old.
+POSTS_NOTIFICATION_DIGEST_WINDOW = 60 * 60
+
+# Cache holding the unread counts, and seconds before they are recounted.
+# Must be shared by every worker: digests are created by the background
+# writer of one process and read through another.
+POSTS_NOTIFICATION_CACHE_ALIAS = 'shared'
+POSTS_NOTIFICATION_UNREAD_TIMEOUT = 300
+
+
+# Idempotency keys
+
+# Seconds the response to a request with an Idempotency-Key header is
+# replayed to retries. Older keys are purged by `manage.py
+# purge_idempotency_keys`, e.g. hourly from cron.
+POSTS_IDEMPOTENCY_TTL = 24 * 60 * 60
+
+# Seconds after which a key whose first request never finished (e.g. its
+# worker was killed) can be claimed by a retry.
+POSTS_IDEMPOTENCY_LOCK_TIMEOUT = 60
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Starnavi.settings')
 
 application = get_wsgi_application()
+
+from posts.services import start_worker  # noqa: E402
+
+start_worker()
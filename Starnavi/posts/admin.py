@@ -13,5 +13,31 @@ from django.contrib import admin
 
 from .models import Post, Comment
 
-admin.site.register(Post)
-admin.site.register(Comment)
+
+class ModeratedAdmin(admin.ModelAdmin):
+
+    """
+    Admin for models whose default manager hides blocked rows.
+
+    Moderators need to see and unblock them, so the admin reads through
+    ``all_objects`` instead.
+
+    """
+
+    list_filter = ('is_blocked',)
+
+    def get_queryset(self, request):
+
+        """Return every row, blocked or not."""
+
+        queryset = self.model.all_objects.get_queryset()
+        ordering = self.get_ordering(request)
+
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+
+        return queryset
+
+
+admin.site.register(Post, ModeratedAdmin)
+admin.site.register(Comment, ModeratedAdmin)
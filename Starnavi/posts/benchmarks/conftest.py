@@ -0,0 +1,69 @@
+"""
+conftest.py
+
+Shared fixtures and options for the benchmark suite.
+
+Run the suite explicitly (it is excluded from the default test run):
+
+    pytest posts/benchmarks --benchmark-autosave
+    pytest posts/benchmarks --benchmark-compare --benchmark-max-regression=15
+
+The second command compares against the latest saved baseline in
+``.benchmarks/`` and fails when the median of any benchmark regressed by
+more than the given percentage.
+
+"""
+
+import os
+
+import pytest
+from pytest_benchmark.utils import parse_compare_fail
+
+from django.contrib.auth.models import User
+
+from posts.services import create_jwt_token
+
+
+def pytest_addoption(parser):
+
+    parser.addoption(
+        "--benchmark-max-regression",
+        type=int,
+        default=int(os.getenv("BENCHMARK_MAX_REGRESSION", "10")),
+        help="Fail when a benchmark's median is slower than the compared "
+             "baseline by more than this percentage (default: 10).",
+    )
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+
+    """
+    Turn ``--benchmark-max-regression`` into a compare-fail expression.
+
+    An explicit ``--benchmark-compare-fail`` takes precedence.
+
+    """
+
+    if (config.getoption("benchmark_compare", None)
+            and not config.getoption("benchmark_compare_fail", None)):
+        threshold = config.getoption("benchmark_max_regression")
+        config.option.benchmark_compare_fail = [
+            parse_compare_fail(f"median:{threshold}%"),
+        ]
+
+
+@pytest.fixture
+def user(db):
+
+    """A user to author benchmark data."""
+
+    return User.objects.create_user(username="bench", password="password123")
+
+
+@pytest.fixture
+def auth_headers(user):
+
+    """Client keyword arguments carrying a valid JWT."""
+
+    return {"HTTP_AUTHORIZATION": f"Bearer {create_jwt_token(user)}"}
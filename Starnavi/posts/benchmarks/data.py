@@ -0,0 +1,70 @@
+"""
+data.py
+
+Helpers that populate tables for the benchmark suite.
+
+"""
+
+import json
+import random
+import os
+
+from django.contrib.auth.models import User
+
+from posts.models import Post, Comment
+
+
+TABLE_SIZES = [
+    int(size)
+    for size in os.getenv("BENCHMARK_TABLE_SIZES", "100,1000,5000").split(",")
+]
+
+
+def seed_posts(user: User, count: int) -> None:
+
+    """Create ``count`` posts for ``user`` in one batch."""
+
+    Post.objects.bulk_create(
+        Post(title=f"Post {i}", content="Benchmark content " * 10,
+             author=user)
+        for i in range(count)
+    )
+
+
+def seed_comments(user: User, post: Post, count: int) -> None:
+
+    """Create ``count`` comments on ``post``, every tenth one blocked."""
+
+    Comment.objects.bulk_create(
+        Comment(post=post, author=user, content=f"Comment {i}",
+                is_blocked=i % 10 == 0)
+        for i in range(count)
+    )
+
+
+def json_length(response) -> int:
+
+    """Return the number of items in a JSON list response."""
+
+    return len(json.loads(response.content))
+
+
+DUPLICATE_SIGNATURES = int(os.getenv("BENCHMARK_DUPLICATE_SIGNATURES",
+                                     "1000000"))
+
+
+def seed_signatures(user: User, post: Post, count: int, seed: int = 0) -> None:
+
+    """Create ``count`` comments on ``post`` with random SimHash signatures."""
+
+    from posts.duplicates import signature_fields
+
+    rng = random.Random(seed)
+    batch_size = 10_000
+
+    for start in range(0, count, batch_size):
+        Comment.all_objects.bulk_create(
+            Comment(post=post, author=user, content=f"Comment {i}",
+                    **signature_fields(rng.getrandbits(64)))
+            for i in range(start, min(start + batch_size, count))
+        )
@@ -0,0 +1,64 @@
+import pytest
+
+from django.contrib.auth.models import User
+
+from posts.benchmarks.data import DUPLICATE_SIGNATURES, seed_signatures
+from posts.duplicates import find_duplicate, signature_fields, simhash
+from posts.models import Comment, Post
+
+
+TEXT = ("Earn money fast from home with this one simple trick, "
+        "visit my profile for the link and start today. ") * 2
+
+
+@pytest.fixture(scope="module")
+def signatures(django_db_setup, django_db_blocker):
+
+    """
+
+    Fixture seeding ``BENCHMARK_DUPLICATE_SIGNATURES`` signed comments
+    once for the module, and a comment duplicating ``TEXT``.
+
+    """
+
+    with django_db_blocker.unblock():
+        user = User.objects.create_user(username="signatures",
+                                        password="password123")
+        post = Post.objects.create(title="Post", content="Content",
+                                   author=user)
+        seed_signatures(user, post, DUPLICATE_SIGNATURES)
+        original = Comment.objects.create(post=post, author=user,
+                                          content=TEXT,
+                                          **signature_fields(simhash(TEXT)))
+
+        yield original
+
+        user.delete()
+
+
+def test_simhash(benchmark):
+
+    """Benchmark signing a 40-word comment."""
+
+    assert benchmark(simhash, TEXT) is not None
+
+
+@pytest.mark.django_db
+def test_find_duplicate_hit(benchmark, signatures):
+
+    """Benchmark finding the earlier copy of a re-formatted comment."""
+
+    signature = simhash(TEXT.upper())
+
+    assert benchmark(find_duplicate, signature) == signatures.id
+
+
+@pytest.mark.django_db
+def test_find_duplicate_miss(benchmark, signatures):
+
+    """Benchmark checking an original comment against every signature."""
+
+    signature = simhash("I disagree with the second paragraph, the "
+                        "benchmark numbers ignore the warm cache.")
+
+    assert benchmark(find_duplicate, signature) is None
@@ -0,0 +1,31 @@
+import pytest
+
+from posts.benchmarks.data import seed_posts
+
+
+INSTRUMENTATION = "posts.instrumentation.InstrumentationMiddleware"
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("instrumented", [False, True],
+                         ids=["plain", "instrumented"])
+@pytest.mark.benchmark(group="instrumentation-overhead")
+def test_list_posts_overhead(benchmark, client, settings, user, auth_headers,
+                             instrumented):
+
+    """
+    Compare GET /api/posts/ with and without the instrumentation middleware.
+
+    """
+
+    if not instrumented:
+        settings.MIDDLEWARE = [
+            middleware for middleware in settings.MIDDLEWARE
+            if middleware != INSTRUMENTATION
+        ]
+
+    seed_posts(user, 100)
+
+    response = benchmark(client.get, "/api/posts/", **auth_headers)
+
+    assert response.has_header("Server-Timing") is instrumented
@@ -0,0 +1,47 @@
+import json
+from io import StringIO
+
+import pytest
+
+from django.core.management import call_command
+
+from posts.keys import KeySet
+
+
+ALGORITHMS = ["HS256", "EdDSA", "RS256"]
+
+PAYLOAD = {"user_id": 1, "exp": 4102444800}
+
+
+def keyset(alg):
+
+    """Return a keyset with one new ``alg`` key, skipping if unavailable."""
+
+    if alg != "HS256":
+        pytest.importorskip("cryptography")
+
+    out = StringIO()
+    call_command("generate_jwt_key", alg=alg, kid=alg, stdout=out)
+
+    return KeySet([json.loads(out.getvalue())], alg)
+
+
+@pytest.mark.parametrize("alg", ALGORITHMS)
+def test_sign(benchmark, alg):
+
+    """Benchmark signing a token with each algorithm."""
+
+    keys = keyset(alg)
+
+    benchmark(keys.sign, PAYLOAD)
+
+
+@pytest.mark.parametrize("alg", ALGORITHMS)
+def test_verify(benchmark, alg):
+
+    """Benchmark verifying a token with each algorithm's cached key."""
+
+    keys = keyset(alg)
+    token = keys.sign(PAYLOAD)
+
+    assert benchmark(keys.verify, token) == PAYLOAD
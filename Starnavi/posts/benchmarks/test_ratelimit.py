@@ -0,0 +1,43 @@
+import pytest
+
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from posts.ratelimit import CacheRateLimiter, MemoryRateLimiter, rate_limit
+
+
+# High enough that no check is rejected while benchmarking.
+LIMIT, PERIOD = 10 ** 9, 1
+
+
+def test_memory_limiter_hit(benchmark):
+
+    """Benchmark one GCRA check in the in-memory backend."""
+
+    limiter = MemoryRateLimiter()
+
+    assert benchmark(limiter.hit, "comments:1", LIMIT, PERIOD) == 0
+
+
+def test_cache_limiter_hit(benchmark):
+
+    """Benchmark one sliding window check in the local-memory cache."""
+
+    limiter = CacheRateLimiter("default")
+
+    assert benchmark(limiter.hit, "comments:1", LIMIT, PERIOD) == 0
+
+
+@pytest.mark.parametrize("backend", ["memory", "cache"])
+def test_rate_limit_decorator(benchmark, settings, backend):
+
+    """Benchmark the overhead of ``rate_limit`` around a trivial view."""
+
+    settings.POSTS_RATE_LIMITS = {"comments": f"{LIMIT}/s"}
+    settings.POSTS_RATE_LIMIT_BACKEND = backend
+
+    view = rate_limit("comments")(lambda request: HttpResponse())
+    request = RequestFactory().post("/api/posts/1/comments/")
+    request.user = type("User", (), {"id": 1})()
+
+    assert benchmark(view, request).status_code == 200
@@ -0,0 +1,71 @@
+import os
+import threading
+
+import pytest
+
+from django.contrib.auth.models import User
+from django.db import connection
+
+from posts.models import Post, Reaction, ReactionCount, ReactionTarget
+from posts.reactions import react, reaction_count
+
+
+THREADS = int(os.getenv("BENCHMARK_REACTION_THREADS", "16"))
+PER_THREAD = int(os.getenv("BENCHMARK_REACTIONS_PER_THREAD", "50"))
+
+# The throughput of each shard count is saved as ``reactions_per_second``
+# in the ``extra_info`` of --benchmark-json and --benchmark-autosave.
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize("shards", [1, 4, 16, 64])
+def test_concurrent_likes(benchmark, settings, user, shards):
+
+    """
+
+    Benchmark ``BENCHMARK_REACTION_THREADS`` threads each liking one post
+    for ``BENCHMARK_REACTIONS_PER_THREAD`` users, one transaction per
+    like, with ``shards`` count rows per target.
+
+    PostgreSQL only: SQLite serializes all write transactions, whatever
+    rows they touch.
+
+    """
+
+    if connection.vendor != "postgresql":
+        pytest.skip("Row lock contention needs PostgreSQL.")
+
+    settings.POSTS_REACTION_SHARDS = shards
+    post = Post.objects.create(title="Viral", content="Content", author=user)
+    fans = User.objects.bulk_create([User(username=f"fan{i}")
+                                     for i in range(THREADS * PER_THREAD)])
+
+    def like(batch):
+        try:
+            for fan in batch:
+                react(fan, ReactionTarget.POST, post.id)
+        finally:
+            connection.close()
+
+    def burst():
+        threads = [threading.Thread(target=like,
+                                    args=(fans[i::THREADS],))
+                   for i in range(THREADS)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+    def reset():
+        Reaction.objects.all().delete()
+        ReactionCount.objects.all().delete()
+
+    benchmark.pedantic(burst, setup=reset, rounds=5)
+
+    assert reaction_count(ReactionTarget.POST, post.id) == len(fans)
+
+    benchmark.extra_info["threads"] = THREADS
+    benchmark.extra_info["reactions_per_second"] = round(
+        len(fans) / benchmark.stats.stats.median)
@@ -0,0 +1,73 @@
+import pytest
+
+from django.test import RequestFactory
+
+from posts.models import Post, Comment
+from posts.schemas import CommentOut
+from posts.services import (
+    MODERATION_CACHE, create_jwt_token, jwt_required, moderate_content)
+
+
+CLEAN_TEXT = "This is a perfectly reasonable comment about the post. " * 4
+
+PROFANE_TEXT = "This is a damn comment about the post. " * 4
+
+
+@pytest.mark.parametrize("text", [CLEAN_TEXT, PROFANE_TEXT],
+                         ids=["clean", "profane"])
+def test_moderate_content(benchmark, text):
+
+    """Benchmark profanity detection on a short comment, uncached."""
+
+    moderate_content(text)
+
+    def uncached():
+        MODERATION_CACHE.clear()
+        return (text,), {}
+
+    benchmark.pedantic(moderate_content, setup=uncached, rounds=20)
+
+
+@pytest.mark.parametrize("text", [CLEAN_TEXT, PROFANE_TEXT],
+                         ids=["clean", "profane"])
+def test_moderate_content_cached(benchmark, text):
+
+    """Benchmark a repeated comment answered from the verdict cache."""
+
+    moderate_content(text)
+
+    benchmark(moderate_content, text)
+
+
+@pytest.mark.django_db
+def test_create_jwt_token(benchmark, user):
+
+    """Benchmark signing a JWT for a user."""
+
+    benchmark(create_jwt_token, user)
+
+
+@pytest.mark.django_db
+def test_jwt_required_decode(benchmark, auth_headers):
+
+    """Benchmark decoding a JWT and loading its user in ``jwt_required``."""
+
+    view = jwt_required(lambda request: request.user)
+    request = RequestFactory().get("/api/posts/", **auth_headers)
+
+    assert benchmark(view, request).username == "bench"
+
+
+@pytest.mark.django_db
+def test_comment_out_from_orm(benchmark, user):
+
+    """Benchmark serializing a freshly loaded comment."""
+
+    post = Post.objects.create(title="Post", content="Content", author=user)
+    comment_id = Comment.objects.create(post=post, author=user,
+                                        content="Comment").id
+
+    def serialize():
+        return CommentOut.from_orm(Comment.objects.get(id=comment_id))
+
+    benchmark(serialize)
@@ -0,0 +1,51 @@
+import pytest
+
+from posts.benchmarks.data import (
+    TABLE_SIZES, json_length, seed_comments, seed_posts)
+from posts.models import Post
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("size", TABLE_SIZES)
+def test_list_posts(benchmark, client, user, auth_headers, size):
+
+    """Benchmark GET /api/posts/ at several table sizes."""
+
+    seed_posts(user, size)
+
+    response = benchmark(client.get, "/api/posts/", **auth_headers)
+
+    assert json_length(response) == size
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("size", TABLE_SIZES)
+def test_list_comments(benchmark, client, user, auth_headers, size):
+
+    """Benchmark GET /api/posts/{post_id}/comments/ at several sizes."""
+
+    post = Post.objects.create(title="Post", content="Content", author=user)
+    seed_comments(user, post, size)
+
+    response = benchmark(client.get, f"/api/posts/{post.id}/comments/",
+                         **auth_headers)
+
+    assert json_length(response) == size - len(range(0, size, 10))
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("size", TABLE_SIZES)
+def test_comments_daily_breakdown(benchmark, client, user, auth_headers,
+                                  size):
+
+    """Benchmark GET /api/comments-daily-breakdown/ at several sizes."""
+
+    post = Post.objects.create(title="Post", content="Content", author=user)
+    seed_comments(user, post, size)
+
+    response = benchmark(client.get, "/api/comments-daily-breakdown/",
+                         {"date_from": "2000-01-01T00:00:00+00:00",
+                          "date_to": "2100-01-01T00:00:00+00:00"},
+                         **auth_headers)
+
+    assert response.json()["total_comments"] == size
@@ -0,0 +1,56 @@
+"""
+cache.py
+
+Bounded in-process caches.
+
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class LRUCache:
+
+    """
+    Thread-safe mapping keeping the ``maxsize`` most recently used entries.
+
+    """
+
+    def __init__(self, maxsize: int) -> None:
+
+        self.maxsize = maxsize
+        self.data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+
+        """Return the value of ``key`` and mark it as recently used."""
+
+        with self.lock:
+            try:
+                self.data.move_to_end(key)
+            except KeyError:
+                return default
+
+            return self.data[key]
+
+    def set(self, key: Hashable, value: Any) -> None:
+
+        """Store ``value``, evicting the least recently used entry if full."""
+
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+
+            if len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self) -> None:
+
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self) -> int:
+
+        return len(self.data)
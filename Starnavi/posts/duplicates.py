@@ -0,0 +1,139 @@
+"""
+duplicates.py
+
+Near-duplicate detection for comments with SimHash.
+
+A comment's signature is the 64-bit SimHash of the words and word pairs
+of its normalized text: two texts differing in a few words get
+signatures differing in a few bits. The signature is stored on
+``Comment`` split into four 16-bit bands, each indexed with
+``created_at``, and candidates are the recent comments sharing a band
+with the new one: four indexed equality lookups, whatever the size of
+the table. Only those are compared bit by bit.
+
+Signatures within a Hamming distance of 3 always share a band. Farther
+ones up to ``POSTS_DUPLICATE_MAX_DISTANCE`` are found with decreasing
+probability (about 9 in 10 at 4 bits, 6 in 10 at 6), which is enough
+for floods: every new copy is compared with all the earlier ones.
+
+Comments shorter than ``POSTS_DUPLICATE_MIN_LENGTH`` characters are not
+signed: short texts like "Great post!" are legitimately repeated.
+
+"""
+
+import hashlib
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from posts.models import Comment
+from posts.services import normalize_content
+
+
+BANDS = 4
+BAND_BITS = 64 // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+# Bit counts are summed in parallel: bit ``i`` of a feature hash is
+# spread to bit ``LANE * i`` of a big integer, so adding the spread hashes
+# counts every bit position at once in its own lane.
+LANE = 32
+LANE_MASK = (1 << LANE) - 1
+
+_SPREAD = [
+    [sum(1 << (LANE * (8 * position + bit))
+         for bit in range(8) if value >> bit & 1)
+     for value in range(256)]
+    for position in range(8)
+]
+
+
+def simhash(text: str) -> Optional[int]:
+
+    """
+
+    Return the unsigned 64-bit SimHash of ``text``, or None if the text
+    is too short to be signed.
+
+    """
+
+    normalized = normalize_content(text)
+
+    if len(normalized) < getattr(settings, "POSTS_DUPLICATE_MIN_LENGTH", 40):
+        return None
+
+    words = normalized.split()
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    total = 0
+
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+        total += (_SPREAD[0][digest[0]] + _SPREAD[1][digest[1]]
+                  + _SPREAD[2][digest[2]] + _SPREAD[3][digest[3]]
+                  + _SPREAD[4][digest[4]] + _SPREAD[5][digest[5]]
+                  + _SPREAD[6][digest[6]] + _SPREAD[7][digest[7]])
+
+    signature = 0
+
+    for bit in range(64):
+        if 2 * (total >> (LANE * bit) & LANE_MASK) > len(features):
+            signature |= 1 << bit
+
+    return signature
+
+
+def signature_fields(signature: Optional[int]) -> Dict[str, Any]:
+
+    """Return the ``Comment`` field values storing ``signature``."""
+
+    if signature is None:
+        return {}
+
+    fields: Dict[str, Any] = {
+        # Stored signed to fit a 64-bit integer column.
+        "simhash": signature - (1 << 64) if signature >> 63 else signature,
+    }
+
+    for band in range(BANDS):
+        fields[f"simhash_band{band}"] = (
+            signature >> (BAND_BITS * band) & BAND_MASK)
+
+    return fields
+
+
+def find_duplicate(signature: int) -> Optional[int]:
+
+    """
+
+    Return the id of a comment created in the last
+    ``POSTS_DUPLICATE_WINDOW`` seconds whose signature is within
+    ``POSTS_DUPLICATE_MAX_DISTANCE`` bits of ``signature``, if any.
+
+    """
+
+    fields = signature_fields(signature)
+    since = timezone.now() - timedelta(
+        seconds=getattr(settings, "POSTS_DUPLICATE_WINDOW", 24 * 60 * 60))
+    max_distance = getattr(settings, "POSTS_DUPLICATE_MAX_DISTANCE", 6)
+
+    same_band = Q()
+
+    for band in range(BANDS):
+        name = f"simhash_band{band}"
+        # Repeating the indexes' condition in every branch lets each
+        # band use its partial index.
+        same_band |= Q(**{name: fields[name], "created_at__gte": since,
+                          "simhash__isnull": False})
+
+    candidates = (Comment.all_objects.filter(same_band)
+                  .values_list("id", "simhash")
+                  [:getattr(settings, "POSTS_DUPLICATE_MAX_CANDIDATES", 200)])
+
+    for comment_id, other in candidates:
+        if ((signature ^ other) & ((1 << 64) - 1)).bit_count() <= max_distance:
+            return comment_id
+
+    return None
@@ -0,0 +1,243 @@
+"""
+idempotency.py
+
+Safe retries of create endpoints with an ``Idempotency-Key`` header.
+
+``idempotent(scope)`` records the first request a user sends with a key
+and its response. A retry with the same key and the same request gets
+that response again, marked with ``Idempotent-Replayed: true``, without
+running the view: no moderation, insert or auto-reply is repeated.
+
+* The same key with a different method, path or body is answered with
+  422, since replaying a response to another request would be wrong.
+* A retry arriving while the first request is still handled gets 409
+  and a ``Retry-After`` header. A claim left by a process that died is
+  taken over after ``POSTS_IDEMPOTENCY_LOCK_TIMEOUT`` seconds.
+* Only successful responses are kept; after any other the key is
+  released so the request can be retried.
+
+The view runs in one transaction with the recording of its response, so
+a process dying in between leaves neither its rows nor its response, and
+the retry taking over its claim creates them once.
+
+Keys are kept for ``POSTS_IDEMPOTENCY_TTL`` seconds, and
+``manage.py purge_idempotency_keys`` deletes the older ones.
+
+"""
+
+import functools
+import hashlib
+from datetime import timedelta
+from typing import Callable, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from posts.metrics import IDEMPOTENT_REPLAYS
+from posts.models import IdempotencyKey
+
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+
+def _digest(*parts: bytes) -> str:
+
+    digest = hashlib.blake2b(digest_size=16)
+
+    for part in parts:
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+
+    return digest.hexdigest()
+
+
+def claim(key: str, request_hash: str) -> Tuple[IdempotencyKey, bool]:
+
+    """
+
+    Return the record of ``key`` and whether this request claimed it and
+    must run the view.
+
+    Expired records and claims older than ``POSTS_IDEMPOTENCY_LOCK_TIMEOUT``
+    are taken over.
+
+    """
+
+    now = timezone.now()
+
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(
+                key=key, request_hash=request_hash, created_at=now), True
+    except IntegrityError:
+        pass
+
+    record = IdempotencyKey.objects.filter(key=key).first()
+
+    if record is None:
+        # Purged meanwhile.
+        return claim(key, request_hash)
+
+    ttl = getattr(settings, "POSTS_IDEMPOTENCY_TTL", 24 * 60 * 60)
+    lock_timeout = getattr(settings, "POSTS_IDEMPOTENCY_LOCK_TIMEOUT", 60)
+    expired = record.created_at < now - timedelta(seconds=ttl)
+    abandoned = (record.status_code is None
+                 and record.created_at < now - timedelta(seconds=lock_timeout))
+
+    if expired or abandoned:
+        # Only one of the requests taking it over updates the row.
+        taken = IdempotencyKey.objects.filter(
+            key=key, created_at=record.created_at,
+        ).update(request_hash=request_hash, status_code=None,
+                 response=None, created_at=now)
+
+        if taken:
+            record.request_hash, record.created_at = request_hash, now
+            record.status_code = record.response = None
+            return record, True
+
+        return claim(key, request_hash)
+
+    return record, False
+
+
+def idempotent(scope: str) -> Callable:
+
+    """
+
+    Decorator replaying the response of requests retried with the same
+    ``Idempotency-Key`` header. Requests without one are not affected.
+
+    Must be applied below ``jwt_required`` so keys are scoped to
+    ``request.user``, and to views returning JSON ``HttpResponse``\\s.
+
+    """
+
+    def decorator(func: Callable) -> Callable:
+
+        @functools.wraps(func)
+        def wrapper(request, *args, **kwargs):
+            header = request.headers.get(HEADER)
+
+            if header is None:
+                return func(request, *args, **kwargs)
+
+            if not header or len(header) > MAX_KEY_LENGTH:
+                return JsonResponse(
+                    {"error": f"{HEADER} must be 1 to {MAX_KEY_LENGTH} "
+                              f"characters."}, status=400)
+
+            key = _digest(scope.encode(), str(request.user.id).encode(),
+                          header.encode())
+            request_hash = _digest(request.method.encode(),
+                                   request.path.encode(), request.body)
+
+            record, claimed = claim(key, request_hash)
+
+            if not claimed:
+                return _existing(scope, record, request_hash)
+
+            try:
+                with transaction.atomic():
+                    response = func(request, *args, **kwargs)
+
+                    if not _store(record, response):
+                        # Taken over by a retry after the lock timeout,
+                        # which runs the view instead of this request.
+                        transaction.set_rollback(True)
+                        return _in_progress()
+            except BaseException:
+                IdempotencyKey.objects.filter(
+                    key=key, created_at=record.created_at).delete()
+                raise
+
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def _existing(scope: str,
+              record: IdempotencyKey,
+              request_hash: str,
+              ) -> HttpResponse:
+
+    """Answer a request whose key was already claimed."""
+
+    if record.request_hash != request_hash:
+        return JsonResponse(
+            {"error": f"{HEADER} was already used for another request."},
+            status=422)
+
+    if record.status_code is None:
+        return _in_progress()
+
+    IDEMPOTENT_REPLAYS.inc(scope)
+
+    response = HttpResponse(bytes(record.response),
+                            status=record.status_code,
+                            content_type="application/json")
+    response["Idempotent-Replayed"] = "true"
+
+    return response
+
+
+def _in_progress() -> JsonResponse:
+
+    response = JsonResponse(
+        {"error": f"A request with this {HEADER} is in progress."},
+        status=409)
+    response["Retry-After"] = "1"
+
+    return response
+
+
+def _store(record: IdempotencyKey,
+           response: Optional[HttpResponse],
+           ) -> bool:
+
+    """
+
+    Keep a successful response for retries, or release the key. Returns
+    False if the claim of ``record`` was taken over meanwhile.
+
+    """
+
+    claim = IdempotencyKey.objects.filter(key=record.key,
+                                          created_at=record.created_at)
+
+    if (isinstance(response, HttpResponse)
+            and 200 <= response.status_code < 300):
+        return bool(claim.update(status_code=response.status_code,
+                                 response=response.content))
+
+    return bool(claim.delete()[0])
+
+
+def purge_expired_keys(batch_size: int = 10_000) -> int:
+
+    """
+
+    Delete the records older than ``POSTS_IDEMPOTENCY_TTL`` seconds,
+    ``batch_size`` rows per DELETE, and return how many were deleted.
+
+    """
+
+    cutoff = timezone.now() - timedelta(
+        seconds=getattr(settings, "POSTS_IDEMPOTENCY_TTL", 24 * 60 * 60))
+    deleted = 0
+
+    while True:
+        keys = list(IdempotencyKey.objects
+                    .filter(created_at__lt=cutoff)
+                    .order_by("created_at")
+                    .values_list("key", flat=True)[:batch_size])
+
+        if not keys:
+            return deleted
+
+        deleted += IdempotencyKey.objects.filter(key__in=keys).delete()[0]
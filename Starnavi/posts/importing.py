@@ -0,0 +1,436 @@
+"""
+importing.py
+
+Bulk import of posts and comments from NDJSON, e.g. when migrating from
+another platform.
+
+The input uses the record format of ``posts.export``. A post record
+needs ``author_id`` and the fields of ``PostIn``; a comment record needs
+``author_id``, ``post_id`` and the fields of ``CommentIn``. ``id`` and
+``created_at`` are optional and kept when given, so comments can refer
+to posts imported from the same file. Either every post (or comment)
+record of a file has an ``id`` or none has, since explicit ids could
+collide with the ids the database assigns before its sequence is reset.
+Records failing validation, mixing in the other kind of id, or referring
+to unknown users or posts, are skipped and reported. Before each batch
+with explicit ids is written, the table's sequence is moved past them, so
+rows the API inserts meanwhile cannot take an id the batch is about to
+write; records whose id exists anyway are skipped and counted as
+collisions.
+
+Imported comments are signed for duplicate detection like API comments.
+As they may be old, trending scores are recomputed from the comments'
+ages once the import ends.
+
+Content is moderated in a pool of worker processes while the previous
+batch is written. Every batch is written in one transaction, with COPY on
+PostgreSQL and ``bulk_create`` elsewhere, together with the input's
+``ImportCheckpoint``, so an interrupted import resumes after the last
+committed batch.
+
+"""
+
+import gzip
+import json
+import multiprocessing
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import IO, Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts.duplicates import signature_fields, simhash
+from posts.models import Comment, ImportCheckpoint, Post
+from posts.schemas import CommentIn, PostIn
+from posts.services import (
+    count_new_comments, moderate_content, update_trending)
+
+
+@dataclass
+class ImportStats:
+
+    """Counts and timing of one import run."""
+
+    posts: int = 0
+    comments: int = 0
+    skipped: int = 0
+    collisions: int = 0
+    errors: List[str] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+
+        return (self.posts + self.comments) / max(self.elapsed, 1e-9)
+
+
+def parse_record(data: bytes) -> Any:
+
+    """
+
+    Build an unsaved ``Post`` or ``Comment`` from one NDJSON line.
+
+    Raises ValueError if the record is invalid.
+
+    """
+
+    record = json.loads(data)
+
+    if not isinstance(record, dict):
+        raise ValueError("record is not an object")
+
+    kind = record.get("type")
+
+    try:
+        author_id = int(record["author_id"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("author_id must be an integer")
+
+    if kind == "post":
+        payload = PostIn.model_validate(record)
+        obj = Post(
+            title=payload.title,
+            content=payload.content,
+            author_id=author_id,
+            is_blocked=bool(record.get("is_blocked", False)),
+            auto_reply_enabled=payload.auto_reply_enabled,
+            auto_reply_delay=payload.auto_reply_delay,
+            auto_reply_text=payload.auto_reply_text,
+            auto_reply_policy=payload.auto_reply_policy,
+            auto_reply_max_per_window=payload.auto_reply_max_per_window,
+            auto_reply_window=payload.auto_reply_window,
+        )
+    elif kind == "comment":
+        payload = CommentIn.model_validate(record)
+
+        try:
+            post_id = int(record["post_id"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("post_id must be an integer")
+
+        obj = Comment(post_id=post_id, author_id=author_id,
+                      content=payload.content,
+                      is_blocked=bool(record.get("is_blocked", False)),
+                      **signature_fields(simhash(payload.content)))
+    else:
+        raise ValueError(f"unknown record type {kind!r}")
+
+    if record.get("id") is not None:
+        obj.id = int(record["id"])
+
+    if record.get("created_at"):
+        created_at = parse_datetime(record["created_at"])
+
+        if created_at is None:
+            raise ValueError("created_at is not an ISO datetime")
+
+        if timezone.is_naive(created_at):
+            created_at = timezone.make_aware(created_at)
+
+        obj.created_at = created_at
+
+    return obj
+
+
+def moderate_texts(texts: List[str]) -> List[bool]:
+
+    """Moderate a chunk of texts in a worker process."""
+
+    return [moderate_content(text) for text in texts]
+
+
+def copy_rows(model: Any, objs: List[Any]) -> None:
+
+    """
+
+    Insert ``objs`` with PostgreSQL's COPY, or ``bulk_create`` on other
+    databases.
+
+    """
+
+    if connection.vendor != "postgresql":
+        model.all_objects.bulk_create(objs, batch_size=1000)
+        return
+
+    for with_pk in (True, False):
+        rows = [obj for obj in objs if (obj.pk is not None) == with_pk]
+
+        if not rows:
+            continue
+
+        fields = [f for f in model._meta.concrete_fields
+                  if with_pk or not f.primary_key]
+        columns = ", ".join(connection.ops.quote_name(f.column)
+                            for f in fields)
+        table = connection.ops.quote_name(model._meta.db_table)
+
+        with connection.cursor() as cursor:
+            with cursor.cursor.copy(
+                    f"COPY {table} ({columns}) FROM STDIN") as copy:
+                for obj in rows:
+                    copy.write_row([
+                        f.get_db_prep_save(getattr(obj, f.attname),
+                                           connection)
+                        for f in fields
+                    ])
+
+
+def reserve_ids(model: Any, objs: List[Any]) -> None:
+
+    """
+
+    Move ``model``'s sequence past the explicit ids of ``objs`` on
+    PostgreSQL, so concurrent inserts are assigned later ids. Other
+    databases assign ids above the largest existing one anyway.
+
+    """
+
+    ids = [obj.pk for obj in objs if obj.pk is not None]
+
+    if not ids or connection.vendor != "postgresql":
+        return
+
+    table = connection.ops.quote_name(model._meta.db_table)
+    pk = model._meta.pk.column
+
+    with connection.cursor() as cursor:
+        # setval() is not transactional: the sequence moves at once, even
+        # though this batch commits later.
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, %s), "
+            f"GREATEST((SELECT MAX({connection.ops.quote_name(pk)}) "
+            f"FROM {table}), %s))",
+            [model._meta.db_table, pk, max(ids)],
+        )
+
+
+def open_input(path: str) -> IO[bytes]:
+
+    """Open an NDJSON file, transparently decompressing ``.gz`` files."""
+
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+
+    return open(path, "rb")
+
+
+class Importer:
+
+    """
+    Reads, moderates and writes one NDJSON file in batches.
+
+    """
+
+    max_errors = 20
+
+    def __init__(self,
+                 path: str,
+                 name: Optional[str] = None,
+                 batch_size: int = 10_000,
+                 workers: int = 0,
+                 ) -> None:
+
+        self.path = path
+        self.name = name or path
+        self.batch_size = batch_size
+        self.workers = workers
+        self.stats = ImportStats()
+        # Whether the post and comment records of the file carry ids.
+        self.explicit_ids: Dict[type, bool] = {}
+
+    def error(self, position: int, message: str) -> None:
+
+        self.stats.skipped += 1
+
+        if len(self.stats.errors) < self.max_errors:
+            self.stats.errors.append(f"byte {position}: {message}")
+
+    def read_batches(self,
+                     stream: IO[bytes],
+                     position: int,
+                     ) -> Iterator[Tuple[List[Any], int]]:
+
+        """Yield batches of parsed records and the offset after them."""
+
+        batch: List[Any] = []
+
+        for line in stream:
+            start = position
+            position += len(line)
+
+            if not line.strip():
+                continue
+
+            try:
+                obj = parse_record(line)
+            except ValueError as e:
+                self.error(start, str(e).splitlines()[0])
+            else:
+                explicit = obj.pk is not None
+
+                if self.explicit_ids.setdefault(type(obj),
+                                                explicit) == explicit:
+                    batch.append(obj)
+                else:
+                    self.error(start, f"{obj._meta.model_name} records mix "
+                                      f"explicit and implicit ids")
+
+            if len(batch) >= self.batch_size:
+                yield batch, position
+                batch = []
+
+        yield batch, position
+
+    def new_rows(self, model: Any, objs: List[Any], position: int) -> List[Any]:
+
+        """Drop and count records whose explicit id already exists."""
+
+        reserve_ids(model, objs)
+
+        existing = set(model.all_objects.filter(
+            id__in=[obj.pk for obj in objs if obj.pk is not None]
+        ).values_list("id", flat=True))
+
+        for obj in objs:
+            if obj.pk in existing:
+                self.stats.collisions += 1
+                self.error(position, f"{model._meta.model_name} {obj.pk} "
+                                     f"already exists")
+
+        return [obj for obj in objs if obj.pk not in existing]
+
+    def write_batch(self,
+                    checkpoint: ImportCheckpoint,
+                    records: List[Any],
+                    blocked: List[bool],
+                    position: int,
+                    ) -> None:
+
+        """Write one moderated batch and advance the checkpoint."""
+
+        for obj, is_blocked in zip(records, blocked):
+            obj.is_blocked = obj.is_blocked or is_blocked
+
+        with transaction.atomic():
+            authors = set(User.objects.filter(
+                id__in={obj.author_id for obj in records}
+            ).values_list("id", flat=True))
+
+            posts = [obj for obj in records if isinstance(obj, Post)]
+            comments = [obj for obj in records if isinstance(obj, Comment)]
+
+            for obj in posts + comments:
+                if obj.author_id not in authors:
+                    self.error(position, f"unknown author {obj.author_id}")
+
+            posts = self.new_rows(Post, [obj for obj in posts
+                                         if obj.author_id in authors],
+                                  position)
+            copy_rows(Post, posts)
+
+            known_posts = set(Post.all_objects.filter(
+                id__in={obj.post_id for obj in comments}
+            ).values_list("id", flat=True))
+
+            for obj in comments:
+                if obj.author_id in authors and obj.post_id not in known_posts:
+                    self.error(position, f"unknown post {obj.post_id}")
+
+            comments = self.new_rows(Comment, [
+                obj for obj in comments
+                if obj.author_id in authors and obj.post_id in known_posts
+            ], position)
+            copy_rows(Comment, comments)
+            count_new_comments(comments)
+
+            checkpoint.position = position
+            checkpoint.save(update_fields=["position", "updated_at"])
+
+        self.stats.posts += len(posts)
+        self.stats.comments += len(comments)
+
+    def run(self, restart: bool = False) -> ImportStats:
+
+        """Import the file from its checkpoint and return the stats."""
+
+        started = time.perf_counter()
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(name=self.name)
+
+        if restart:
+            checkpoint.position = 0
+
+        pool = None
+
+        if self.workers > 1:
+            # Forked workers must not share the parent's connections.
+            connections.close_all()
+            pool = multiprocessing.get_context("fork").Pool(self.workers)
+
+        pending: Deque[Tuple[List[Any], int, Any]] = deque()
+
+        try:
+            with open_input(self.path) as stream:
+                stream.seek(checkpoint.position)
+
+                for records, position in self.read_batches(
+                        stream, checkpoint.position):
+                    # Migrated content repeats itself; moderate each text
+                    # once per batch.
+                    texts = list(dict.fromkeys(obj.content
+                                               for obj in records))
+
+                    if pool is None:
+                        pending.append((records, position,
+                                        moderate_texts(texts)))
+                    else:
+                        size = max(1, -(-len(texts) // self.workers))
+                        chunks = [texts[i:i + size]
+                                  for i in range(0, len(texts), size)]
+                        pending.append((records, position,
+                                        pool.map_async(moderate_texts,
+                                                       chunks)))
+
+                    # Keep one batch moderating while the previous is
+                    # written.
+                    if len(pending) > 1:
+                        self.flush(checkpoint, pending.popleft())
+
+                while pending:
+                    self.flush(checkpoint, pending.popleft())
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(
+                        no_style(), [Post, Comment]):
+                    cursor.execute(sql)
+
+        update_trending()
+
+        self.stats.elapsed = time.perf_counter() - started
+
+        return self.stats
+
+    def flush(self,
+              checkpoint: ImportCheckpoint,
+              item: Tuple[List[Any], int, Any],
+              ) -> None:
+
+        records, position, verdicts = item
+
+        if not isinstance(verdicts, list):
+            verdicts = [flag for chunk in verdicts.get() for flag in chunk]
+
+        texts = dict(zip(dict.fromkeys(obj.content for obj in records),
+                         verdicts))
+        blocked = [texts[obj.content] for obj in records]
+
+        self.write_batch(checkpoint, records, blocked, position)
@@ -0,0 +1,349 @@
+"""
+instrumentation.py
+
+Lightweight per-request instrumentation.
+
+``InstrumentationMiddleware`` counts and times every database query of a
+request and collects named timings (moderation, serialization) recorded
+with ``timed``. The results are emitted as a ``Server-Timing`` header and
+one structured log line per request, and requests issuing more queries
+than ``POSTS_QUERY_BUDGET`` are logged as warnings.
+
+Queries are counted by an execute wrapper kept on every connection,
+which adds to the metrics of the request in the current context. Under
+ASGI the context follows the request into the threads running its
+synchronous code, so their queries are counted too. The middleware
+serves synchronous and asynchronous requests without a thread switch.
+
+Outside of an instrumented request ``timed`` is a no-op, so services can
+use it unconditionally.
+
+"""
+
+import functools
+import json
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpRequest, HttpResponse
+
+from posts.metrics import DB_QUERIES, REQUEST_LATENCY
+
+
+logger = logging.getLogger("posts.instrumentation")
+
+
+class RequestMetrics:
+
+    """
+    Counters and timings collected while serving one request.
+
+    """
+
+    __slots__ = ("started", "queries", "db_time", "timings", "operation",
+                 "view_returned", "query_log")
+
+    def __init__(self, log_queries: bool = False) -> None:
+
+        self.started = perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.timings: Dict[str, float] = {}
+        self.operation: Optional[str] = None
+        self.view_returned: Optional[float] = None
+        self.query_log: Optional[List[Tuple[str, float]]] = (
+            [] if log_queries else None)
+
+    def add(self, name: str, seconds: float) -> None:
+
+        """Accumulate ``seconds`` under the timing ``name``."""
+
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    @property
+    def elapsed(self) -> float:
+
+        """Seconds since the request started."""
+
+        return perf_counter() - self.started
+
+
+_current: ContextVar[Optional[RequestMetrics]] = ContextVar(
+    "posts_request_metrics", default=None)
+
+
+def current_metrics() -> Optional[RequestMetrics]:
+
+    """Return the metrics of the request being served, if any."""
+
+    return _current.get()
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+
+    """
+    Add the wall time of the block to the current request's ``name`` timing.
+
+    """
+
+    metrics = _current.get()
+
+    if metrics is None:
+        yield
+        return
+
+    started = perf_counter()
+
+    try:
+        yield
+    finally:
+        metrics.add(name, perf_counter() - started)
+
+
+def count_query(execute: Callable,
+                sql: str,
+                params: Any,
+                many: bool,
+                context: Dict[str, Any],
+                ) -> Any:
+
+    """
+    Execute wrapper counting and timing the queries of the current request.
+
+    """
+
+    metrics = _current.get()
+
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    started = perf_counter()
+
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = perf_counter() - started
+        metrics.queries += 1
+        metrics.db_time += elapsed
+
+        if metrics.query_log is not None:
+            metrics.query_log.append((sql, elapsed))
+
+
+def install_query_counter(connection: Any, **kwargs: Any) -> None:
+
+    """Add ``count_query`` to the execute wrappers of ``connection``."""
+
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_query)
+
+
+# Connections opened from now on, in any thread; those of this thread
+# opened before are covered by the middleware.
+connection_created.connect(install_query_counter)
+
+
+def server_timing(metrics: RequestMetrics, total: float) -> str:
+
+    """
+    Format collected metrics as a ``Server-Timing`` header value.
+
+    """
+
+    entries = [
+        f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.queries} queries"'
+    ]
+
+    for name, seconds in metrics.timings.items():
+        entries.append(f"{name};dur={seconds * 1000:.2f}")
+
+    entries.append(f"total;dur={total * 1000:.2f}")
+
+    return ", ".join(entries)
+
+
+class InstrumentationMiddleware:
+
+    """
+    Middleware recording query counts and timings for every request.
+
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable) -> None:
+
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> Any:
+
+        if self.is_async:
+            return self.acall(request)
+
+        for connection in connections.all():
+            install_query_counter(connection)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        return self.finish(request, response, metrics)
+
+    async def acall(self, request: HttpRequest) -> HttpResponse:
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        return self.finish(request, response, metrics)
+
+    def finish(self,
+               request: HttpRequest,
+               response: HttpResponse,
+               metrics: RequestMetrics,
+               ) -> HttpResponse:
+
+        """Record, report and log the metrics of a served request."""
+
+        total = metrics.elapsed
+        operation = metrics.operation or "unmatched"
+
+        REQUEST_LATENCY.observe(total, operation, request.method)
+        DB_QUERIES.inc(operation, amount=metrics.queries)
+
+        if getattr(settings, "POSTS_SERVER_TIMING", True):
+            response["Server-Timing"] = server_timing(metrics, total)
+
+        self.log(request, response, metrics, total)
+
+        return response
+
+    def log(self,
+            request: HttpRequest,
+            response: HttpResponse,
+            metrics: RequestMetrics,
+            total: float,
+            ) -> None:
+
+        """Emit one structured log line for the request."""
+
+        budget = getattr(settings, "POSTS_QUERY_BUDGET", None)
+        over_budget = budget is not None and metrics.queries > budget
+
+        if not over_budget and not logger.isEnabledFor(logging.INFO):
+            return
+
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "operation": metrics.operation,
+            "status": response.status_code,
+            "queries": metrics.queries,
+            "db_ms": round(metrics.db_time * 1000, 2),
+            "total_ms": round(total * 1000, 2),
+            **{f"{name}_ms": round(seconds * 1000, 2)
+               for name, seconds in metrics.timings.items()},
+        }
+
+        if over_budget:
+            record["query_budget"] = budget
+            logger.warning(json.dumps(record))
+        else:
+            logger.info(json.dumps(record))
+
+
+def instrument_api(api: Any) -> None:
+
+    """
+    Hook every operation of a ``NinjaAPI``.
+
+    The hook records the operation name. For synchronous operations it
+    also attributes the time between the view returning and Ninja
+    producing the response (response validation and rendering) to the
+    ``serialization`` timing. Every router attached to ``api`` so far is
+    hooked, nested ones included, so call it once all routers are added.
+
+    """
+
+    for _, router in api._routers:
+        for path_view in router.path_operations.values():
+            for operation in path_view.operations:
+                if operation.is_async:
+                    _instrument_async_operation(operation)
+                else:
+                    _instrument_operation(operation)
+
+
+def _instrument_async_operation(operation: Any) -> None:
+
+    run = operation.run
+    name = operation.view_func.__name__
+
+    @functools.wraps(run)
+    async def instrumented_run(request: HttpRequest, *args: Any,
+                               **kwargs: Any) -> HttpResponse:
+        metrics = _current.get()
+
+        if metrics is not None:
+            metrics.operation = name
+
+        return await run(request, *args, **kwargs)
+
+    operation.run = instrumented_run
+
+
+def _instrument_operation(operation: Any) -> None:
+
+    view_func = operation.view_func
+    run = operation.run
+    name = view_func.__name__
+
+    @functools.wraps(view_func)
+    def instrumented_view(request: HttpRequest, **kwargs: Any) -> Any:
+        try:
+            return view_func(request, **kwargs)
+        finally:
+            metrics = _current.get()
+            if metrics is not None:
+                metrics.view_returned = perf_counter()
+
+    @functools.wraps(run)
+    def instrumented_run(request: HttpRequest, *args: Any,
+                         **kwargs: Any) -> HttpResponse:
+        metrics = _current.get()
+
+        if metrics is None:
+            return run(request, *args, **kwargs)
+
+        metrics.operation = name
+        response = run(request, *args, **kwargs)
+
+        if metrics.view_returned is not None:
+            metrics.add("serialization", perf_counter() - metrics.view_returned)
+            metrics.view_returned = None
+
+        return response
+
+    operation.view_func = instrumented_view
+    operation.run = instrumented_run
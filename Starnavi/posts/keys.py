@@ -0,0 +1,214 @@
+"""
+keys.py
+
+The keyset signing and verifying JWTs.
+
+``POSTS_JWT_KEYS`` lists the keys, or names a JSON file listing them, as
+dicts with a ``kid``, an ``alg`` (``HS256``, ``RS256`` or ``EdDSA``) and
+the key material:
+
+* ``secret`` for HS256;
+* ``public_key`` (PEM) for RS256 and EdDSA, plus ``private_key`` (PEM) on
+  the services that sign tokens.
+
+Tokens are signed with the key named by ``POSTS_JWT_SIGNING_KID`` and
+carry its ``kid`` in their header; they are verified with the key of that
+``kid`` and only with its algorithm. Keys are parsed once per process and
+the prepared key objects reused for every token.
+
+Rotation without logging anyone out: add the new key and deploy, switch
+``POSTS_JWT_SIGNING_KID`` to it, and remove the old key once the tokens it
+signed have expired. The implicit ``default`` key (HS256 with the
+``SECRET_KEY``) stays in the keyset next to ``POSTS_JWT_KEYS``, verifying
+the tokens issued before the first rollout, until
+``POSTS_JWT_RETIRE_DEFAULT_KEY`` retires it.
+
+Other services verify tokens with the public keys of
+``GET /api/jwks.json`` instead of sharing a secret. The asymmetric
+algorithms need the ``cryptography`` package.
+
+"""
+
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import jwt
+from jwt.algorithms import get_default_algorithms
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+ALGORITHMS = ("HS256", "RS256", "EdDSA")
+
+
+@dataclass(frozen=True)
+class Key:
+
+    """A prepared key of the keyset."""
+
+    kid: str
+    alg: str
+    signing_key: Any
+    verifying_key: Any
+
+
+class KeySet:
+
+    """
+    Keys by ``kid``, with the one used for signing.
+
+    """
+
+    def __init__(self, entries: List[Dict[str, str]], signing_kid: str) -> None:
+
+        algorithms = get_default_algorithms()
+        self.keys: Dict[str, Key] = {}
+
+        for entry in entries:
+            kid, alg = entry.get("kid"), entry.get("alg", "HS256")
+
+            if not kid:
+                raise ImproperlyConfigured("Every JWT key needs a kid.")
+
+            if alg not in ALGORITHMS:
+                raise ImproperlyConfigured(
+                    f"JWT key {kid!r} has unsupported alg {alg!r}; "
+                    f"use one of {', '.join(ALGORITHMS)}.")
+
+            if alg not in algorithms:
+                raise ImproperlyConfigured(
+                    f"JWT key {kid!r} uses {alg}, which needs the "
+                    f"cryptography package.")
+
+            algorithm = algorithms[alg]
+
+            if alg == "HS256":
+                secret = algorithm.prepare_key(entry["secret"])
+                signing_key = verifying_key = secret
+            else:
+                verifying_key = algorithm.prepare_key(entry["public_key"])
+                signing_key = (algorithm.prepare_key(entry["private_key"])
+                               if entry.get("private_key") else None)
+
+            self.keys[kid] = Key(kid, alg, signing_key, verifying_key)
+
+        self.signing = self.keys.get(signing_kid)
+
+        if self.signing is None or self.signing.signing_key is None:
+            raise ImproperlyConfigured(
+                f"POSTS_JWT_SIGNING_KID {signing_kid!r} is not a key of "
+                f"POSTS_JWT_KEYS with private key material.")
+
+    def sign(self, payload: Dict[str, Any]) -> str:
+
+        """Sign ``payload`` with the signing key."""
+
+        return jwt.encode(payload, self.signing.signing_key,
+                          algorithm=self.signing.alg,
+                          headers={"kid": self.signing.kid})
+
+    def verify(self, token: str) -> Dict[str, Any]:
+
+        """
+
+        Return the payload of ``token`` after checking its signature with
+        the key named in its header and its expiry.
+
+        Tokens without a ``kid`` are checked with the ``default`` key, or
+        the signing key once it is retired, so tokens issued before
+        keysets were introduced remain valid.
+
+        Raises ``jwt.InvalidTokenError`` (or a subclass) if the token is
+        invalid.
+
+        """
+
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = (self.keys.get("default", self.signing) if kid is None
+               else self.keys.get(kid))
+
+        if key is None:
+            raise jwt.InvalidKeyError(f"Unknown key {kid!r}")
+
+        return jwt.decode(token, key.verifying_key, algorithms=[key.alg])
+
+    def public_jwks(self) -> Dict[str, List[Dict[str, Any]]]:
+
+        """Return the asymmetric verification keys as a JWK Set."""
+
+        algorithms = get_default_algorithms()
+        keys = []
+
+        for key in self.keys.values():
+            if key.alg == "HS256":
+                continue
+
+            jwk = algorithms[key.alg].to_jwk(key.verifying_key, as_dict=True)
+            jwk.update(kid=key.kid, alg=key.alg, use="sig")
+            keys.append(jwk)
+
+        return {"keys": keys}
+
+
+_keyset: Optional[KeySet] = None
+_lock = threading.Lock()
+
+
+def configured_keys() -> List[Dict[str, str]]:
+
+    """
+
+    Return the entries of ``POSTS_JWT_KEYS``, a list or the path of a
+    JSON file holding one, and the ``default`` HS256 key with the
+    ``SECRET_KEY`` unless they redefine it or
+    ``POSTS_JWT_RETIRE_DEFAULT_KEY`` is set.
+
+    """
+
+    keys = getattr(settings, "POSTS_JWT_KEYS", None) or []
+
+    if isinstance(keys, (str, os.PathLike)):
+        with open(keys) as f:
+            keys = json.load(f)
+
+    if (getattr(settings, "POSTS_JWT_RETIRE_DEFAULT_KEY", False)
+            or any(entry.get("kid") == "default" for entry in keys)):
+        return keys
+
+    return [*keys, {"kid": "default", "alg": "HS256",
+                    "secret": settings.SECRET_KEY}]
+
+
+def get_keyset() -> KeySet:
+
+    """Return the keyset of this process, loading it on first use."""
+
+    global _keyset
+
+    if _keyset is None:
+        with _lock:
+            if _keyset is None:
+                _keyset = KeySet(
+                    configured_keys(),
+                    getattr(settings, "POSTS_JWT_SIGNING_KID", None)
+                    or "default")
+
+    return _keyset
+
+
+@receiver(setting_changed)
+def reset_keyset(*, setting: str, **kwargs: Any) -> None:
+
+    """Reload the keyset when tests change its settings."""
+
+    global _keyset
+
+    if setting in ("POSTS_JWT_KEYS", "POSTS_JWT_SIGNING_KID",
+                   "POSTS_JWT_RETIRE_DEFAULT_KEY", "SECRET_KEY"):
+        _keyset = None
@@ -0,0 +1,419 @@
+"""
+loadtest.py
+
+A small, stdlib-only load harness for the posts API.
+
+Scenarios are described relative to the API root, so the same run can be
+driven in-process through the Ninja ``TestClient`` or over HTTP against a
+live server. Every endpoint in ``posts/views.py`` gets a scenario, except
+the comment stream whose response never ends, and the report contains
+p50/p95/p99 latency and throughput for each of them. Staff-only endpoints
+answer 403 unless the load-test user is staff.
+
+Every scenario runs as one user, so rate limits would mostly measure the
+limiter: in-process runs lift ``POSTS_RATE_LIMITS`` unless asked not to,
+and 429 responses are counted apart from errors either way.
+
+"""
+
+import json
+import math
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+
+@dataclass
+class Scenario:
+
+    """
+    A single endpoint exercised by the harness.
+
+    ``build`` returns the path (relative to the API root), the query
+    parameters and the JSON body for one request.
+
+    """
+
+    name: str
+    method: str
+    build: Callable[[int], Tuple[str, Optional[dict], Optional[dict]]]
+    expected_status: Tuple[int, ...] = (200, 201)
+
+
+# Staff-only endpoints, answered with 403 to other users.
+STAFF_ONLY = (200, 403)
+
+
+@dataclass
+class ScenarioResult:
+
+    """Latencies, error and rate-limited counts collected for one scenario."""
+
+    name: str
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+    rate_limited: int = 0
+    elapsed: float = 0.0
+
+    def percentile(self, pct: float) -> float:
+
+        """Return the nearest-rank percentile latency in milliseconds."""
+
+        return percentile(self.latencies, pct) * 1000
+
+    @property
+    def throughput(self) -> float:
+
+        """Requests per second over the scenario's wall-clock time."""
+
+        return len(self.latencies) / self.elapsed if self.elapsed else 0.0
+
+
+def percentile(values: List[float], pct: float) -> float:
+
+    """
+    Return the nearest-rank percentile of ``values``.
+
+    """
+
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+
+    return ordered[rank - 1]
+
+
+class NinjaClientDriver:
+
+    """
+    Send requests in-process through ``ninja.testing.TestClient``.
+
+    The API's URL patterns are taken directly rather than through
+    ``api.urls``, which refuses to register the same API twice when the
+    project URLconf has already been loaded.
+
+    ``POSTS_RATE_LIMITS`` is lifted during runs unless ``rate_limits``
+    is set.
+
+    """
+
+    def __init__(self, rate_limits: bool = False) -> None:
+
+        from ninja.testing import TestClient
+
+        from posts.views import api
+
+        class APIClient(TestClient):
+
+            @property
+            def urls(self) -> list:
+                if not hasattr(self, "_urls_cache"):
+                    self._urls_cache = api._get_urls()
+                return self._urls_cache
+
+        self.client = APIClient(api)
+        self.rate_limits = rate_limits
+
+    def overrides(self) -> Any:
+
+        """Return the settings to run the scenarios under."""
+
+        from django.test import override_settings
+
+        if self.rate_limits:
+            return nullcontext()
+
+        return override_settings(POSTS_RATE_LIMITS={})
+
+    def request(self,
+                method: str,
+                path: str,
+                params: Optional[dict] = None,
+                body: Optional[dict] = None,
+                headers: Optional[Dict[str, str]] = None,
+                ) -> Tuple[int, Any]:
+
+        if params:
+            path = f"{path}?{urlencode(params)}"
+
+        response = self.client.request(method, path, json=body,
+                                       headers=headers or {})
+
+        return response.status_code, _json_or_none(response.content)
+
+
+class HttpDriver:
+
+    """
+    Send requests over HTTP to a live server using ``urllib``.
+
+    """
+
+    def __init__(self, base_url: str, timeout: float = 30.0) -> None:
+
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def overrides(self) -> Any:
+
+        """The server's settings are its own."""
+
+        return nullcontext()
+
+    def request(self,
+                method: str,
+                path: str,
+                params: Optional[dict] = None,
+                body: Optional[dict] = None,
+                headers: Optional[Dict[str, str]] = None,
+                ) -> Tuple[int, Any]:
+
+        url = self.base_url + path
+
+        if params:
+            url = f"{url}?{urlencode(params)}"
+
+        data = json.dumps(body).encode() if body is not None else None
+        request = Request(url, data=data, method=method,
+                          headers={"Content-Type": "application/json",
+                                   **(headers or {})})
+
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                return response.status, _json_or_none(response.read())
+
+        except HTTPError as e:
+            return e.code, _json_or_none(e.read())
+
+
+def _json_or_none(content: bytes) -> Any:
+
+    try:
+        return json.loads(content)
+    except ValueError:
+        return None
+
+
+def authenticate(driver: Any, username: str, password: str) -> str:
+
+    """
+    Register the load-test user if needed and return a JWT for it.
+
+    """
+
+    driver.request("POST", "/register/", body={
+        "username": username,
+        "password": password,
+        "email": f"{username}@example.com",
+    })
+
+    status, data = driver.request("POST", "/login/", body={
+        "username": username,
+        "password": password,
+    })
+
+    if status != 200 or not data or "token" not in data:
+        raise RuntimeError(f"Could not log in as {username!r}: {data!r}")
+
+    return data["token"]
+
+
+def build_scenarios(driver: Any,
+                    headers: Dict[str, str],
+                    username: str,
+                    password: str,
+                    ) -> List[Scenario]:
+
+    """
+    Create one scenario per API endpoint.
+
+    A target post and comment are created up front so comment and like
+    scenarios have somewhere to write to, and an author to follow is
+    registered.
+
+    """
+
+    status, data = driver.request("POST", "/posts/", body={
+        "title": "Load test",
+        "content": "Target post for the load harness.",
+    }, headers=headers)
+
+    if status != 201:
+        raise RuntimeError(f"Could not create target post: {data!r}")
+
+    post_id = data["id"]
+    run_id = uuid.uuid4().hex[:8]
+
+    status, data = driver.request("POST", f"/posts/{post_id}/comments/",
+                                  body={"content": "Target comment."},
+                                  headers=headers)
+
+    if status != 201:
+        raise RuntimeError(f"Could not create target comment: {data!r}")
+
+    comment_id = data["id"]
+
+    status, data = driver.request("POST", "/register/", body={
+        "username": f"load_{run_id}_author",
+        "password": "password123",
+        "email": f"load_{run_id}_author@example.com",
+    })
+
+    if status != 201:
+        raise RuntimeError(f"Could not register an author: {data!r}")
+
+    author_id = data["id"]
+
+    return [
+        Scenario("register", "POST", lambda i: ("/register/", None, {
+            "username": f"load_{run_id}_{i}",
+            "password": "password123",
+            "email": f"load_{run_id}_{i}@example.com",
+        })),
+        Scenario("login", "POST", lambda i: ("/login/", None, {
+            "username": username,
+            "password": password,
+        })),
+        Scenario("create_post", "POST", lambda i: ("/posts/", None, {
+            "title": f"Load post {i}",
+            "content": "Generated by the load harness.",
+        })),
+        Scenario("list_posts", "GET", lambda i: ("/posts/", None, None)),
+        Scenario("create_comment", "POST", lambda i: (
+            f"/posts/{post_id}/comments/", None,
+            {"content": f"Load comment {i}"})),
+        Scenario("list_comments", "GET", lambda i: (
+            f"/posts/{post_id}/comments/", None, None)),
+        Scenario("comments_daily_breakdown", "GET", lambda i: (
+            "/comments-daily-breakdown/",
+            {"date_from": "2024-01-01", "date_to": "2100-01-01"}, None)),
+        Scenario("get_post", "GET", lambda i: (
+            f"/posts/{post_id}/", None, None)),
+        Scenario("list_trending_posts", "GET", lambda i: (
+            "/posts/trending/", None, None)),
+        Scenario("post_comment_counts", "GET", lambda i: (
+            "/posts/comment-counts/", {"ids": post_id}, None)),
+        Scenario("like_post", "POST", lambda i: (
+            f"/posts/{post_id}/like/", None, None)),
+        Scenario("unlike_post", "DELETE", lambda i: (
+            f"/posts/{post_id}/like/", None, None)),
+        Scenario("like_comment", "POST", lambda i: (
+            f"/comments/{comment_id}/like/", None, None)),
+        Scenario("unlike_comment", "DELETE", lambda i: (
+            f"/comments/{comment_id}/like/", None, None)),
+        Scenario("list_reactions", "GET", lambda i: (
+            "/reactions/", {"target": "posts", "ids": post_id}, None)),
+        Scenario("follow", "POST", lambda i: (
+            f"/users/{author_id}/follow/", None, None)),
+        Scenario("unfollow", "DELETE", lambda i: (
+            f"/users/{author_id}/follow/", None, None)),
+        Scenario("feed", "GET", lambda i: ("/feed/", None, None)),
+        Scenario("notifications", "GET", lambda i: (
+            "/notifications/", None, None)),
+        Scenario("read_notifications", "POST", lambda i: (
+            "/notifications/read/", None, None)),
+        Scenario("jwks", "GET", lambda i: ("/jwks.json", None, None)),
+        Scenario("metrics", "GET", lambda i: ("/metrics", None, None),
+                 STAFF_ONLY),
+        Scenario("list_profiles", "GET", lambda i: (
+            "/profiles/", None, None), STAFF_ONLY),
+        Scenario("blocked_content", "GET", lambda i: (
+            "/moderation/blocked/", None, None), STAFF_ONLY),
+        Scenario("export", "GET", lambda i: ("/export/", None, None),
+                 STAFF_ONLY),
+    ]
+
+
+def run_scenario(driver: Any,
+                 scenario: Scenario,
+                 headers: Dict[str, str],
+                 requests: int,
+                 concurrency: int,
+                 ) -> ScenarioResult:
+
+    """
+    Fire ``requests`` requests for one scenario and collect latencies.
+
+    With a concurrency of 1 the requests run inline in the calling thread.
+
+    """
+
+    result = ScenarioResult(scenario.name)
+
+    def fire(i: int) -> Tuple[float, int]:
+        path, params, body = scenario.build(i)
+        started = time.perf_counter()
+        status, _ = driver.request(scenario.method, path, params, body,
+                                   headers)
+        return time.perf_counter() - started, status
+
+    started = time.perf_counter()
+
+    if concurrency <= 1:
+        outcomes = [fire(i) for i in range(requests)]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(fire, range(requests)))
+
+    result.elapsed = time.perf_counter() - started
+
+    for latency, status in outcomes:
+        result.latencies.append(latency)
+        if status == 429:
+            result.rate_limited += 1
+        elif status not in scenario.expected_status:
+            result.errors += 1
+
+    return result
+
+
+def run_load_test(driver: Any,
+                  requests: int = 100,
+                  concurrency: int = 1,
+                  username: str = "loadtest",
+                  password: str = "password123",
+                  only: Optional[List[str]] = None,
+                  ) -> List[ScenarioResult]:
+
+    """
+    Run every scenario (or the ones named in ``only``) against ``driver``.
+
+    """
+
+    with driver.overrides():
+        token = authenticate(driver, username, password)
+        headers = {"Authorization": f"Bearer {token}"}
+
+        return [
+            run_scenario(driver, scenario, headers, requests, concurrency)
+            for scenario in build_scenarios(driver, headers, username,
+                                            password)
+            if not only or scenario.name in only
+        ]
+
+
+def format_report(results: List[ScenarioResult]) -> str:
+
+    """Render scenario results as a fixed-width table."""
+
+    lines = [
+        f"{'endpoint':<26}{'reqs':>7}{'errors':>8}{'429':>6}{'p50 ms':>9}"
+        f"{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}"
+    ]
+
+    for result in results:
+        lines.append(
+            f"{result.name:<26}{len(result.latencies):>7}{result.errors:>8}"
+            f"{result.rate_limited:>6}{result.percentile(50):>9.2f}{result.percentile(95):>9.2f}"
+            f"{result.percentile(99):>9.2f}{result.throughput:>9.1f}"
+        )
+
+    return "\n".join(lines)
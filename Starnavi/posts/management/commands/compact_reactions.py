@@ -0,0 +1,44 @@
+"""
+compact_reactions.py
+
+Management command folding the sharded reaction counts of every post and
+comment into one row with ``posts.reactions.compact_reaction_counts``,
+after deleting the reactions of deleted posts and comments. Meant to run
+periodically, e.g. hourly from cron.
+
+"""
+
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.reactions import compact_reaction_counts
+
+
+class Command(BaseCommand):
+
+    """
+    Fold the ``ReactionCount`` slots of each target into one.
+
+    """
+
+    help = "Fold the sharded reaction counts of each target into one row."
+
+    def add_arguments(self, parser):
+
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="Targets compacted per transaction.")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        started = time.perf_counter()
+        count = compact_reaction_counts(batch_size=options["batch_size"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Compacted the reaction counts of {count} targets in "
+            f"{time.perf_counter() - started:.2f}s."
+        ))
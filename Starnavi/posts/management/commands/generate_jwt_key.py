@@ -0,0 +1,66 @@
+"""
+generate_jwt_key.py
+
+Management command generating a key for ``POSTS_JWT_KEYS``.
+
+"""
+
+import json
+import secrets
+from datetime import date
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+
+    """
+    Print a new JWT key as a ``POSTS_JWT_KEYS`` entry.
+
+    """
+
+    help = "Generate a JWT signing key and print it as a POSTS_JWT_KEYS entry."
+
+    def add_arguments(self, parser):
+
+        parser.add_argument("--alg", choices=["EdDSA", "RS256", "HS256"],
+                            default="EdDSA")
+        parser.add_argument("--kid",
+                            help="Key id; defaults to the algorithm and "
+                                 "today's date.")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        alg = options["alg"]
+        entry = {"kid": options["kid"] or f"{alg.lower()}-{date.today()}",
+                 "alg": alg}
+
+        if alg == "HS256":
+            entry["secret"] = secrets.token_urlsafe(64)
+        else:
+            try:
+                from cryptography.hazmat.primitives import serialization
+                from cryptography.hazmat.primitives.asymmetric import (
+                    ed25519, rsa)
+            except ImportError:
+                raise CommandError(f"{alg} keys need the cryptography "
+                                   f"package.")
+
+            if alg == "EdDSA":
+                private = ed25519.Ed25519PrivateKey.generate()
+            else:
+                private = rsa.generate_private_key(public_exponent=65537,
+                                                   key_size=2048)
+
+            entry["private_key"] = private.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            ).decode()
+            entry["public_key"] = private.public_key().public_bytes(
+                serialization.Encoding.PEM,
+                serialization.PublicFormat.SubjectPublicKeyInfo,
+            ).decode()
+
+        self.stdout.write(json.dumps(entry, indent=2))
@@ -0,0 +1,63 @@
+"""
+import_content.py
+
+Management command bulk-loading posts and comments from an NDJSON file
+with ``posts.importing``.
+
+"""
+
+import os
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.importing import Importer
+
+
+class Command(BaseCommand):
+
+    """
+    Validate, moderate and load an NDJSON file of posts and comments.
+
+    """
+
+    help = "Import posts and comments from an NDJSON (or .ndjson.gz) file."
+
+    def add_arguments(self, parser):
+
+        parser.add_argument("path")
+        parser.add_argument("--batch-size", type=int, default=10_000,
+                            help="Records written per transaction.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                            help="Moderation processes; 0 or 1 moderates "
+                                 "in this process.")
+        parser.add_argument("--name",
+                            help="Checkpoint name; defaults to the path.")
+        parser.add_argument("--restart", action="store_true",
+                            help="Ignore the checkpoint and start over.")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        path = options["path"]
+
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist.")
+
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        importer = Importer(path,
+                            name=options["name"] or os.path.abspath(path),
+                            batch_size=options["batch_size"],
+                            workers=options["workers"] or 0)
+        stats = importer.run(restart=options["restart"])
+
+        for error in stats.errors:
+            self.stderr.write(f"Skipped record at {error}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats.posts} posts and {stats.comments} comments "
+            f"in {stats.elapsed:.2f}s ({stats.rows_per_second:.0f} rows/s), "
+            f"skipped {stats.skipped} records "
+            f"({stats.collisions} with existing ids)."
+        ))
@@ -0,0 +1,60 @@
+"""
+load_test.py
+
+Management command that runs the stdlib load harness in ``posts.loadtest``
+against the in-process Ninja test client or a live server.
+
+"""
+
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from posts.loadtest import (
+    HttpDriver, NinjaClientDriver, format_report, run_load_test)
+
+
+class Command(BaseCommand):
+
+    """
+    Drive every API endpoint and report latency percentiles and req/s.
+
+    """
+
+    help = "Run a load test against every endpoint of the posts API."
+
+    def add_arguments(self, parser):
+
+        parser.add_argument("--base-url",
+                            help="API root of a live server, e.g. "
+                                 "http://localhost:8000/api. When omitted "
+                                 "the Ninja test client is used.")
+        parser.add_argument("--requests", type=int, default=200,
+                            help="Requests per endpoint.")
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument("--username", default="loadtest")
+        parser.add_argument("--password", default="password123")
+        parser.add_argument("--only", nargs="*",
+                            help="Restrict the run to these endpoints.")
+        parser.add_argument("--rate-limits", action="store_true",
+                            help="Keep POSTS_RATE_LIMITS for in-process "
+                                 "runs. 429 responses are reported apart "
+                                 "from errors.")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        if options["base_url"]:
+            driver = HttpDriver(options["base_url"])
+        else:
+            driver = NinjaClientDriver(rate_limits=options["rate_limits"])
+
+        results = run_load_test(
+            driver,
+            requests=options["requests"],
+            concurrency=options["concurrency"],
+            username=options["username"],
+            password=options["password"],
+            only=options["only"],
+        )
+
+        self.stdout.write(format_report(results))
@@ -0,0 +1,43 @@
+"""
+purge_idempotency_keys.py
+
+Management command deleting the ``Idempotency-Key`` records older than
+``POSTS_IDEMPOTENCY_TTL`` with ``posts.idempotency.purge_expired_keys``.
+Meant to run periodically, e.g. hourly from cron.
+
+"""
+
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+
+    """
+    Delete expired ``IdempotencyKey`` rows.
+
+    """
+
+    help = "Delete the stored responses of expired idempotency keys."
+
+    def add_arguments(self, parser):
+
+        parser.add_argument("--batch-size", type=int, default=10_000,
+                            help="Rows deleted per DELETE.")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        started = time.perf_counter()
+        count = purge_expired_keys(batch_size=options["batch_size"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Purged {count} idempotency keys in "
+            f"{time.perf_counter() - started:.2f}s."
+        ))
@@ -0,0 +1,256 @@
+"""
+seed_data.py
+
+Management command that fills the database with synthetic users, posts
+and comments so that production-scale behaviour can be reproduced locally.
+
+Authors and commenters follow a Zipf-like distribution and the number of
+comments per post is heavy-tailed, so a few "viral" posts collect most of
+the traffic, as they do in production.
+
+"""
+
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate
+from typing import Any, Iterator, List, Sequence, Tuple
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from posts.duplicates import signature_fields, simhash
+from posts.models import Post, Comment
+from posts.services import recount_comments, update_trending
+
+
+WORDS = (
+    "django ninja api post comment reply thread feed user author story "
+    "today great news update release review question answer idea project "
+    "python database index query cache latency worker queue scale load "
+    "test data model schema token profile follow share like view trend"
+).split()
+
+PROFANE_WORDS = ("damn", "crap", "shit")
+
+
+def zipf_cum_weights(size: int, exponent: float) -> List[float]:
+
+    """
+    Return cumulative weights of a Zipf distribution over ``size`` ranks.
+
+    """
+
+    return list(accumulate(1.0 / (rank ** exponent)
+                           for rank in range(1, size + 1)))
+
+
+def make_text(rng: random.Random, min_words: int, max_words: int) -> str:
+
+    """Build a sentence of random vocabulary words."""
+
+    return " ".join(rng.choices(WORDS, k=rng.randint(min_words, max_words)))
+
+
+def batched(items: Iterator[Any], size: int) -> Iterator[List[Any]]:
+
+    """Yield lists of at most ``size`` items from an iterator."""
+
+    batch = []
+
+    for item in items:
+        batch.append(item)
+
+        if len(batch) >= size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+class Command(BaseCommand):
+
+    """
+    Generate deterministic, skewed synthetic data in large batches.
+
+    """
+
+    help = "Seed the database with synthetic users, posts and comments."
+
+    def add_arguments(self, parser):
+
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--posts", type=int, default=1000)
+        parser.add_argument("--comments-per-post", type=float, default=10,
+                            help="Average number of comments per post.")
+        parser.add_argument("--seed", type=int, default=42,
+                            help="Random seed; equal seeds give equal data.")
+        parser.add_argument("--days", type=int, default=30,
+                            help="Spread creation dates over this many days.")
+        parser.add_argument("--skew", type=float, default=1.1,
+                            help="Zipf exponent for author popularity.")
+        parser.add_argument("--blocked-ratio", type=float, default=0.02)
+        parser.add_argument("--auto-reply-ratio", type=float, default=0.05)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--password", default="password123")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        if options["users"] < 1:
+            raise CommandError("--users must be at least 1.")
+
+        rng = random.Random(options["seed"])
+        batch_size = options["batch_size"]
+        now = timezone.now()
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            user_ids = self.create_users(options, batch_size)
+            posts = self.create_posts(rng, options, user_ids, now, batch_size)
+            comments = self.create_comments(rng, options, user_ids, posts,
+                                            now, batch_size)
+
+            if posts:
+                recount_comments(Post.all_objects.filter(
+                    id__range=(posts[0][0], posts[-1][0])))
+
+            # Bulk inserts bypass the trending contribution of comments.
+            update_trending()
+
+        elapsed = time.perf_counter() - started
+        total = len(user_ids) + len(posts) + comments
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(user_ids)} users, {len(posts)} posts and "
+            f"{comments} comments in {elapsed:.2f}s "
+            f"({total / max(elapsed, 1e-9):.0f} rows/s)."
+        ))
+
+    def create_users(self, options: dict, batch_size: int) -> List[int]:
+
+        """Create seed users, sharing one password hash between them."""
+
+        prefix = f"seed{options['seed']}_"
+
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f"Users with prefix '{prefix}' already exist; "
+                "pass a different --seed."
+            )
+
+        password = make_password(options["password"])
+
+        users = (
+            User(username=f"{prefix}{i}",
+                 email=f"{prefix}{i}@example.com",
+                 password=password)
+            for i in range(options["users"])
+        )
+
+        for batch in batched(users, batch_size):
+            User.objects.bulk_create(batch)
+
+        return list(User.objects.filter(username__startswith=prefix)
+                    .order_by("id").values_list("id", flat=True))
+
+    def create_posts(self,
+                     rng: random.Random,
+                     options: dict,
+                     user_ids: Sequence[int],
+                     now: Any,
+                     batch_size: int,
+                     ) -> List[Tuple[int, Any]]:
+
+        """Create posts with Zipf-distributed authors."""
+
+        cum_weights = zipf_cum_weights(len(user_ids), options["skew"])
+        span = timedelta(days=options["days"]).total_seconds()
+
+        def generate() -> Iterator[Post]:
+            for _ in range(options["posts"]):
+                is_blocked = rng.random() < options["blocked_ratio"]
+                auto_reply = rng.random() < options["auto_reply_ratio"]
+                content = make_text(rng, 10, 80)
+
+                if is_blocked:
+                    content += " " + rng.choice(PROFANE_WORDS)
+
+                yield Post(
+                    title=make_text(rng, 2, 8).capitalize(),
+                    content=content,
+                    author_id=rng.choices(user_ids, cum_weights=cum_weights)[0],
+                    created_at=now - timedelta(seconds=rng.random() * span),
+                    is_blocked=is_blocked,
+                    auto_reply_enabled=auto_reply,
+                    auto_reply_delay=rng.randint(0, 60) if auto_reply else 0,
+                    auto_reply_text="Thanks for your comment!" if auto_reply else "",
+                )
+
+        posts = []
+
+        for batch in batched(generate(), batch_size):
+            Post.objects.bulk_create(batch)
+            posts.extend((post.id, post.created_at) for post in batch)
+
+        return posts
+
+    def create_comments(self,
+                        rng: random.Random,
+                        options: dict,
+                        user_ids: Sequence[int],
+                        posts: Sequence[Tuple[int, Any]],
+                        now: Any,
+                        batch_size: int,
+                        ) -> int:
+
+        """
+        Create comments with a heavy-tailed number of comments per post.
+
+        The per-post count is drawn from a Pareto distribution scaled so
+        that its mean matches ``--comments-per-post``. Comments are signed
+        for duplicate detection like API comments.
+
+        """
+
+        mean = options["comments_per_post"]
+        alpha = 1.5
+        scale = mean * (alpha - 1) / alpha
+        cum_weights = zipf_cum_weights(len(user_ids), options["skew"])
+
+        def generate() -> Iterator[Comment]:
+            for post_id, post_created_at in posts:
+                if mean <= 0:
+                    return
+
+                count = int(scale * rng.paretovariate(alpha))
+                age = (now - post_created_at).total_seconds()
+
+                for _ in range(count):
+                    is_blocked = rng.random() < options["blocked_ratio"]
+                    content = make_text(rng, 3, 30)
+
+                    if is_blocked:
+                        content += " " + rng.choice(PROFANE_WORDS)
+
+                    yield Comment(
+                        post_id=post_id,
+                        author_id=rng.choices(user_ids,
+                                              cum_weights=cum_weights)[0],
+                        content=content,
+                        created_at=post_created_at + timedelta(
+                            seconds=age * rng.random() ** 3),
+                        is_blocked=is_blocked,
+                        **signature_fields(simhash(content)),
+                    )
+
+        created = 0
+
+        for batch in batched(generate(), batch_size):
+            Comment.objects.bulk_create(batch)
+            created += len(batch)
+
+        return created
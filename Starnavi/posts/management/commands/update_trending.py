@@ -0,0 +1,43 @@
+"""
+update_trending.py
+
+Management command recomputing the trending scores of posts with
+``posts.services.update_trending``. Meant to run periodically, e.g.
+every 10 minutes from cron.
+
+"""
+
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.services import update_trending
+
+
+class Command(BaseCommand):
+
+    """
+    Recompute ``Post.trending_score`` from recent comments.
+
+    """
+
+    help = "Recompute the trending scores of posts from recent comments."
+
+    def add_arguments(self, parser):
+
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="Posts written per UPDATE.")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        started = time.perf_counter()
+        count = update_trending(batch_size=options["batch_size"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Scored {count} trending posts in "
+            f"{time.perf_counter() - started:.2f}s."
+        ))
@@ -0,0 +1,462 @@
+"""
+metrics.py
+
+Prometheus-compatible metrics without a client library or external service.
+
+Every process keeps its samples in memory. When ``POSTS_METRICS_DIR`` is
+set, each process also writes a snapshot of its samples to
+``<dir>/<pid>.json`` (at most once per ``POSTS_METRICS_FLUSH_INTERVAL``
+seconds), and ``render`` sums the snapshots of the workers still alive. A
+process removes its file at exit, and ``render`` removes the files of
+processes killed without exiting, so the directory does not grow with
+worker restarts and a recycled pid does not inherit an old process's
+samples. Like any restarted Prometheus target, counters drop when a worker
+exits; ``rate()`` and ``increase()`` handle the reset. Without a directory
+only the current process is reported.
+
+"""
+
+import atexit
+import json
+import os
+import threading
+from bisect import bisect_left
+from time import monotonic
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+
+Labels = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0)
+
+
+class Metric:
+
+    """
+    Base class of a named metric with a fixed set of label names.
+
+    """
+
+    kind = ""
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 labelnames: Iterable[str] = (),
+                 ) -> None:
+
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.samples: Dict[Labels, Any] = {}
+        REGISTRY.register(self)
+
+    def _check(self, labels: Labels) -> None:
+
+        if len(labels) != len(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {self.labelnames}, got {labels}")
+
+
+class Counter(Metric):
+
+    """A monotonically increasing value."""
+
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+
+        self._check(labels)
+
+        with REGISTRY.lock:
+            self.samples[labels] = self.samples.get(labels, 0.0) + amount
+
+        REGISTRY.maybe_flush()
+
+
+class Gauge(Metric):
+
+    """A value that can go up and down."""
+
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+
+        self._check(labels)
+
+        with REGISTRY.lock:
+            self.samples[labels] = float(value)
+
+        REGISTRY.maybe_flush()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+
+        self._check(labels)
+
+        with REGISTRY.lock:
+            self.samples[labels] = self.samples.get(labels, 0.0) + amount
+
+        REGISTRY.maybe_flush()
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+
+    """
+    Observations counted into cumulative buckets.
+
+    Samples are stored as ``[bucket counts..., sum, count]`` with
+    non-cumulative bucket counts; the last bucket is ``+Inf``.
+
+    """
+
+    kind = "histogram"
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS,
+                 ) -> None:
+
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value: float, *labels: str) -> None:
+
+        self._check(labels)
+        index = bisect_left(self.buckets, value)
+
+        with REGISTRY.lock:
+            sample = self.samples.get(labels)
+
+            if sample is None:
+                sample = [0] * (len(self.buckets) + 1) + [0.0, 0]
+                self.samples[labels] = sample
+
+            sample[index] += 1
+            sample[-2] += value
+            sample[-1] += 1
+
+        REGISTRY.maybe_flush()
+
+
+class Registry:
+
+    """
+    Holds every metric of the process and its file-backed snapshot.
+
+    """
+
+    def __init__(self) -> None:
+
+        self.metrics: Dict[str, Metric] = {}
+        self.lock = threading.Lock()
+        self.last_flush = 0.0
+
+    def register(self, metric: Metric) -> None:
+
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered.")
+
+        self.metrics[metric.name] = metric
+
+    @property
+    def directory(self) -> Optional[str]:
+
+        return getattr(settings, "POSTS_METRICS_DIR", None)
+
+    def maybe_flush(self) -> None:
+
+        """Write a snapshot if the flush interval has elapsed."""
+
+        if not self.directory:
+            return
+
+        interval = getattr(settings, "POSTS_METRICS_FLUSH_INTERVAL", 1.0)
+
+        if monotonic() - self.last_flush >= interval:
+            self.flush()
+
+    def snapshot(self) -> Dict[str, List[List[Any]]]:
+
+        """Return a JSON-serializable copy of this process's samples."""
+
+        with self.lock:
+            return {
+                name: [[list(labels), value]
+                       for labels, value in metric.samples.items()]
+                for name, metric in self.metrics.items()
+            }
+
+    def flush(self) -> None:
+
+        """Atomically write this process's snapshot to the metrics dir."""
+
+        directory = self.directory
+
+        if not directory:
+            return
+
+        self.last_flush = monotonic()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+
+        with open(tmp_path, "w") as f:
+            json.dump(self.snapshot(), f)
+
+        os.replace(tmp_path, path)
+
+    def remove(self) -> None:
+
+        """Remove this process's snapshot, e.g. when it exits."""
+
+        directory = self.directory
+
+        if not directory:
+            return
+
+        try:
+            os.remove(os.path.join(directory, f"{os.getpid()}.json"))
+        except FileNotFoundError:
+            pass
+
+    def collect(self) -> Dict[str, Dict[Labels, Any]]:
+
+        """
+        Merge the snapshots of every known process into one sample set.
+
+        """
+
+        if not self.directory:
+            snapshots = [self.snapshot()]
+        else:
+            self.flush()
+            snapshots = list(self._read_snapshots())
+
+        merged: Dict[str, Dict[Labels, Any]] = {
+            name: {} for name in self.metrics}
+
+        for snapshot in snapshots:
+            for name, samples in snapshot.items():
+                metric = self.metrics.get(name)
+
+                if metric is None:
+                    continue
+
+                target = merged[name]
+
+                for labels, value in samples:
+                    labels = tuple(labels)
+                    current = target.get(labels)
+
+                    if current is None:
+                        target[labels] = (list(value)
+                                          if isinstance(value, list) else value)
+                    elif isinstance(value, list):
+                        target[labels] = [a + b for a, b in zip(current, value)]
+                    else:
+                        target[labels] = current + value
+
+        return merged
+
+    def _read_snapshots(self) -> Iterable[Dict[str, Any]]:
+
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json"):
+                continue
+
+            path = os.path.join(self.directory, filename)
+
+            try:
+                pid = int(filename[:-len(".json")])
+
+                if not _pid_alive(pid):
+                    os.remove(path)
+                    continue
+
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (ValueError, OSError):
+                continue
+
+            yield snapshot
+
+    def render(self) -> str:
+
+        """Render all metrics in the Prometheus text exposition format."""
+
+        lines = []
+
+        for name, samples in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+
+            for labels, value in sorted(samples.items()):
+                pairs = list(zip(metric.labelnames, labels))
+
+                if metric.kind != "histogram":
+                    lines.append(f"{name}{_labels(pairs)} {_number(value)}")
+                    continue
+
+                cumulative = 0
+
+                for bound, count in zip(metric.buckets + (float("inf"),),
+                                        value):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _number(bound)
+                    lines.append(f"{name}_bucket{_labels(pairs + [('le', le)])}"
+                                 f" {cumulative}")
+
+                lines.append(f"{name}_sum{_labels(pairs)} {_number(value[-2])}")
+                lines.append(f"{name}_count{_labels(pairs)} {value[-1]}")
+
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+
+        """Clear every sample of this process (used by tests)."""
+
+        with self.lock:
+            for metric in self.metrics.values():
+                metric.samples.clear()
+
+
+def _pid_alive(pid: int) -> bool:
+
+    if pid == os.getpid():
+        return True
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
+
+
+def _escape(value: str) -> str:
+
+    return (value.replace("\\", "\\\\")
+            .replace('"', '\\"')
+            .replace("\n", "\\n"))
+
+
+def _labels(pairs: List[Tuple[str, str]]) -> str:
+
+    if not pairs:
+        return ""
+
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"'
+                          for key, value in pairs) + "}"
+
+
+def _number(value: float) -> str:
+
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+REGISTRY = Registry()
+
+atexit.register(REGISTRY.remove)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+REQUEST_LATENCY = Histogram(
+    "posts_request_duration_seconds",
+    "Request latency per API operation.",
+    ("operation", "method"),
+)
+
+DB_QUERIES = Counter(
+    "posts_db_queries_total",
+    "Database queries issued per API operation.",
+    ("operation",),
+)
+
+MODERATION_BLOCKS = Counter(
+    "posts_moderation_blocks_total",
+    "Posts and comments blocked by content moderation.",
+    ("kind",),
+)
+
+JWT_FAILURES = Counter(
+    "posts_jwt_failures_total",
+    "Requests rejected by JWT authentication.",
+    ("reason",),
+)
+
+AUTO_REPLY_QUEUE_DEPTH = Gauge(
+    "posts_auto_reply_queue_depth",
+    "Auto-replies scheduled but not yet sent.",
+)
+
+AUTO_REPLY_LAG = Histogram(
+    "posts_auto_reply_lag_seconds",
+    "Delay between an auto-reply's due time and it being sent.",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 60.0),
+)
+
+BACKGROUND_QUEUE_DEPTH = Gauge(
+    "posts_background_queue_depth",
+    "Items waiting in an in-process background worker.",
+    ("worker",),
+)
+
+BACKGROUND_DROPPED = Counter(
+    "posts_background_dropped_total",
+    "Items rejected because an in-process background queue was full.",
+    ("worker",),
+)
+
+MODERATION_CACHE_REQUESTS = Counter(
+    "posts_moderation_cache_requests_total",
+    "Moderation verdict lookups by result (local_hit, shared_hit, miss).",
+    ("result",),
+)
+
+MODERATION_CACHE_SIZE = Gauge(
+    "posts_moderation_cache_entries",
+    "Moderation verdicts held in this process's cache.",
+)
+
+DUPLICATE_COMMENTS = Counter(
+    "posts_duplicate_comments_total",
+    "Comments detected as near-duplicates of recent ones, by action taken.",
+    ("action",),
+)
+
+RATE_LIMITED = Counter(
+    "posts_rate_limited_total",
+    "Requests rejected with 429 by rate limiting, by scope.",
+    ("scope",),
+)
+
+STREAM_SUBSCRIBERS = Gauge(
+    "posts_stream_subscribers",
+    "Comment streams open in this process.",
+)
+
+STREAM_CLOSED = Counter(
+    "posts_stream_closed_total",
+    "Comment streams refused (full) or dropped for falling behind (overflow).",
+    ("reason",),
+)
+
+IDEMPOTENT_REPLAYS = Counter(
+    "posts_idempotent_replays_total",
+    "Retried requests answered with the response stored for their "
+    "Idempotency-Key, by scope.",
+    ("scope",),
+)
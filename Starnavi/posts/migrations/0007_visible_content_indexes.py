@@ -0,0 +1,27 @@
+# Generated by Django 5.1.2 on 2026-10-19 03:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_post_filter_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_blocked', False)), fields=['post', 'created_at', 'id'], name='comment_visible_post_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_blocked', True)), fields=['-created_at', '-id'], name='comment_blocked_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_blocked', True)), fields=['-created_at', '-id'], name='post_blocked_idx'),
+        ),
+    ]
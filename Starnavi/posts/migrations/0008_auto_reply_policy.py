@@ -0,0 +1,45 @@
+# Generated by Django 5.1.2 on 2026-10-19 03:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_visible_content_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='auto_reply_max_per_window',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='auto_reply_policy',
+            field=models.CharField(choices=[('every', 'Every comment'), ('per_commenter', 'First comment of each commenter'), ('coalesce', 'One reply per burst mentioning its commenters')], default='every', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='auto_reply_window',
+            field=models.PositiveIntegerField(default=3600),
+        ),
+        migrations.CreateModel(
+            name='AutoReplyLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('commenter', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('post', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='auto_reply_logs', to='posts.post')),
+                ('reply', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.comment')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['post', 'commenter'], name='autoreply_post_commenter_idx'), models.Index(fields=['post', '-created_at'], name='autoreply_post_recent_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.1.2 on 2026-10-19 03:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_import_checkpoint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='is_duplicate',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='simhash',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='simhash_band0',
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='simhash_band1',
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='simhash_band2',
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='simhash_band3',
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('simhash__isnull', False)), fields=['simhash_band0', 'created_at'], name='comment_simhash_band0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('simhash__isnull', False)), fields=['simhash_band1', 'created_at'], name='comment_simhash_band1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('simhash__isnull', False)), fields=['simhash_band2', 'created_at'], name='comment_simhash_band2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('simhash__isnull', False)), fields=['simhash_band3', 'created_at'], name='comment_simhash_band3_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.2 on 2026-10-19 05:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_post_trending_score'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_blocked', True)), fields=['post', 'is_blocked'], name='comment_blocked_post_idx'),
+        ),
+    ]
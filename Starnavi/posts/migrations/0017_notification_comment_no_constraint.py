@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-19 04:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='comment',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='posts.comment'),
+        ),
+    ]
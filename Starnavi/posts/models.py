@@ -1,5 +1,34 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+
+class VisibleManager(models.Manager):
+
+    """
+    Default manager that hides content blocked by moderation.
+
+    Moderation tooling reads blocked rows through ``all_objects``.
+
+    """
+
+    def get_queryset(self):
+
+        """Return only rows that passed moderation."""
+
+        return super().get_queryset().filter(is_blocked=False)
+
+
+class AutoReplyPolicy(models.TextChoices):
+
+    """
+    Which comments on a post receive an automatic reply.
+
+    """
+
+    EVERY = 'every', 'Every comment'
+    PER_COMMENTER = 'per_commenter', 'First comment of each commenter'
+    COALESCE = 'coalesce', 'One reply per burst mentioning its commenters'
 
 
 class Post(models.Model):
@@ -11,12 +40,61 @@ class Post(models.Model):
 
     title = models.CharField(max_length=255)
     content = models.TextField()
-    author = models.ForeignKey(User, on_delete=models.CASCADE)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Looked up through ``post_author_idx``, which starts with the author.
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               db_index=False)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     is_blocked = models.BooleanField(default=False)
     auto_reply_enabled = models.BooleanField(default=False)
     auto_reply_delay = models.IntegerField(default=0)
     auto_reply_text = models.TextField(blank=True, null=True)
+    auto_reply_policy = models.CharField(max_length=16,
+                                         choices=AutoReplyPolicy.choices,
+                                         default=AutoReplyPolicy.EVERY)
+    # At most this many replies per ``auto_reply_window`` seconds; 0 means
+    # no limit.
+    auto_reply_max_per_window = models.PositiveIntegerField(default=0)
+    auto_reply_window = models.PositiveIntegerField(default=3600)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    # Flushed from the per-process buffers of ``posts.services.POST_VIEWS``.
+    view_count = models.PositiveBigIntegerField(default=0, editable=False)
+    # Comments weighted by age, see ``posts.services.update_trending``.
+    trending_score = models.FloatField(default=0, editable=False)
+
+    objects = VisibleManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        # Listings of the default manager read the visible partial
+        # indexes; staff listings including blocked posts the full ones.
+        indexes = [
+            models.Index(fields=['-created_at'],
+                         name='post_newest_idx'),
+            models.Index(fields=['-created_at'],
+                         condition=models.Q(is_blocked=False),
+                         name='post_visible_newest_idx'),
+            models.Index(fields=['author', '-created_at'],
+                         name='post_author_idx'),
+            models.Index(fields=['author', '-created_at'],
+                         condition=models.Q(is_blocked=False),
+                         name='post_visible_author_idx'),
+            models.Index(fields=['-comment_count', '-created_at'],
+                         name='post_commented_idx'),
+            models.Index(fields=['-comment_count', '-created_at'],
+                         condition=models.Q(is_blocked=False),
+                         name='post_visible_commented_idx'),
+            models.Index(fields=['-created_at', '-id'],
+                         condition=models.Q(is_blocked=True),
+                         name='post_blocked_idx'),
+            models.Index(fields=['-view_count', '-created_at'],
+                         name='post_viewed_idx'),
+            models.Index(fields=['-view_count', '-created_at'],
+                         condition=models.Q(is_blocked=False),
+                         name='post_visible_viewed_idx'),
+            models.Index(fields=['-trending_score', '-created_at'],
+                         condition=models.Q(is_blocked=False),
+                         name='post_trending_idx'),
+        ]
 
     def __str__(self):
 
@@ -38,5 +116,287 @@ class Comment(models.Model):
 
     content = models.TextField()
     author = models.ForeignKey(User, on_delete=models.CASCADE)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     is_blocked = models.BooleanField(default=False)
+
+    # SimHash of the content and its four 16-bit bands, see
+    # posts.duplicates. Null for comments too short to be signed.
+    simhash = models.BigIntegerField(null=True, editable=False)
+    simhash_band0 = models.IntegerField(null=True, editable=False)
+    simhash_band1 = models.IntegerField(null=True, editable=False)
+    simhash_band2 = models.IntegerField(null=True, editable=False)
+    simhash_band3 = models.IntegerField(null=True, editable=False)
+    is_duplicate = models.BooleanField(default=False)
+
+    objects = VisibleManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created_at', 'id'],
+                         condition=models.Q(is_blocked=False),
+                         name='comment_visible_post_idx'),
+            models.Index(fields=['-created_at', '-id'],
+                         condition=models.Q(is_blocked=True),
+                         name='comment_blocked_idx'),
+            # is_blocked lets SQLite count from the index alone too.
+            models.Index(fields=['post', 'is_blocked'],
+                         condition=models.Q(is_blocked=True),
+                         name='comment_blocked_post_idx'),
+        ] + [
+            models.Index(fields=[f'simhash_band{band}', 'created_at'],
+                         condition=models.Q(simhash__isnull=False),
+                         name=f'comment_simhash_band{band}_idx')
+            for band in range(4)
+        ]
+
+
+class AutoReplyLog(models.Model):
+
+    """
+    A commenter answered by an automatic reply on a post.
+
+    Looked up to enforce a post's auto-reply policy: who has already been
+    answered and how many replies were sent in the current window.
+
+    """
+
+    post = models.ForeignKey(Post, related_name='auto_reply_logs',
+                             on_delete=models.CASCADE, db_index=False)
+
+    commenter = models.ForeignKey(User, related_name='+',
+                                  on_delete=models.CASCADE, db_index=False)
+
+    reply = models.ForeignKey(Comment, related_name='+',
+                              on_delete=models.CASCADE)
+
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'commenter'],
+                         name='autoreply_post_commenter_idx'),
+            models.Index(fields=['post', '-created_at'],
+                         name='autoreply_post_recent_idx'),
+        ]
+
+
+class Follow(models.Model):
+
+    """
+    Model representing a user following an author.
+
+    """
+
+    follower = models.ForeignKey(User, related_name='following',
+                                 on_delete=models.CASCADE)
+
+    author = models.ForeignKey(User, related_name='followers',
+                               on_delete=models.CASCADE)
+
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['follower', 'author'],
+                                    name='unique_follow'),
+        ]
+
+
+class FollowerCount(models.Model):
+
+    """
+    Denormalized number of followers of an author.
+
+    Used to decide between fan-out-on-write and fan-out-on-read without
+    counting ``Follow`` rows.
+
+    """
+
+    author = models.OneToOneField(User, primary_key=True,
+                                  related_name='follower_count',
+                                  on_delete=models.CASCADE)
+
+    count = models.PositiveIntegerField(default=0)
+
+
+class FeedEntry(models.Model):
+
+    """
+    A post delivered to a follower's home feed timeline.
+
+    ``author`` and ``created_at`` are copied from the post so the feed can
+    be paginated and pruned without joining ``Post``.
+
+    """
+
+    user = models.ForeignKey(User, related_name='feed_entries',
+                             on_delete=models.CASCADE, db_index=False)
+
+    post = models.ForeignKey(Post, related_name='feed_entries',
+                             on_delete=models.CASCADE)
+
+    author = models.ForeignKey(User, related_name='+',
+                               on_delete=models.CASCADE, db_index=False)
+
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_feed_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'],
+                         name='feed_user_timeline_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='feed_user_author_idx'),
+        ]
+
+
+class ImportCheckpoint(models.Model):
+
+    """
+    Progress of a bulk import, advanced in the transaction of every batch.
+
+    ``position`` is the byte offset in the input file after the last
+    committed record, so an interrupted import can resume from it.
+
+    """
+
+    name = models.CharField(max_length=255, unique=True)
+    position = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class ReactionTarget(models.TextChoices):
+
+    """What a reaction is on."""
+
+    POST = 'post', 'Post'
+    COMMENT = 'comment', 'Comment'
+
+
+class Reaction(models.Model):
+
+    """
+    A user's like of a post or a comment.
+
+    """
+
+    user = models.ForeignKey(User, related_name='reactions',
+                             on_delete=models.CASCADE)
+
+    target_type = models.CharField(max_length=7,
+                                   choices=ReactionTarget.choices)
+    target_id = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'target_type', 'target_id'],
+                name='unique_reaction'),
+        ]
+
+
+class ReactionCount(models.Model):
+
+    """
+    One slot of the sharded reaction count of a target.
+
+    A reaction adds to a random one of ``POSTS_REACTION_SHARDS`` slots, so
+    concurrent likes of a popular post rarely wait on the same row lock.
+    The count is the sum of the slots, which ``compact_reaction_counts``
+    folds back into one row.
+
+    """
+
+    target_type = models.CharField(max_length=7,
+                                   choices=ReactionTarget.choices)
+    target_id = models.PositiveBigIntegerField()
+    shard = models.PositiveSmallIntegerField()
+    # Slots may go negative when reactions are removed from another slot.
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['target_type', 'target_id', 'shard'],
+                name='unique_reaction_count_shard'),
+        ]
+
+
+class NotificationKind(models.TextChoices):
+
+    """What a notification is about."""
+
+    COMMENT = 'comment', 'New comments on your post'
+    REPLY = 'reply', 'Replies to your comments'
+
+
+class Notification(models.Model):
+
+    """
+    A digest of the comments of one kind on one post for a user.
+
+    Comments arriving while the digest is unread and younger than
+    ``POSTS_NOTIFICATION_DIGEST_WINDOW`` seconds are collapsed into it:
+    ``count`` grows and ``actor``, ``comment`` and ``updated_at`` follow
+    the latest one.
+
+    """
+
+    recipient = models.ForeignKey(User, related_name='notifications',
+                                  on_delete=models.CASCADE)
+    post = models.ForeignKey(Post, related_name='+',
+                             on_delete=models.CASCADE)
+    kind = models.CharField(max_length=7, choices=NotificationKind.choices)
+
+    actor = models.ForeignKey(User, related_name='+', null=True,
+                              on_delete=models.SET_NULL)
+    # Not a constraint: SET_NULL would update the digests of every
+    # comment of a deleted post or user in one statement, past the
+    # database's parameter limit. The id may point to a deleted comment.
+    comment = models.ForeignKey(Comment, related_name='+', null=True,
+                                on_delete=models.DO_NOTHING,
+                                db_constraint=False)
+    count = models.PositiveIntegerField(default=1)
+
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    updated_at = models.DateTimeField(default=timezone.now)
+    read_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['recipient', '-updated_at', '-id'],
+                         name='notification_inbox_idx'),
+            # Open digests, also counted for the unread count.
+            models.Index(fields=['recipient', 'post', 'kind'],
+                         condition=models.Q(read_at__isnull=True),
+                         name='notification_unread_idx'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+
+    """
+    The response of a request made with an ``Idempotency-Key`` header.
+
+    Keyed by a digest of the user, endpoint and key so rows stay small
+    whatever keys clients send. ``status_code`` is null while the first
+    request is being handled.
+
+    """
+
+    key = models.CharField(max_length=32, primary_key=True)
+    request_hash = models.CharField(max_length=32)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.BinaryField(null=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'],
+                         name='idempotency_created_idx'),
+        ]
@@ -0,0 +1,359 @@
+"""
+profiling.py
+
+Opt-in profiling of sampled and slow requests.
+
+When ``POSTS_PROFILING_ENABLED`` is set, ``ProfilingMiddleware`` profiles
+requests in two ways:
+
+* a random ``POSTS_PROFILING_SAMPLE_RATE`` fraction of requests runs under
+  ``cProfile``;
+* every other request is registered with a background ``StackSampler``,
+  which periodically samples the stacks of requests that have been running
+  longer than ``POSTS_PROFILING_SLOW_MS``.
+
+Profiles are kept, together with the route and the request's query log,
+in a per-process ring buffer of ``POSTS_PROFILING_BUFFER_SIZE`` entries
+that staff can read from ``GET /api/profiles/``.
+
+For requests that are neither sampled nor slow the cost is a random
+number, two dictionary operations and a few timer reads. ``cProfile``
+and ``pstats`` are only imported once a request is sampled.
+
+Both profilers watch one thread. Under ASGI, profiled requests therefore
+continue from a thread that also runs their synchronous view; with
+profiling disabled, asynchronous requests pass through without a thread
+switch.
+
+"""
+
+import itertools
+import random
+import sys
+import threading
+from collections import deque
+from time import perf_counter, sleep
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from asgiref.sync import (
+    async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async)
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.utils import timezone
+
+from posts.instrumentation import RequestMetrics, current_metrics
+
+
+_ids = itertools.count(1)
+
+_profiles: Deque[Dict[str, Any]] = deque(maxlen=50)
+
+_cprofile_lock = threading.Lock()
+
+
+def recent_profiles() -> List[Dict[str, Any]]:
+
+    """Return the buffered profiles of this process, newest first."""
+
+    return list(reversed(_profiles))
+
+
+def clear_profiles() -> None:
+
+    """Empty the ring buffer."""
+
+    _profiles.clear()
+
+
+def _frame_label(code: Any) -> str:
+
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+class StackSampler:
+
+    """
+    Background thread sampling the stacks of long-running requests.
+
+    Requests are tracked by thread id. The sampler only inspects threads
+    whose request has been running for longer than the slow threshold.
+    For every function on a sampled stack it counts the samples it
+    appeared in and the samples in which it was the innermost frame.
+
+    """
+
+    def __init__(self, interval: float, threshold: float) -> None:
+
+        self.interval = interval
+        self.threshold = threshold
+        self.active: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+
+    def start(self) -> None:
+
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name="posts-stack-sampler", daemon=True)
+                self.thread.start()
+
+    def track(self) -> Dict[str, Tuple[int, int]]:
+
+        """Start tracking the calling thread; return its sample table."""
+
+        samples: Dict[str, Tuple[int, int]] = {}
+        self.active[threading.get_ident()] = (perf_counter(), samples)
+
+        return samples
+
+    def untrack(self) -> None:
+
+        self.active.pop(threading.get_ident(), None)
+
+    def run(self) -> None:
+
+        while True:
+            sleep(self.interval)
+
+            if not self.active:
+                continue
+
+            now = perf_counter()
+            frames = sys._current_frames()
+
+            for ident, (started, samples) in list(self.active.items()):
+                frame = frames.get(ident)
+
+                if frame is None or now - started < self.threshold:
+                    continue
+
+                seen = set()
+                leaf = True
+
+                while frame is not None:
+                    label = _frame_label(frame.f_code)
+
+                    if label not in seen:
+                        seen.add(label)
+                        total, own = samples.get(label, (0, 0))
+                        samples[label] = (total + 1, own + leaf)
+
+                    frame = frame.f_back
+                    leaf = False
+
+                total, _ = samples.get("<samples>", (0, 0))
+                samples["<samples>"] = (total + 1, 0)
+
+
+_sampler: Optional[StackSampler] = None
+
+
+def get_sampler() -> StackSampler:
+
+    """Return the process-wide sampler, starting it on first use."""
+
+    global _sampler
+
+    interval = getattr(settings, "POSTS_PROFILING_INTERVAL_MS", 10) / 1000
+    threshold = getattr(settings, "POSTS_PROFILING_SLOW_MS", 1000) / 1000
+
+    if _sampler is None:
+        _sampler = StackSampler(interval, threshold)
+    else:
+        _sampler.interval, _sampler.threshold = interval, threshold
+
+    _sampler.start()
+
+    return _sampler
+
+
+def _cprofile_frames(profiler: Any, limit: int) -> List[Dict[str, Any]]:
+
+    import pstats
+
+    stats = pstats.Stats(profiler)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3],
+                  reverse=True)
+
+    return [
+        {
+            "frame": f"{name} ({filename}:{line})",
+            "calls": ncalls,
+            "self_ms": round(tottime * 1000, 3),
+            "cumulative_ms": round(cumtime * 1000, 3),
+        }
+        for (filename, line, name), (_, ncalls, tottime, cumtime, _)
+        in rows[:limit]
+    ]
+
+
+def _sampled_frames(samples: Dict[str, Tuple[int, int]],
+                    limit: int,
+                    ) -> List[Dict[str, Any]]:
+
+    """
+    Rank sampled functions by the samples spent in their own code.
+
+    """
+
+    count = samples.pop("<samples>", (0, 0))[0]
+    ranked = sorted(samples.items(),
+                    key=lambda item: (item[1][1], item[1][0]), reverse=True)
+
+    return [
+        {"frame": label, "samples": total, "self_samples": own,
+         "self_percent": round(100 * own / count, 1) if count else 0.0}
+        for label, (total, own) in ranked[:limit]
+    ]
+
+
+def _store(request: HttpRequest,
+           response: HttpResponse,
+           metrics: Optional[RequestMetrics],
+           mode: str,
+           duration: float,
+           frames: List[Dict[str, Any]],
+           ) -> None:
+
+    queries = metrics.query_log if metrics and metrics.query_log else []
+    max_queries = getattr(settings, "POSTS_PROFILING_MAX_QUERIES", 100)
+
+    size = getattr(settings, "POSTS_PROFILING_BUFFER_SIZE", 50)
+
+    if _profiles.maxlen != size:
+        _resize(size)
+
+    _profiles.append({
+        "id": next(_ids),
+        "timestamp": timezone.now().isoformat(),
+        "mode": mode,
+        "method": request.method,
+        "path": request.path,
+        "operation": metrics.operation if metrics else None,
+        "status": response.status_code,
+        "duration_ms": round(duration * 1000, 2),
+        "query_count": len(queries),
+        "queries": [{"sql": sql, "ms": round(seconds * 1000, 3)}
+                    for sql, seconds in queries[:max_queries]],
+        "frames": frames,
+    })
+
+
+def _resize(size: int) -> None:
+
+    global _profiles
+
+    _profiles = deque(_profiles, maxlen=size)
+
+
+class ProfilingMiddleware:
+
+    """
+    Middleware profiling sampled and slow requests.
+
+    Place it after ``InstrumentationMiddleware`` so the query log of the
+    request is available.
+
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable) -> None:
+
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        self.sync_get_response = get_response
+
+        if self.is_async:
+            markcoroutinefunction(self)
+            # Called from a worker thread, the rest of the chain runs its
+            # thread-sensitive code, the synchronous view, in that thread.
+            self.sync_get_response = async_to_sync(get_response)
+
+    def __call__(self, request: HttpRequest) -> Any:
+
+        if self.is_async:
+            return self.acall(request)
+
+        if not getattr(settings, "POSTS_PROFILING_ENABLED", False):
+            return self.get_response(request)
+
+        return self.handle(request)
+
+    async def acall(self, request: HttpRequest) -> HttpResponse:
+
+        if not getattr(settings, "POSTS_PROFILING_ENABLED", False):
+            return await self.get_response(request)
+
+        return await sync_to_async(self.handle)(request)
+
+    def handle(self, request: HttpRequest) -> HttpResponse:
+
+        """Profile the request, sampled or watched for slowness."""
+
+        metrics = current_metrics()
+
+        if metrics is not None and metrics.query_log is None:
+            metrics.query_log = []
+
+        rate = getattr(settings, "POSTS_PROFILING_SAMPLE_RATE", 0.0)
+
+        if rate and random.random() < rate and _cprofile_lock.acquire(False):
+            return self.profile(request, metrics)
+
+        return self.watch(request, metrics)
+
+    def profile(self,
+                request: HttpRequest,
+                metrics: Optional[RequestMetrics],
+                ) -> HttpResponse:
+
+        """Run the request under cProfile."""
+
+        import cProfile
+
+        profiler = cProfile.Profile()
+        started = perf_counter()
+
+        try:
+            profiler.enable()
+
+            try:
+                response = self.sync_get_response(request)
+            finally:
+                profiler.disable()
+        finally:
+            _cprofile_lock.release()
+
+        limit = getattr(settings, "POSTS_PROFILING_TOP_FRAMES", 25)
+        _store(request, response, metrics, "sampled",
+               perf_counter() - started, _cprofile_frames(profiler, limit))
+
+        return response
+
+    def watch(self,
+              request: HttpRequest,
+              metrics: Optional[RequestMetrics],
+              ) -> HttpResponse:
+
+        """Run the request under the stack sampler's watch."""
+
+        sampler = get_sampler()
+        samples = sampler.track()
+        started = perf_counter()
+
+        try:
+            response = self.sync_get_response(request)
+        finally:
+            sampler.untrack()
+
+        duration = perf_counter() - started
+
+        if duration >= sampler.threshold:
+            limit = getattr(settings, "POSTS_PROFILING_TOP_FRAMES", 25)
+            _store(request, response, metrics, "slow", duration,
+                   _sampled_frames(samples, limit))
+
+        return response
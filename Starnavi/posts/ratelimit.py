@@ -0,0 +1,220 @@
+"""
+ratelimit.py
+
+Per-user rate limiting of endpoints.
+
+``rate_limit(scope)`` limits every user to the rate configured for
+``scope`` in ``POSTS_RATE_LIMITS``, e.g. ``"30/m"`` for 30 requests per
+minute, and answers requests over it with 429 and a ``Retry-After``
+header. Scopes without a rate are not limited.
+
+Two backends are available, chosen with ``POSTS_RATE_LIMIT_BACKEND``:
+
+``memory``
+    The generic cell rate algorithm (GCRA) in this process: one float per
+    user and scope, the time the next request is theoretically due.
+    Exact and allocation-free, but every worker enforces its own limit.
+
+``cache``
+    A sliding window counter in the ``POSTS_RATE_LIMIT_CACHE_ALIAS``
+    cache, shared by every worker using it. The count of the current
+    fixed window is added to the previous window's, weighted by how much
+    of it the sliding window still covers.
+
+"""
+
+import functools
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+from posts.metrics import RATE_LIMITED
+
+
+PERIODS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+
+
+@functools.lru_cache(maxsize=None)
+def parse_rate(rate: str) -> Tuple[int, int]:
+
+    """
+
+    Parse a rate like ``"30/m"`` or ``"1000/h"`` into the number of
+    requests and the period in seconds.
+
+    Raises ValueError if the rate is invalid.
+
+    """
+
+    try:
+        count, period = rate.split("/")
+        count, period = int(count), PERIODS[period]
+    except (KeyError, ValueError):
+        raise ValueError(f"invalid rate {rate!r}, expected e.g. '30/m'")
+
+    if count < 1:
+        raise ValueError(f"invalid rate {rate!r}, expected e.g. '30/m'")
+
+    return count, period
+
+
+class MemoryRateLimiter:
+
+    """
+    GCRA rate limiter keeping its state in this process.
+
+    """
+
+    def __init__(self, max_keys: int = 100_000) -> None:
+
+        self.max_keys = max_keys
+        self.due: Dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def hit(self, key: str, limit: int, period: int) -> float:
+
+        """
+
+        Record a request for ``key`` if it is within ``limit`` requests
+        per ``period`` seconds. Return 0 if it is, or the seconds until
+        it would be.
+
+        """
+
+        now = time.monotonic()
+        interval = period / limit
+
+        with self.lock:
+            due = max(self.due.get(key, now), now) + interval
+            wait = due - period - now
+
+            if wait > 0:
+                return wait
+
+            if key not in self.due and len(self.due) >= self.max_keys:
+                self.prune(now)
+
+            self.due[key] = due
+
+        return 0.0
+
+    def prune(self, now: float) -> None:
+
+        # Keys due in the past behave like unknown keys.
+        self.due = {key: due for key, due in self.due.items() if due > now}
+
+        # Still full of active keys: forget the oldest ones.
+        while len(self.due) >= self.max_keys:
+            del self.due[next(iter(self.due))]
+
+    def clear(self) -> None:
+
+        with self.lock:
+            self.due.clear()
+
+
+class CacheRateLimiter:
+
+    """
+    Sliding window counter rate limiter in a Django cache.
+
+    """
+
+    def __init__(self, alias: str) -> None:
+
+        self.alias = alias
+
+    def hit(self, key: str, limit: int, period: int) -> float:
+
+        """
+
+        Record a request for ``key`` if it is within ``limit`` requests
+        per ``period`` seconds. Return 0 if it is, or the seconds until
+        it would be.
+
+        """
+
+        cache = caches[self.alias]
+        now = time.time()
+        window, elapsed = divmod(now, period)
+        current = f"posts:ratelimit:{key}:{int(window)}"
+
+        try:
+            count = cache.incr(current)
+        except ValueError:
+            # Kept for two periods: it is the previous window in the next.
+            if cache.add(current, 1, timeout=2 * period):
+                count = 1
+            else:
+                count = cache.incr(current)
+
+        previous = cache.get(f"posts:ratelimit:{key}:{int(window) - 1}", 0)
+        weight = 1 - elapsed / period
+
+        if previous * weight + count <= limit:
+            return 0.0
+
+        # Rejected requests do not count.
+        cache.decr(current)
+
+        if count > limit or not previous:
+            return period - elapsed
+
+        # Until the previous window's weight has dropped enough.
+        return min((previous * weight + count - limit) / previous * period,
+                   period - elapsed)
+
+
+MEMORY_LIMITER = MemoryRateLimiter()
+
+
+def get_limiter() -> Any:
+
+    """Return the limiter selected by ``POSTS_RATE_LIMIT_BACKEND``."""
+
+    if getattr(settings, "POSTS_RATE_LIMIT_BACKEND", "memory") == "cache":
+        return CacheRateLimiter(
+            getattr(settings, "POSTS_RATE_LIMIT_CACHE_ALIAS", "default"))
+
+    return MEMORY_LIMITER
+
+
+def rate_limit(scope: str) -> Callable:
+
+    """
+
+    Decorator limiting each user to the rate configured for ``scope``.
+
+    Must be applied below ``jwt_required`` so ``request.user`` is set.
+
+    """
+
+    def decorator(func: Callable) -> Callable:
+
+        @functools.wraps(func)
+        def wrapper(request, *args, **kwargs):
+            rate = getattr(settings, "POSTS_RATE_LIMITS", {}).get(scope)
+
+            if rate:
+                limit, period = parse_rate(rate)
+                wait = get_limiter().hit(f"{scope}:{request.user.id}",
+                                         limit, period)
+
+                if wait > 0:
+                    RATE_LIMITED.inc(scope)
+                    response = JsonResponse(
+                        {'error': 'Rate limit exceeded'}, status=429)
+                    response['Retry-After'] = str(math.ceil(wait))
+
+                    return response
+
+            return func(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,221 @@
+"""
+reactions.py
+
+Likes of posts and comments, counted in sharded rows.
+
+A ``Reaction`` row records that a user likes a target, at most once per
+user and target. Its count is kept in ``ReactionCount`` slots: every
+like or unlike adds 1 or -1 to a random one of ``POSTS_REACTION_SHARDS``
+slots of the target, so the likes of a viral post spread over that many
+rows instead of queueing on the lock of a single counter. Reads sum the
+slots of a target, and ``compact_reaction_counts`` (run periodically with
+``manage.py compact_reactions``) folds them back into one row so reads
+stay cheap once the burst is over.
+
+Targets are referenced by id without a foreign key, which would stop
+Django from deleting a user's or post's comments in bulk. The reactions
+and counts of deleted targets are removed by ``delete_orphan_reactions``
+when counts are compacted.
+
+"""
+
+import collections
+import random
+from typing import Dict, List
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, F, OuterRef, Sum
+
+from posts.models import (
+    Comment, Post, Reaction, ReactionCount, ReactionTarget)
+
+
+# Target types by the name used in the API.
+TARGETS = {'posts': ReactionTarget.POST, 'comments': ReactionTarget.COMMENT}
+
+TARGET_MODELS = {ReactionTarget.POST: Post, ReactionTarget.COMMENT: Comment}
+
+
+def _add_to_count(target_type: str, target_id: int, amount: int) -> None:
+
+    """Add ``amount`` to a random count slot of a target."""
+
+    shard = random.randrange(getattr(settings, 'POSTS_REACTION_SHARDS', 8))
+    slot = ReactionCount.objects.filter(target_type=target_type,
+                                        target_id=target_id, shard=shard)
+
+    if slot.update(count=F('count') + amount):
+        return
+
+    try:
+        with transaction.atomic():
+            ReactionCount.objects.create(target_type=target_type,
+                                         target_id=target_id, shard=shard,
+                                         count=amount)
+    except IntegrityError:
+        # Created by a concurrent reaction meanwhile.
+        slot.update(count=F('count') + amount)
+
+
+def react(user: User, target_type: str, target_id: int) -> bool:
+
+    """
+
+    Record that ``user`` likes the target. Returns False if they already
+    did.
+
+    """
+
+    try:
+        with transaction.atomic():
+            Reaction.objects.create(user=user, target_type=target_type,
+                                    target_id=target_id)
+            _add_to_count(target_type, target_id, 1)
+    except IntegrityError:
+        return False
+
+    return True
+
+
+def unreact(user: User, target_type: str, target_id: int) -> bool:
+
+    """
+
+    Remove the like of ``user`` from the target. Returns False if there
+    was none.
+
+    """
+
+    with transaction.atomic():
+        deleted, _ = Reaction.objects.filter(
+            user=user, target_type=target_type, target_id=target_id).delete()
+
+        if deleted:
+            _add_to_count(target_type, target_id, -1)
+
+    return bool(deleted)
+
+
+def reaction_counts(target_type: str,
+                    target_ids: List[int],
+                    user: User,
+                    ) -> List[Dict[str, int]]:
+
+    """
+
+    Return the like count of each of ``target_ids``, and whether ``user``
+    likes it, in the order of ``target_ids``.
+
+    """
+
+    counts = dict(ReactionCount.objects
+                  .filter(target_type=target_type, target_id__in=target_ids)
+                  .order_by()
+                  .values('target_id')
+                  .annotate(total=Sum('count'))
+                  .values_list('target_id', 'total'))
+
+    liked = set(Reaction.objects
+                .filter(user=user, target_type=target_type,
+                        target_id__in=target_ids)
+                .values_list('target_id', flat=True))
+
+    return [{'target_id': target_id, 'count': counts.get(target_id, 0),
+             'reacted': target_id in liked}
+            for target_id in target_ids]
+
+
+def reaction_count(target_type: str, target_id: int) -> int:
+
+    """Return the like count of a target."""
+
+    return ReactionCount.objects.filter(
+        target_type=target_type, target_id=target_id,
+    ).aggregate(total=Sum('count'))['total'] or 0
+
+
+def compact_reaction_counts(batch_size: int = 1000) -> int:
+
+    """
+
+    Fold the count slots of every target with more than one into a
+    single row, ``batch_size`` targets per transaction. Returns the
+    number of targets compacted. The rows of deleted targets are
+    removed first.
+
+    The slots read are locked until the batch commits, so concurrent
+    reactions either land before and are summed, or wait and then find
+    their slot deleted and create a new one. Slots created meanwhile are
+    left for the next run.
+
+    """
+
+    delete_orphan_reactions()
+
+    targets = list(ReactionCount.objects
+                   .order_by()
+                   .values('target_type', 'target_id')
+                   .annotate(slots=Count('id'))
+                   .filter(slots__gt=1)
+                   .values_list('target_type', 'target_id'))
+
+    for start in range(0, len(targets), batch_size):
+        by_type: Dict[str, List[int]] = collections.defaultdict(list)
+
+        for target_type, target_id in targets[start:start + batch_size]:
+            by_type[target_type].append(target_id)
+
+        with transaction.atomic():
+            for target_type, target_ids in by_type.items():
+                _compact(target_type, target_ids)
+
+    return len(targets)
+
+
+def delete_orphan_reactions() -> int:
+
+    """
+
+    Delete the reactions and count slots of posts and comments that no
+    longer exist, one anti-join DELETE per table and target type.
+    Returns the number of rows deleted.
+
+    """
+
+    deleted = 0
+
+    for target_type, model in TARGET_MODELS.items():
+        target = model.all_objects.filter(id=OuterRef('target_id'))
+
+        for rows in (Reaction.objects, ReactionCount.objects):
+            deleted += rows.filter(target_type=target_type).filter(
+                ~Exists(target)).delete()[0]
+
+    return deleted
+
+
+def _compact(target_type: str, target_ids: List[int]) -> None:
+
+    slots = (ReactionCount.objects.select_for_update()
+             .filter(target_type=target_type, target_id__in=target_ids)
+             .order_by('target_id', 'shard'))
+
+    # The first slot of each target keeps the total.
+    kept: Dict[int, ReactionCount] = {}
+    deleted: List[int] = []
+
+    for slot in slots:
+        first = kept.setdefault(slot.target_id, slot)
+
+        if first is not slot:
+            first.count += slot.count
+            deleted.append(slot.id)
+
+    deleted += [slot.id for slot in kept.values() if not slot.count]
+
+    ReactionCount.objects.bulk_update(
+        [slot for slot in kept.values() if slot.count], ['count'])
+    ReactionCount.objects.filter(id__in=deleted).delete()
+
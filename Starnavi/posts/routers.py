@@ -0,0 +1,181 @@
+"""
+routers.py
+
+Routing of read-only endpoints to a read replica.
+
+``ReplicaRouter`` sends reads to the ``POSTS_READ_REPLICA`` database
+alias while a view decorated with ``replica_reads`` is running and to
+``default`` otherwise; writes always go to ``default``.
+
+A replica lags behind the primary, so a user who just wrote something
+must not read from it: ``StickyPrimaryMiddleware`` remembers that a user
+sent a successful write, and ``replica_reads`` serves that user from the
+primary for the next ``POSTS_REPLICA_STICKY_SECONDS``. The marker is kept
+in the ``POSTS_REPLICA_STICKY_CACHE_ALIAS`` cache, which every worker
+must share: the read may not reach the worker that handled the write.
+
+"""
+
+import functools
+from contextvars import ContextVar
+from typing import Any, Callable, Optional
+
+from asgiref.sync import (
+    iscoroutinefunction, markcoroutinefunction, sync_to_async)
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import QuerySet
+from django.http import HttpRequest, HttpResponse
+
+
+_replica: ContextVar[Optional[str]] = ContextVar("posts_replica",
+                                                 default=None)
+
+SAFE_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+
+def _sticky_key(user_id: int) -> str:
+
+    return f"posts:primary:{user_id}"
+
+
+def _sticky_cache() -> Any:
+
+    return caches[getattr(settings, "POSTS_REPLICA_STICKY_CACHE_ALIAS",
+                          "default")]
+
+
+def is_sticky(user: Any) -> bool:
+
+    """Return True if ``user`` wrote recently and must read the primary."""
+
+    if not getattr(user, "is_authenticated", False):
+        return False
+
+    return _sticky_cache().get(_sticky_key(user.id)) is not None
+
+
+def mark_sticky(user: Any) -> None:
+
+    """Serve ``user``'s reads from the primary for the sticky window."""
+
+    seconds = getattr(settings, "POSTS_REPLICA_STICKY_SECONDS", 5)
+    _sticky_cache().set(_sticky_key(user.id), 1, timeout=seconds)
+
+
+def replica_reads(view_func: Callable) -> Callable:
+
+    """
+
+    Decorator sending the reads of a view to the read replica.
+
+    Must be applied below ``jwt_required`` so authentication reads the
+    primary and ``request.user`` is known. A returned queryset is
+    evaluated before the replica is released, since it would otherwise
+    only be read during serialization.
+
+    """
+
+    @functools.wraps(view_func)
+    def wrapper(request: Any, *args: Any, **kwargs: Any) -> Any:
+
+        alias = getattr(settings, "POSTS_READ_REPLICA", None)
+
+        if not alias or is_sticky(request.user):
+            return view_func(request, *args, **kwargs)
+
+        token = _replica.set(alias)
+
+        try:
+            result = view_func(request, *args, **kwargs)
+
+            if isinstance(result, QuerySet):
+                result = list(result)
+
+            return result
+        finally:
+            _replica.reset(token)
+
+    return wrapper
+
+
+class ReplicaRouter:
+
+    """
+    Database router sending reads of ``replica_reads`` views to the replica.
+
+    """
+
+    def db_for_read(self, model: Any, **hints: Any) -> Optional[str]:
+
+        # Entries of a database cache are read where they were written.
+        if model._meta.app_label == "django_cache":
+            return "default"
+
+        return _replica.get()
+
+    def db_for_write(self, model: Any, **hints: Any) -> Optional[str]:
+
+        return "default"
+
+    def allow_relation(self, obj1: Any, obj2: Any, **hints: Any) -> bool:
+
+        # The replica holds the same rows as the primary.
+        return True
+
+
+class StickyPrimaryMiddleware:
+
+    """
+    Middleware pinning users to the primary after a successful write.
+
+    Asynchronous requests only switch to a thread, to read the user and
+    write the marker, after a successful write with a replica configured.
+
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable) -> None:
+
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> Any:
+
+        if self.is_async:
+            return self.acall(request)
+
+        response = self.get_response(request)
+
+        if self.wrote(request, response):
+            self.stick(request)
+
+        return response
+
+    async def acall(self, request: HttpRequest) -> HttpResponse:
+
+        response = await self.get_response(request)
+
+        if self.wrote(request, response):
+            await sync_to_async(self.stick)(request)
+
+        return response
+
+    @staticmethod
+    def wrote(request: HttpRequest, response: HttpResponse) -> bool:
+
+        return (request.method not in SAFE_METHODS
+                and response.status_code < 400
+                and bool(getattr(settings, "POSTS_READ_REPLICA", None)))
+
+    @staticmethod
+    def stick(request: HttpRequest) -> None:
+
+        if getattr(getattr(request, "user", None), "is_authenticated",
+                   False):
+            mark_sticky(request.user)
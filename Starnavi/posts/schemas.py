@@ -1,6 +1,8 @@
-from ninja import Schema, Field
+from ninja import Schema, Field, FilterSchema
 from datetime import datetime
-from pydantic import BaseModel, Field, constr, EmailStr
+from typing import List, Literal, Optional
+from django.db.models import Q
+from pydantic import BaseModel, Field, conint, constr, EmailStr
 
 
 class PostIn(Schema):
@@ -15,6 +17,9 @@ class PostIn(Schema):
     auto_reply_enabled: bool = False
     auto_reply_delay: int = 0
     auto_reply_text: str = ""
+    auto_reply_policy: Literal['every', 'per_commenter', 'coalesce'] = 'every'
+    auto_reply_max_per_window: conint(ge=0) = 0
+    auto_reply_window: conint(ge=1) = 3600
 
 
 class PostOut(Schema):
@@ -28,6 +33,168 @@ class PostOut(Schema):
     title: str
     content: str
     created_at: datetime
+    comment_count: int = 0
+    view_count: int = 0
+
+
+class PostFilterSchema(FilterSchema):
+
+    """
+    Schema for query parameters filtering and ordering the post list.
+
+    Every combination is served by one of the indexes on ``Post``.
+
+    """
+
+    author_id: Optional[int] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    include_blocked: bool = False
+    order_by: Literal['newest', 'most_commented', 'most_viewed'] = 'newest'
+
+    def filter_created_after(self, value: Optional[datetime]) -> Q:
+        return Q(created_at__gte=value) if value else Q()
+
+    def filter_created_before(self, value: Optional[datetime]) -> Q:
+        return Q(created_at__lt=value) if value else Q()
+
+    def filter_include_blocked(self, value: bool) -> Q:
+        # Visibility is decided by the manager ``filter_posts`` reads from.
+        return Q()
+
+    def filter_order_by(self, value: str) -> Q:
+        return Q()
+
+
+class FeedPostOut(PostOut):
+
+    """
+    Schema for output data representing a post in a home feed.
+
+    """
+
+    author_id: int
+
+
+class FeedOut(Schema):
+
+    """
+    Schema for output data representing a page of the home feed.
+
+    """
+
+    items: List[FeedPostOut]
+    next_cursor: Optional[str] = None
+
+
+class FollowOut(Schema):
+
+    """
+    Schema for output data after following or unfollowing an author.
+
+    """
+
+    author_id: int
+    following: bool
+
+
+class BlockedItemOut(Schema):
+
+    """
+    Schema for output data representing a blocked post or comment.
+
+    ``title`` is only set for posts and ``post_id`` only for comments.
+
+    """
+
+    id: int
+    author_id: int
+    content: str
+    created_at: datetime
+    title: Optional[str] = None
+    post_id: Optional[int] = None
+
+
+class BlockedOut(Schema):
+
+    """
+    Schema for output data representing a page of blocked content.
+
+    """
+
+    items: List[BlockedItemOut]
+    next_cursor: Optional[str] = None
+
+
+class NotificationOut(Schema):
+
+    """
+    Schema for output data representing a notification digest.
+
+    ``actor_id`` and ``comment_id`` are those of the latest comment and
+    ``count`` is the number of comments collapsed into the digest.
+
+    """
+
+    id: int
+    kind: str
+    post_id: int
+    actor_id: Optional[int] = None
+    comment_id: Optional[int] = None
+    count: int
+    created_at: datetime
+    updated_at: datetime
+    read: bool
+
+    @staticmethod
+    def resolve_read(obj) -> bool:
+        return obj.read_at is not None
+
+
+class NotificationsOut(Schema):
+
+    """
+    Schema for output data representing a page of notifications.
+
+    """
+
+    items: List[NotificationOut]
+    next_cursor: Optional[str] = None
+    unread_count: int
+
+
+class UnreadOut(Schema):
+
+    """
+    Schema for output data after marking notifications read.
+
+    """
+
+    unread_count: int
+
+
+class CommentCountOut(Schema):
+
+    """
+    Schema for output data representing the comment counts of a post.
+
+    """
+
+    post_id: int
+    total: int
+    blocked: int
+
+
+class ReactionOut(Schema):
+
+    """
+    Schema for output data representing the likes of a post or comment.
+
+    """
+
+    target_id: int
+    count: int
+    reacted: bool
 
 
 class CommentIn(Schema):
@@ -50,6 +217,7 @@ class CommentOut(Schema):
     author_id: int
     created_at: str  # Убедитесь, что это строка
     is_blocked: bool
+    is_duplicate: bool = False
 
     @classmethod
     def from_orm(cls, obj):
@@ -61,11 +229,12 @@ class CommentOut(Schema):
         """
         return cls(
             id=obj.id,
-            post_id=obj.post.id,
+            post_id=obj.post_id,
             content=obj.content,
-            author_id=obj.author.id,
+            author_id=obj.author_id,
             created_at=obj.created_at.isoformat(),
-            is_blocked=obj.is_blocked
+            is_blocked=obj.is_blocked,
+            is_duplicate=obj.is_duplicate,
         )
 
 
@@ -1,18 +1,42 @@
 import jwt
+import asyncio
+import collections
 import functools
-from datetime import timedelta, timezone
-from time import sleep
-from typing import Callable, Any
+import hashlib
+import hmac
+import logging
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from heapq import merge
+from typing import Callable, Any, Dict, List, Optional, Set, Tuple
+from asgiref.sync import sync_to_async
 from better_profanity import profanity
 
 from django.http import JsonResponse
 from django.conf import settings
+from django.core.cache import caches
 from django.contrib.auth.models import User
+from django.urls import get_resolver
 from django.utils import timezone
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from django.contrib.auth import authenticate
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    Case, Count, Exists, F, Max, OuterRef, PositiveBigIntegerField, Q,
+    Subquery, Value, When, Window)
+from django.db.models.functions import Coalesce, DenseRank
 
-from posts.models import Comment
+from posts.cache import LRUCache
+from posts.instrumentation import timed
+from posts.keys import get_keyset
+from posts.metrics import (
+    AUTO_REPLY_LAG, AUTO_REPLY_QUEUE_DEPTH, JWT_FAILURES,
+    MODERATION_CACHE_REQUESTS, MODERATION_CACHE_SIZE)
+from posts.models import (
+    AutoReplyLog, AutoReplyPolicy, Comment, FeedEntry, Follow, FollowerCount,
+    Notification, NotificationKind, Post)
+from posts.streams import publish_comments
+from posts.tasks import BatchWorker, TimerScheduler, WriteBehindCounter
 
 
 def create_jwt_token(user: User) -> str:
@@ -33,47 +57,426 @@ def create_jwt_token(user: User) -> str:
         'exp': exp_time,
     }
 
-    return jwt.encode(payload, settings.SECRET_KEY, algorithm='HS256')
+    return get_keyset().sign(payload)
 
 
 
+def _authenticate(request: Any) -> Optional[JsonResponse]:
+
+    """
+
+    Set ``request.user`` from the JWT in the Authorization header, or
+    return the error response if it is missing or invalid.
+
+    """
+
+    token = request.headers.get('Authorization')
+
+    if token is None:
+        JWT_FAILURES.inc('missing')
+        return JsonResponse({'error': 'Token is missing'}, status=401)
+
+    try:
+        payload = get_keyset().verify(token.split()[1])
+        request.user = User.objects.get(id=payload['user_id'])
+    except jwt.ExpiredSignatureError:
+        JWT_FAILURES.inc('expired')
+        return JsonResponse({'error': 'Invalid token'}, status=401)
+    except (jwt.PyJWTError, User.DoesNotExist) as e:
+        JWT_FAILURES.inc('unknown_user' if isinstance(e, User.DoesNotExist)
+                         else 'invalid')
+        return JsonResponse({'error': 'Invalid token'}, status=401)
+
+    return None
+
+
 def jwt_required(func: Callable) -> Callable:
 
     """
     Decorator to protect views requiring JWT authentication.
 
+    Asynchronous views are supported; their user is loaded in a thread.
+
     """
 
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(request, *args, **kwargs):
+            error = await sync_to_async(_authenticate)(request)
+
+            if error is not None:
+                return error
+
+            return await func(request, *args, **kwargs)
+
+        return async_wrapper
+
     @functools.wraps(func)
     def wrapper(request, *args, **kwargs):
-        token = request.headers.get('Authorization')
+        error = _authenticate(request)
 
-        if token is None:
-            return JsonResponse({'error': 'Token is missing'}, status=401)
+        if error is not None:
+            return error
 
-        try:
-            payload = jwt.decode(token.split()[1], settings.SECRET_KEY, algorithms=['HS256'])
-            request.user = User.objects.get(id=payload['user_id'])
-        except (jwt.ExpiredSignatureError, jwt.DecodeError, User.DoesNotExist):
-            return JsonResponse({'error': 'Invalid token'}, status=401)
+        return func(request, *args, **kwargs)
+
+    return wrapper
+
+
+def staff_required(func: Callable) -> Callable:
+
+    """
+    Decorator restricting a view to staff users.
+
+    Must be applied below ``jwt_required`` so ``request.user`` is set.
+
+    """
+
+    @functools.wraps(func)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_staff:
+            return JsonResponse({'error': 'Staff access required'}, status=403)
 
         return func(request, *args, **kwargs)
 
     return wrapper
 
 
+def metrics_access_required(func: Callable) -> Callable:
+
+    """
+    Decorator restricting a view to scrapers presenting
+    ``POSTS_METRICS_TOKEN`` as a bearer token, and to staff users.
+
+    Prometheus sends a static token, which JWTs, expiring, cannot be.
+
+    """
+
+    staff_only = jwt_required(staff_required(func))
+
+    @functools.wraps(func)
+    def wrapper(request, *args, **kwargs):
+        token = getattr(settings, 'POSTS_METRICS_TOKEN', None)
+
+        if token and hmac.compare_digest(
+                request.headers.get('Authorization', '').encode(),
+                f'Bearer {token}'.encode()):
+            return func(request, *args, **kwargs)
+
+        return staff_only(request, *args, **kwargs)
+
+    return wrapper
+
+
+MODERATION_CACHE = LRUCache(
+    getattr(settings, 'POSTS_MODERATION_CACHE_SIZE', 50_000))
+
+# Identity of the loaded wordlist and the digest of its words.
+_wordlist: Tuple[Any, str] = (None, '')
+
+
+def wordlist_version() -> str:
+
+    """
+
+    Return a digest of the loaded profanity wordlist, loading it first if
+    needed.
+
+    The digest is only recomputed when the wordlist is replaced or grows,
+    and the local verdict cache is cleared when it changes.
+
+    """
+
+    global _wordlist
+
+    if not profanity.CENSOR_WORDSET:
+        profanity.load_censor_words()
+
+    wordset = profanity.CENSOR_WORDSET
+    token = (id(wordset), len(wordset))
+
+    if _wordlist[0] != token:
+        words = sorted(str(word) for word in wordset)
+        digest = hashlib.blake2b('\n'.join(words).encode(), digest_size=8)
+        _wordlist = (token, digest.hexdigest())
+        MODERATION_CACHE.clear()
+
+    return _wordlist[1]
+
+
+def normalize_content(content: str) -> str:
+
+    """Lowercase ``content`` and collapse its whitespace."""
+
+    return ' '.join(content.lower().split())
+
+
 def moderate_content(content: str) -> bool:
 
     """
     Checks if the provided text contains profanity.
 
-    This function uses the better-profanity library
+    This function uses the better-profanity library. Verdicts are cached
+    by a hash of the normalized text in a per-process LRU and, when
+    ``POSTS_MODERATION_CACHE_ALIAS`` names a Django cache, shared between
+    processes. Both are keyed by the wordlist version.
+
+    """
+
+    with timed("moderation"):
+        version = wordlist_version()
+        normalized = normalize_content(content)
+        key = hashlib.blake2b(normalized.encode(), digest_size=16).digest()
+
+        verdict = MODERATION_CACHE.get(key)
+
+        if verdict is not None:
+            MODERATION_CACHE_REQUESTS.inc('local_hit')
+            return verdict
+
+        alias = getattr(settings, 'POSTS_MODERATION_CACHE_ALIAS', None)
+        shared_key = f'posts:moderation:{version}:{key.hex()}'
+
+        if alias:
+            verdict = caches[alias].get(shared_key)
+
+        if verdict is not None:
+            MODERATION_CACHE_REQUESTS.inc('shared_hit')
+        else:
+            MODERATION_CACHE_REQUESTS.inc('miss')
+            verdict = profanity.contains_profanity(normalized)
+
+            if alias:
+                caches[alias].set(
+                    shared_key, verdict,
+                    getattr(settings, 'POSTS_MODERATION_CACHE_TIMEOUT', 86400))
+
+        MODERATION_CACHE.set(key, verdict)
+        MODERATION_CACHE_SIZE.set(len(MODERATION_CACHE))
+
+        return verdict
+
+
+def _auto_reply_history(posts: List[Post],
+                        comments: List[Comment],
+                        now: datetime,
+                        ) -> Tuple[Dict[int, int], Dict[int, datetime],
+                                   Set[Tuple[int, int]]]:
+
+    """
+
+    Read from ``AutoReplyLog`` what the policies of ``posts`` need: the
+    number of replies in each post's current window, the time of the
+    latest reply to coalescing posts and the commenters already answered
+    on per-commenter posts.
+
+    """
+
+    limited = [post for post in posts if post.auto_reply_max_per_window]
+    coalescing = [post.id for post in posts
+                  if post.auto_reply_policy == AutoReplyPolicy.COALESCE]
+    per_commenter = [post.id for post in posts
+                     if post.auto_reply_policy == AutoReplyPolicy.PER_COMMENTER]
+
+    in_window: Dict[int, int] = {}
+    last_reply: Dict[int, datetime] = {}
+    answered: Set[Tuple[int, int]] = set()
+
+    if limited:
+        windows = {post.id: now - timedelta(seconds=post.auto_reply_window)
+                   for post in limited}
+        logs = (AutoReplyLog.objects
+                .filter(post_id__in=windows,
+                        created_at__gte=min(windows.values()))
+                .values_list('post_id', 'reply_id', 'created_at'))
+        replies: Dict[int, Set[int]] = collections.defaultdict(set)
+
+        for post_id, reply_id, created_at in logs:
+            if created_at >= windows[post_id]:
+                replies[post_id].add(reply_id)
+
+        in_window = {post_id: len(ids) for post_id, ids in replies.items()}
+
+    if coalescing:
+        last_reply = dict(AutoReplyLog.objects
+                          .filter(post_id__in=coalescing)
+                          .values('post_id')
+                          .annotate(last=Max('created_at'))
+                          .values_list('post_id', 'last'))
+
+    if per_commenter:
+        answered = set(AutoReplyLog.objects
+                       .filter(post_id__in=per_commenter,
+                               commenter_id__in={comment.author_id
+                                                 for comment in comments})
+                       .values_list('post_id', 'commenter_id'))
+
+    return in_window, last_reply, answered
+
+
+def _recent_commenters(since: Dict[int, Optional[datetime]],
+                       ) -> Dict[int, List[Tuple[int, str]]]:
+
+    """
+
+    Return, per post of ``since``, the ids and usernames of up to one more
+    than ``POSTS_AUTO_REPLY_MAX_MENTIONS`` users who commented on it after
+    its time in ``since``, excluding its author, in one query.
+
+    """
+
+    limit = getattr(settings, 'POSTS_AUTO_REPLY_MAX_MENTIONS', 10)
+    recent = Q()
+
+    for post_id, after in since.items():
+        recent |= (Q(post_id=post_id, created_at__gt=after)
+                   if after is not None else Q(post_id=post_id))
+
+    # Usernames are unique, so equal ranks within a post are one commenter.
+    rows = (Comment.objects.filter(recent)
+            .exclude(author_id=F('post__author_id'))
+            .annotate(rank=Window(DenseRank(), partition_by=F('post_id'),
+                                  order_by=F('author__username').asc()))
+            .filter(rank__lte=limit + 1)
+            .values_list('post_id', 'author_id', 'author__username')
+            .distinct())
+
+    commenters: Dict[int, List[Tuple[int, str]]] = {
+        post_id: [] for post_id in since}
+
+    for post_id, author_id, username in sorted(rows, key=lambda row: row[2]):
+        commenters[post_id].append((author_id, username))
+
+    return commenters
+
+
+def _mention(text: str, usernames: List[str]) -> str:
+
+    limit = getattr(settings, 'POSTS_AUTO_REPLY_MAX_MENTIONS', 10)
+    mentions = ' '.join(f'@{username}' for username in usernames[:limit])
+
+    if len(usernames) > limit:
+        mentions += ' and others'
+
+    return f'{text} {mentions}'.strip()
+
+
+def send_auto_replies(comment_ids: List[int]) -> None:
 
     """
 
-    profanity.load_censor_words()
+    Send the automatic replies due for a batch of comments.
 
-    return profanity.contains_profanity(content)
+    Each post's ``auto_reply_policy`` and reply window decide which
+    comments get a reply; automatic replies themselves never do. The
+    commenters mentioned by coalesced replies are read in one query,
+    replies and their ``AutoReplyLog`` rows are written with one INSERT
+    each and the comment counts with one UPDATE per distinct number of
+    replies.
+
+    """
+
+    comments = list(Comment.all_objects
+                    .filter(id__in=comment_ids, post__auto_reply_enabled=True)
+                    .exclude(Exists(AutoReplyLog.objects.filter(
+                        reply=OuterRef('pk'))))
+                    .select_related('post')
+                    .order_by('created_at', 'id'))
+
+    if not comments:
+        return
+
+    now = timezone.now()
+    by_post: Dict[int, List[Comment]] = collections.defaultdict(list)
+
+    for comment in comments:
+        by_post[comment.post_id].append(comment)
+
+    posts = {post_id: batch[0].post for post_id, batch in by_post.items()}
+    in_window, last_reply, answered = _auto_reply_history(
+        list(posts.values()), comments, now)
+
+    # (post, reply text, ids of answered commenters, comments replied to)
+    planned: List[Tuple[Post, str, List[int], List[Comment]]] = []
+    # Coalescing posts due a reply, with the comments it answers.
+    coalesced: Dict[int, List[Comment]] = {}
+
+    for post_id, batch in by_post.items():
+        post = posts[post_id]
+        text = post.auto_reply_text or ""
+        budget = (post.auto_reply_max_per_window - in_window.get(post_id, 0)
+                  if post.auto_reply_max_per_window else len(batch))
+
+        if post.auto_reply_policy == AutoReplyPolicy.COALESCE:
+            # The author's own comments are never mentioned, so a burst of
+            # them alone would get a reply without an AutoReplyLog row,
+            # escaping the window's limit and the last reply's time.
+            since = last_reply.get(post_id)
+            pending = [comment for comment in batch
+                       if comment.author_id != post.author_id
+                       and (since is None or comment.created_at > since)]
+
+            if pending and budget > 0:
+                coalesced[post_id] = pending
+            continue
+
+        for comment in batch:
+            if budget <= 0:
+                break
+
+            key = (post_id, comment.author_id)
+
+            if post.auto_reply_policy == AutoReplyPolicy.PER_COMMENTER:
+                if key in answered:
+                    continue
+                answered.add(key)
+
+            planned.append((post, text, [comment.author_id], [comment]))
+            budget -= 1
+
+    if coalesced:
+        commenters = _recent_commenters(
+            {post_id: last_reply.get(post_id) for post_id in coalesced})
+
+        for post_id, pending in coalesced.items():
+            if not commenters[post_id]:
+                continue
+
+            post = posts[post_id]
+            planned.append((
+                post,
+                _mention(post.auto_reply_text or "",
+                         [name for _, name in commenters[post_id]]),
+                [user_id for user_id, _ in commenters[post_id]], pending))
+
+    replies = Comment.objects.bulk_create([
+        Comment(post=post, author_id=post.author_id, content=text)
+        for post, text, _, _ in planned
+    ])
+
+    AutoReplyLog.objects.bulk_create([
+        AutoReplyLog(post=post, commenter_id=commenter_id, reply=reply,
+                     created_at=now)
+        for reply, (post, _, commenter_ids, _) in zip(replies, planned)
+        for commenter_id in commenter_ids
+    ])
+
+    count_new_comments(replies)
+
+    transaction.on_commit(lambda: publish_comments(replies))
+
+    events = [(commenter_id, post.id, NotificationKind.REPLY, post.author_id,
+               reply.id)
+              for reply, (post, _, commenter_ids, _) in zip(replies, planned)
+              for commenter_id in commenter_ids
+              if commenter_id != post.author_id]
+    transaction.on_commit(lambda: queue_notifications(events))
+
+    for post, _, _, answered_comments in planned:
+        for comment in answered_comments:
+            due = comment.created_at + timedelta(
+                seconds=post.auto_reply_delay)
+            AUTO_REPLY_LAG.observe(max((now - due).total_seconds(), 0))
 
 
 def send_auto_reply(comment_id: int) -> None:
@@ -82,21 +485,325 @@ def send_auto_reply(comment_id: int) -> None:
     Send an automatic reply to a comment based
                 on the associated post's settings.
 
+    The reply is sent right away; ``schedule_auto_reply`` delays it.
+
+    """
+
+    send_auto_replies([comment_id])
+
+
+AUTO_REPLIES = TimerScheduler(
+    'auto-reply', send_auto_replies,
+    tick=getattr(settings, 'POSTS_AUTO_REPLY_TICK', 0.1),
+    max_pending=getattr(settings, 'POSTS_AUTO_REPLY_MAX_PENDING', 100_000),
+    gauge=AUTO_REPLY_QUEUE_DEPTH,
+)
+
+
+def schedule_auto_reply(comment: Comment) -> bool:
+
+    """
+
+    Schedule the automatic reply to ``comment`` after its post's delay.
+
+    Returns False if the post has no auto-reply or the scheduler is full.
+
     """
 
-    comment = Comment.objects.get(id=comment_id)
     post = comment.post
 
-    if post.auto_reply_enabled:
-        sleep(post.auto_reply_delay)
+    if not post.auto_reply_enabled:
+        return False
+
+    return AUTO_REPLIES.schedule(comment.id, post.auto_reply_delay)
+
+
+POST_ORDERINGS = {
+    'newest': ('-created_at',),
+    'most_commented': ('-comment_count', '-created_at'),
+    'most_viewed': ('-view_count', '-created_at'),
+}
+
+
+def filter_posts(filters: Any) -> Any:
+
+    """
+
+    Return the posts matching a ``PostFilterSchema`` in the requested order.
+
+    Blocked posts are only read through ``Post.all_objects`` when the
+    filters ask for them.
+
+    """
+
+    manager = Post.all_objects if filters.include_blocked else Post.objects
+
+    return filters.filter(manager.all()).order_by(
+        *POST_ORDERINGS[filters.order_by])
+
+
+def recount_comments(posts: Any) -> int:
+
+    """
+
+    Recompute ``comment_count`` for a queryset of posts in one UPDATE.
+
+    Used after bulk inserts that bypass ``count_new_comment``.
+
+    """
+
+    counts = (Comment.objects.filter(post=OuterRef('pk'))
+              .order_by()
+              .values('post')
+              .annotate(count=Count('pk'))
+              .values('count'))
+
+    return posts.update(comment_count=Coalesce(Subquery(counts), 0))
+
+
+def parse_ids(ids: str, max_ids: int) -> List[int]:
+
+    """
+
+    Parse a comma-separated list of ids, without repetitions.
+
+    Raises ValidationError if an id is invalid or there are more than
+    ``max_ids``.
+
+    """
+
+    try:
+        parsed = list(dict.fromkeys(int(id_) for id_ in ids.split(',')))
+    except ValueError:
+        raise ValidationError("ids must be comma-separated integers.")
+
+    if len(parsed) > max_ids:
+        raise ValidationError(f"At most {max_ids} ids are allowed.")
+
+    return parsed
+
+
+def comment_counts(post_ids: List[int]) -> List[Dict[str, int]]:
+
+    """
+
+    Return the total and blocked comment counts of the visible posts
+    among ``post_ids``, in the order of ``post_ids``.
+
+    Read in one query: visible comments from the denormalized
+    ``comment_count``, blocked ones counted per post from the partial
+    index on blocked comments alone, without reading the comment rows.
+
+    """
+
+    blocked = (Comment.all_objects.filter(post=OuterRef('pk'),
+                                          is_blocked=True)
+               .order_by()
+               .values('post')
+               .annotate(count=Count('pk'))
+               .values('count'))
+
+    rows = (Post.objects.filter(id__in=post_ids)
+            .annotate(blocked_count=Coalesce(Subquery(blocked), 0))
+            .values_list('id', 'comment_count', 'blocked_count'))
+
+    counts = {post_id: (visible + blocked_count, blocked_count)
+              for post_id, visible, blocked_count in rows}
+
+    return [{'post_id': post_id, 'total': counts[post_id][0],
+             'blocked': counts[post_id][1]}
+            for post_id in post_ids if post_id in counts]
+
+
+def count_new_comment(comment: Comment) -> None:
+
+    """
+
+    Keep the post's denormalized count of visible comments up to date.
+
+    """
+
+    count_new_comments([comment])
+
+
+def count_new_comments(comments: List[Comment]) -> None:
+
+    """
+
+    Add a batch of new comments to the comment counts of their posts.
+
+    """
+
+    added = collections.Counter(comment.post_id for comment in comments
+                                if not comment.is_blocked)
+    posts_by_amount = collections.defaultdict(list)
+
+    for post_id, amount in added.items():
+        posts_by_amount[amount].append(post_id)
+
+    for amount, post_ids in posts_by_amount.items():
+        Post.all_objects.filter(id__in=post_ids).update(
+            comment_count=F('comment_count') + amount,
+            trending_score=F('trending_score') + amount)
+
+
+def update_trending(batch_size: int = 1000) -> int:
+
+    """
+
+    Recompute ``trending_score`` of every post from its visible comments
+    of the last ``POSTS_TRENDING_WINDOW`` seconds, each weighing 1 when
+    new and half as much every ``POSTS_TRENDING_HALF_LIFE`` seconds.
+
+    New comments add 1 to the score of their post until the next run.
+    Scores are written ``batch_size`` posts per UPDATE; returns the
+    number of posts with a score.
+
+    """
+
+    now = timezone.now()
+    half_life = getattr(settings, 'POSTS_TRENDING_HALF_LIFE', 6 * 60 * 60)
+    since = now - timedelta(
+        seconds=getattr(settings, 'POSTS_TRENDING_WINDOW', 24 * 60 * 60))
+
+    comments = (Comment.objects.filter(created_at__gte=since)
+                .order_by('post_id')
+                .values_list('post_id', 'created_at')
+                .iterator(chunk_size=batch_size * 10))
+
+    scores: Dict[int, float] = {}
+    scored: Set[int] = set()
+
+    def write(scores: Dict[int, float]) -> None:
+        Post.all_objects.bulk_update(
+            [Post(id=post_id, trending_score=score)
+             for post_id, score in scores.items()],
+            ['trending_score'])
+        scored.update(scores)
+        scores.clear()
+
+    for post_id, created_at in comments:
+        if post_id not in scores and len(scores) >= batch_size:
+            write(scores)
 
-        reply_content = post.auto_reply_text
+        age = (now - created_at).total_seconds()
+        scores[post_id] = scores.get(post_id, 0.0) + 0.5 ** (age / half_life)
 
-        Comment.objects.create(
-            post=post,
-            author=post.author,
-            content=reply_content
-        )
+    write(scores)
+
+    stale = [post_id for post_id in Post.all_objects.filter(
+        trending_score__gt=0).values_list('id', flat=True).iterator()
+        if post_id not in scored]
+
+    for start in range(0, len(stale), batch_size):
+        Post.all_objects.filter(
+            id__in=stale[start:start + batch_size]).update(trending_score=0)
+
+    return len(scored)
+
+
+def trending_posts(limit: int) -> List[Post]:
+
+    """
+
+    Return the ``limit`` visible posts with the highest trending score,
+    cached for ``POSTS_TRENDING_CACHE_TIMEOUT`` seconds.
+
+    """
+
+    key = f'posts:trending:{limit}'
+    posts = caches['default'].get(key)
+
+    if posts is None:
+        posts = list(Post.objects.filter(trending_score__gt=0)
+                     .order_by('-trending_score', '-created_at')[:limit])
+        caches['default'].set(
+            key, posts,
+            timeout=getattr(settings, 'POSTS_TRENDING_CACHE_TIMEOUT', 30))
+
+    return posts
+
+
+def warm_up() -> float:
+
+    """
+
+    Load everything the first requests of a worker would otherwise load:
+    the URLconf with the API and its schemas, the profanity wordlist and
+    matcher, the SimHash tables and the JWT keyset. Returns the seconds
+    it took.
+
+    """
+
+    # posts.duplicates builds on this module.
+    from posts.duplicates import simhash
+
+    started = time.perf_counter()
+
+    get_resolver().url_patterns
+
+    wordlist_version()
+    profanity.contains_profanity('warm up')
+    simhash('warm up the near duplicate detection of comments')
+
+    keyset = get_keyset()
+    keyset.verify(keyset.sign({'warm_up': True}))
+
+    return time.perf_counter() - started
+
+
+def start_worker() -> None:
+
+    """
+
+    Prepare a serving process: start its auto-reply scheduler and, unless
+    ``POSTS_WARM_UP`` is off, warm up the request path.
+
+    Called by the ASGI and WSGI entry points only, so management commands
+    and the test runner neither start threads nor warm up.
+
+    """
+
+    AUTO_REPLIES.start()
+
+    if getattr(settings, 'POSTS_WARM_UP', True):
+        seconds = warm_up()
+        logging.getLogger('posts').info('Warmed up in %.0f ms',
+                                        seconds * 1000)
+
+
+def flush_post_views(deltas: Dict[int, int]) -> None:
+
+    """
+
+    Add buffered view counts to their posts, with one UPDATE per
+    ``POSTS_VIEW_FLUSH_BATCH_SIZE`` posts.
+
+    """
+
+    post_ids = sorted(deltas)
+    batch_size = getattr(settings, 'POSTS_VIEW_FLUSH_BATCH_SIZE', 500)
+
+    for start in range(0, len(post_ids), batch_size):
+        batch = post_ids[start:start + batch_size]
+        Post.all_objects.filter(id__in=batch).update(
+            view_count=F('view_count') + Case(
+                *[When(id=post_id, then=Value(deltas[post_id]))
+                  for post_id in batch],
+                output_field=PositiveBigIntegerField(),
+            ))
+
+
+POST_VIEWS = WriteBehindCounter(
+    'post-views', flush_post_views,
+    interval=getattr(settings, 'POSTS_VIEW_FLUSH_INTERVAL', 5.0))
+
+
+def count_post_view(post: Post) -> None:
+
+    """Count a view of ``post``, written with the next flush."""
+
+    POST_VIEWS.add(post.id)
 
 
 def register_user(username: str, email: str, password: str) -> User:
@@ -142,3 +849,429 @@ def authenticate_user(username: str, password: str) -> User:
             raise ValueError("Invalid password.")
 
     return user
+
+
+def follow_user(follower: User, author: User) -> bool:
+
+    """
+
+    Make ``follower`` follow ``author``.
+
+    The author's latest posts are copied into the follower's feed so it
+    is not empty until their next post. Returns False if the follow
+    already existed.
+
+    """
+
+    if follower.id == author.id:
+        raise ValidationError("You cannot follow yourself.")
+
+    try:
+        with transaction.atomic():
+            Follow.objects.create(follower=follower, author=author)
+    except IntegrityError:
+        return False
+
+    FollowerCount.objects.get_or_create(author=author)
+    FollowerCount.objects.filter(author=author).update(count=F('count') + 1)
+
+    backfill = getattr(settings, 'POSTS_FEED_BACKFILL', 20)
+    posts = (Post.objects.filter(author=author)
+             .order_by('-created_at')[:backfill])
+
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user=follower, post=post, author=author,
+                   created_at=post.created_at) for post in posts],
+        ignore_conflicts=True,
+    )
+
+    return True
+
+
+def unfollow_user(follower: User, author: User) -> bool:
+
+    """
+
+    Stop ``follower`` following ``author`` and drop the author's posts
+    from the follower's feed. Returns False if there was no follow.
+
+    """
+
+    deleted, _ = Follow.objects.filter(follower=follower,
+                                       author=author).delete()
+
+    if not deleted:
+        return False
+
+    FollowerCount.objects.filter(author=author).update(count=F('count') - 1)
+    FeedEntry.objects.filter(user=follower, author=author).delete()
+
+    return True
+
+
+def is_fan_out_on_read(author_id: int) -> bool:
+
+    """
+
+    Return True if the author has too many followers for fan-out-on-write.
+
+    """
+
+    limit = getattr(settings, 'POSTS_FEED_FANOUT_LIMIT', 10_000)
+
+    return FollowerCount.objects.filter(author_id=author_id,
+                                        count__gt=limit).exists()
+
+
+def fan_out_posts(post_ids: List[int]) -> None:
+
+    """
+
+    Write new posts into the feed of every follower of their authors.
+
+    Posts of authors above ``POSTS_FEED_FANOUT_LIMIT`` followers are
+    skipped; they are merged into feeds at read time instead.
+
+    """
+
+    batch_size = getattr(settings, 'POSTS_FEED_FANOUT_BATCH_SIZE', 1000)
+    limit = getattr(settings, 'POSTS_FEED_FANOUT_LIMIT', 10_000)
+
+    posts = (Post.objects.filter(id__in=post_ids)
+             .exclude(author__follower_count__count__gt=limit)
+             .values_list('id', 'author_id', 'created_at'))
+
+    for post_id, author_id, created_at in posts:
+        follower_ids = (Follow.objects.filter(author_id=author_id)
+                        .values_list('follower_id', flat=True)
+                        .iterator(chunk_size=batch_size))
+        entries = []
+
+        for follower_id in follower_ids:
+            entries.append(FeedEntry(user_id=follower_id, post_id=post_id,
+                                     author_id=author_id,
+                                     created_at=created_at))
+
+            if len(entries) >= batch_size:
+                FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+                entries = []
+
+        if entries:
+            FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+FEED_FANOUT = BatchWorker('feed-fanout', fan_out_posts)
+
+
+def encode_cursor(created_at: datetime, post_id: int) -> str:
+
+    """Encode a feed position as an opaque keyset cursor."""
+
+    return f"{int(created_at.timestamp() * 1_000_000)}_{post_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+
+    """Decode a cursor produced by ``encode_cursor``."""
+
+    try:
+        micros, post_id = cursor.split('_')
+        created_at = datetime.fromtimestamp(int(micros) / 1_000_000,
+                                            tz=dt_timezone.utc)
+        return created_at, int(post_id)
+    except (ValueError, OverflowError):
+        raise ValidationError("Invalid cursor.")
+
+
+def _after_cursor(queryset: Any,
+                  cursor: Optional[Tuple[datetime, int]],
+                  post_field: str,
+                  time_field: str = 'created_at',
+                  ) -> Any:
+
+    if cursor is None:
+        return queryset
+
+    created_at, post_id = cursor
+
+    return queryset.filter(
+        Q(**{f'{time_field}__lt': created_at})
+        | Q(**{time_field: created_at, f'{post_field}__lt': post_id})
+    )
+
+
+def get_feed(user: User,
+             cursor: Optional[str] = None,
+             limit: int = 20,
+             ) -> Tuple[List[Post], Optional[str]]:
+
+    """
+
+    Return a page of the user's home feed and the cursor of the next page.
+
+    Fanned-out ``FeedEntry`` rows are merged with the latest posts of
+    followed authors that use fan-out-on-read. Both sources are read with
+    keyset pagination on ``(created_at, post_id)``.
+
+    """
+
+    position = decode_cursor(cursor) if cursor else None
+    fetch = limit + 1
+
+    entries = _after_cursor(
+        FeedEntry.objects.filter(user=user), position, 'post_id'
+    ).order_by('-created_at', '-post_id').values_list('created_at', 'post_id')
+
+    fanout_limit = getattr(settings, 'POSTS_FEED_FANOUT_LIMIT', 10_000)
+    read_authors = (Follow.objects
+                    .filter(follower=user,
+                            author__follower_count__count__gt=fanout_limit)
+                    .values_list('author_id', flat=True))
+
+    pulled = _after_cursor(
+        Post.objects.filter(author_id__in=list(read_authors)),
+        position, 'id'
+    ).order_by('-created_at', '-id').values_list('created_at', 'id')
+
+    keys, seen = [], set()
+
+    for key in merge(entries[:fetch], pulled[:fetch], reverse=True):
+        if key[1] not in seen:
+            seen.add(key[1])
+            keys.append(key)
+
+    keys = keys[:fetch]
+    has_more = len(keys) > limit
+    keys = keys[:limit]
+
+    posts = Post.objects.in_bulk([post_id for _, post_id in keys])
+    page = [posts[post_id] for _, post_id in keys if post_id in posts]
+
+    next_cursor = encode_cursor(*keys[-1]) if has_more else None
+
+    return page, next_cursor
+
+
+BLOCKED_CONTENT = {'posts': Post, 'comments': Comment}
+
+
+def list_blocked(kind: str,
+                 cursor: Optional[str] = None,
+                 limit: int = 20,
+                 ) -> Tuple[List[Any], Optional[str]]:
+
+    """
+
+    Return a page of blocked posts or comments, newest first, and the
+    cursor of the next page.
+
+    Pages are read with keyset pagination on ``(created_at, id)`` from the
+    partial indexes covering blocked rows only.
+
+    """
+
+    position = decode_cursor(cursor) if cursor else None
+    model = BLOCKED_CONTENT[kind]
+
+    items = list(_after_cursor(
+        model.all_objects.filter(is_blocked=True), position, 'id'
+    ).order_by('-created_at', '-id')[:limit + 1])
+
+    next_cursor = None
+
+    if len(items) > limit:
+        last = items[limit - 1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+
+    return items[:limit], next_cursor
+
+
+# (recipient id, post id, kind, actor id, comment id)
+NotificationEvent = Tuple[int, int, str, int, int]
+
+
+def comment_notifications(comments: List[Comment]) -> List[NotificationEvent]:
+
+    """
+
+    Return the notifications of new comments for the authors of their
+    posts. Blocked comments and authors' own comments notify nobody.
+
+    """
+
+    return [(comment.post.author_id, comment.post_id,
+             NotificationKind.COMMENT, comment.author_id, comment.id)
+            for comment in comments
+            if not comment.is_blocked
+            and comment.author_id != comment.post.author_id]
+
+
+def queue_notifications(events: List[NotificationEvent]) -> None:
+
+    """Hand notification events to the background writer."""
+
+    for event in events:
+        NOTIFICATIONS.submit(event)
+
+
+def _unread_cache() -> Any:
+
+    return caches[getattr(settings, 'POSTS_NOTIFICATION_CACHE_ALIAS',
+                          'shared')]
+
+
+def _unread_key(user_id: int) -> str:
+
+    return f'posts:notifications:unread:{user_id}'
+
+
+def create_notifications(events: List[NotificationEvent]) -> None:
+
+    """
+
+    Write a batch of notification events.
+
+    Events are grouped by recipient, post and kind and each group is
+    collapsed into the recipient's unread digest for the post if one
+    was started in the last ``POSTS_NOTIFICATION_DIGEST_WINDOW`` seconds,
+    or into a new one. The open digests are read with one query, updated
+    with one UPDATE and the new ones inserted with one INSERT. The cached
+    unread counts of the recipients are incremented by their new digests.
+
+    """
+
+    now = timezone.now()
+    since = now - timedelta(seconds=getattr(
+        settings, 'POSTS_NOTIFICATION_DIGEST_WINDOW', 60 * 60))
+
+    groups: Dict[Tuple[int, int, str], List[NotificationEvent]] = (
+        collections.defaultdict(list))
+
+    for event in events:
+        groups[event[:3]].append(event)
+
+    # Ordered so the latest digest of a group wins.
+    open_digests = {
+        (digest.recipient_id, digest.post_id, digest.kind): digest
+        for digest in Notification.objects.filter(
+            recipient_id__in={key[0] for key in groups},
+            post_id__in={key[1] for key in groups},
+            read_at__isnull=True,
+            created_at__gte=since,
+        ).order_by('created_at', 'id')
+    }
+
+    updated, created = [], []
+
+    for key, group in groups.items():
+        recipient_id, post_id, kind = key
+        _, _, _, actor_id, comment_id = group[-1]
+        digest = open_digests.get(key)
+
+        if digest is None:
+            created.append(Notification(
+                recipient_id=recipient_id, post_id=post_id, kind=kind,
+                actor_id=actor_id, comment_id=comment_id, count=len(group),
+                created_at=now, updated_at=now))
+            continue
+
+        # Added in SQL, so digests updated by other processes keep counts.
+        digest.count = F('count') + len(group)
+        digest.actor_id, digest.comment_id = actor_id, comment_id
+        digest.updated_at = now
+        updated.append(digest)
+
+    Notification.objects.bulk_update(
+        updated, ['count', 'actor', 'comment', 'updated_at'])
+    Notification.objects.bulk_create(created)
+
+    cache = _unread_cache()
+    new_digests = collections.Counter(notification.recipient_id
+                                      for notification in created)
+
+    for recipient_id, amount in new_digests.items():
+        try:
+            cache.incr(_unread_key(recipient_id), amount)
+        except ValueError:
+            # Not cached; counted on the next read.
+            pass
+
+
+NOTIFICATIONS = BatchWorker('notifications', create_notifications)
+
+
+def list_notifications(user: User,
+                       cursor: Optional[str] = None,
+                       limit: int = 20,
+                       ) -> Tuple[List[Notification], Optional[str]]:
+
+    """
+
+    Return a page of the user's notifications, most recently updated
+    first, and the cursor of the next page.
+
+    Pages are read with keyset pagination on ``(updated_at, id)``. A
+    digest updated while paging moves to the first page.
+
+    """
+
+    position = decode_cursor(cursor) if cursor else None
+
+    items = list(_after_cursor(
+        Notification.objects.filter(recipient=user), position, 'id',
+        time_field='updated_at',
+    ).order_by('-updated_at', '-id')[:limit + 1])
+
+    next_cursor = None
+
+    if len(items) > limit:
+        last = items[limit - 1]
+        next_cursor = encode_cursor(last.updated_at, last.id)
+
+    return items[:limit], next_cursor
+
+
+def unread_notifications(user: User) -> int:
+
+    """
+
+    Return the number of unread notification digests of the user.
+
+    The count is kept in the ``POSTS_NOTIFICATION_CACHE_ALIAS`` cache,
+    shared by every worker, as digests are created and read. It is
+    recounted from the partial index of unread digests when missing, and
+    may lag behind by the digests created while it was being recounted
+    until ``POSTS_NOTIFICATION_UNREAD_TIMEOUT`` expires it.
+
+    """
+
+    cache = _unread_cache()
+    key = _unread_key(user.id)
+    count = cache.get(key)
+
+    if count is None:
+        count = Notification.objects.filter(recipient=user,
+                                            read_at__isnull=True).count()
+        cache.add(key, count, getattr(
+            settings, 'POSTS_NOTIFICATION_UNREAD_TIMEOUT', 300))
+
+    return count
+
+
+def mark_notifications_read(user: User) -> int:
+
+    """
+
+    Mark every notification of the user read and return how many.
+
+    The cached unread count is reset; the next read recounts it, so
+    digests created meanwhile are not lost.
+
+    """
+
+    updated = Notification.objects.filter(
+        recipient=user, read_at__isnull=True).update(read_at=timezone.now())
+
+    _unread_cache().delete(_unread_key(user.id))
+
+    return updated
@@ -0,0 +1,550 @@
+"""
+streams.py
+
+Server-sent events of new comments.
+
+``GET /api/posts/{post_id}/comments/stream/`` keeps the connection open
+and pushes every visible comment created on the post, automatic replies
+included, as an SSE ``comment`` event whose ``id`` is the comment id.
+Clients reconnecting with ``Last-Event-ID`` first receive the comments
+they missed, so nothing is lost between connections. When more than
+``POSTS_STREAM_BACKLOG`` were missed, the stream ends after sending that
+many and the client catches up over several reconnections.
+
+Every process has one ``Broker`` holding the subscriptions of its open
+streams by post. New comments are published once committed through the
+backend chosen with ``POSTS_STREAM_BACKEND``:
+
+``local``
+    Delivered to the broker of the publishing process only. Enough for a
+    single worker, and for tests.
+
+``postgres``
+    Sent with ``NOTIFY`` on the ``POSTS_STREAM_CHANNEL`` channel. Every
+    process with open streams ``LISTEN``\\s on a connection of its own and
+    delivers the notifications to its broker, so comments reach the
+    streams of every worker.
+
+Backpressure: each subscription buffers at most ``POSTS_STREAM_QUEUE_SIZE``
+events. A client reading slower than comments arrive is disconnected
+when its buffer is full, and catches up from the database when it
+reconnects with ``Last-Event-ID``. At most ``POSTS_STREAM_MAX_SUBSCRIBERS``
+streams are open per process; more are refused with 503.
+
+Streams are asynchronous: the application must be served over ASGI,
+e.g. ``uvicorn Starnavi.asgi:application``.
+
+"""
+
+import asyncio
+import collections
+import json
+import logging
+import threading
+import time
+from typing import (
+    Any, AsyncIterator, Deque, Dict, List, Optional, Set, Tuple)
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections, connections
+from django.dispatch import receiver
+
+from posts.metrics import STREAM_CLOSED, STREAM_SUBSCRIBERS
+from posts.models import Comment
+from posts.schemas import CommentOut
+
+
+logger = logging.getLogger(__name__)
+
+# (comment id, JSON of the comment)
+Event = Tuple[int, str]
+
+# NOTIFY payloads must be shorter than 8000 bytes; longer comments are
+# sent by id and read by the listening processes.
+MAX_PAYLOAD = 7000
+
+# Milliseconds clients wait before reconnecting.
+RETRY = 3000
+
+
+class TooManySubscribers(Exception):
+
+    """Raised when a process already holds its maximum of streams."""
+
+
+class Subscription:
+
+    """
+    The buffered events of one stream.
+
+    Events are pushed from any thread and awaited from the event loop
+    serving the stream.
+
+    """
+
+    def __init__(self, post_id: int, max_events: int) -> None:
+
+        self.post_id = post_id
+        self.max_events = max_events
+        self.events: Deque[Event] = collections.deque()
+        self.closed = False
+        self.lock = threading.Lock()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.waiter: Optional[asyncio.Future] = None
+
+    def push(self, event: Event) -> bool:
+
+        """
+
+        Buffer ``event``. Return False if the subscription is closed, or
+        closes now because its buffer is full.
+
+        """
+
+        with self.lock:
+            if self.closed:
+                return False
+
+            if len(self.events) >= self.max_events:
+                self.closed = True
+                self.events.clear()
+            else:
+                self.events.append(event)
+
+            loop, waiter = self.loop, self.waiter
+
+        if waiter is not None:
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:
+                # The loop serving the stream is gone.
+                self.close()
+                return False
+
+        return not self.closed
+
+    async def get(self, timeout: float) -> Optional[Event]:
+
+        """
+
+        Return the next event, or None once the subscription is closed.
+
+        Raises ``asyncio.TimeoutError`` if no event arrives within
+        ``timeout`` seconds.
+
+        """
+
+        loop = asyncio.get_running_loop()
+
+        while True:
+            with self.lock:
+                if self.events:
+                    return self.events.popleft()
+
+                if self.closed:
+                    return None
+
+                self.loop = loop
+                self.waiter = waiter = loop.create_future()
+
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            finally:
+                with self.lock:
+                    self.waiter = None
+
+    def close(self) -> None:
+
+        with self.lock:
+            self.closed = True
+            self.events.clear()
+            loop, waiter = self.loop, self.waiter
+
+        if waiter is not None:
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:
+                pass
+
+
+def _wake(waiter: asyncio.Future) -> None:
+
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class Broker:
+
+    """
+    The subscriptions of this process by post.
+
+    """
+
+    def __init__(self, max_subscribers: int, max_events: int) -> None:
+
+        self.max_subscribers = max_subscribers
+        self.max_events = max_events
+        self.subscriptions: Dict[int, Set[Subscription]] = {}
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def subscribe(self, post_id: int) -> Subscription:
+
+        """
+
+        Return a new subscription to the comments of ``post_id``.
+
+        Raises TooManySubscribers if the process holds
+        ``max_subscribers`` subscriptions already.
+
+        """
+
+        subscription = Subscription(post_id, self.max_events)
+
+        with self.lock:
+            if self.count >= self.max_subscribers:
+                raise TooManySubscribers()
+
+            self.subscriptions.setdefault(post_id, set()).add(subscription)
+            self.count += 1
+
+        STREAM_SUBSCRIBERS.inc()
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+
+        subscription.close()
+
+        with self.lock:
+            subscribers = self.subscriptions.get(subscription.post_id)
+
+            if subscribers is None or subscription not in subscribers:
+                return
+
+            subscribers.discard(subscription)
+            self.count -= 1
+
+            if not subscribers:
+                del self.subscriptions[subscription.post_id]
+
+        STREAM_SUBSCRIBERS.dec()
+
+    def deliver(self, post_id: int, event: Event) -> int:
+
+        """
+
+        Push ``event`` to the subscribers of ``post_id`` and return how
+        many received it. Subscribers whose buffer overflows are dropped.
+
+        """
+
+        with self.lock:
+            subscribers = list(self.subscriptions.get(post_id, ()))
+
+        delivered = 0
+
+        for subscription in subscribers:
+            if subscription.push(event):
+                delivered += 1
+            else:
+                STREAM_CLOSED.inc('overflow')
+                self.unsubscribe(subscription)
+
+        return delivered
+
+    def clear(self) -> None:
+
+        with self.lock:
+            subscribers = [subscription
+                           for subscriptions in self.subscriptions.values()
+                           for subscription in subscriptions]
+
+        for subscription in subscribers:
+            self.unsubscribe(subscription)
+
+
+BROKER = Broker(
+    max_subscribers=getattr(settings, 'POSTS_STREAM_MAX_SUBSCRIBERS', 1000),
+    max_events=getattr(settings, 'POSTS_STREAM_QUEUE_SIZE', 100),
+)
+
+
+class LocalBackend:
+
+    """
+    Publishes to the broker of this process.
+
+    """
+
+    def publish(self, post_id: int, event: Event) -> None:
+
+        BROKER.deliver(post_id, event)
+
+    def listen(self) -> None:
+
+        pass
+
+
+class PostgresBackend:
+
+    """
+    Publishes with NOTIFY and delivers the notifications of every process.
+
+    """
+
+    def __init__(self, alias: str, channel: str) -> None:
+
+        self.alias = alias
+        self.channel = channel
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+
+    def publish(self, post_id: int, event: Event) -> None:
+
+        comment_id, data = event
+        message = {'post_id': post_id, 'id': comment_id, 'data': data}
+        payload = json.dumps(message)
+
+        if len(payload.encode()) > MAX_PAYLOAD:
+            del message['data']
+            payload = json.dumps(message)
+
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, payload])
+
+    def listen(self) -> None:
+
+        """Start the listening thread of this process unless running."""
+
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name='comment-stream-listener',
+                    daemon=True)
+                self.thread.start()
+
+    def run(self) -> None:
+
+        while True:
+            try:
+                self.listen_once()
+            except Exception:
+                logger.exception("Comment stream listener failed; "
+                                 "reconnecting")
+            time.sleep(1)
+
+    def listen_once(self) -> None:
+
+        # Only needed by processes serving streams.
+        import psycopg
+        from psycopg import sql
+
+        database = connections[self.alias].settings_dict
+        params = {
+            'dbname': database['NAME'],
+            'user': database['USER'],
+            'password': database['PASSWORD'],
+            'host': database['HOST'],
+            'port': database['PORT'],
+        }
+
+        params = {key: value for key, value in params.items() if value}
+
+        with psycopg.connect(autocommit=True, **params) as connection:
+            connection.execute(sql.SQL('LISTEN {}').format(
+                sql.Identifier(self.channel)))
+
+            for notify in connection.notifies():
+                self.deliver(json.loads(notify.payload))
+
+    def deliver(self, message: Dict[str, Any]) -> None:
+
+        data = message.get('data')
+
+        if data is None:
+            close_old_connections()
+            comment = Comment.objects.filter(id=message['id']).first()
+
+            if comment is None:
+                return
+
+            data = serialize(comment)
+
+        BROKER.deliver(message['post_id'], (message['id'], data))
+
+
+_backend: Any = None
+
+
+def get_backend() -> Any:
+
+    """Return the backend selected by ``POSTS_STREAM_BACKEND``."""
+
+    global _backend
+
+    if _backend is None:
+        if getattr(settings, 'POSTS_STREAM_BACKEND', 'local') == 'postgres':
+            _backend = PostgresBackend(
+                getattr(settings, 'POSTS_STREAM_DATABASE', 'default'),
+                getattr(settings, 'POSTS_STREAM_CHANNEL', 'posts_comments'))
+        else:
+            _backend = LocalBackend()
+
+    return _backend
+
+
+@receiver(setting_changed)
+def reset_backend(*, setting: str, **kwargs: Any) -> None:
+
+    """Select the backend again when tests change its settings."""
+
+    global _backend
+
+    if setting.startswith('POSTS_STREAM_'):
+        _backend = None
+
+
+def serialize(comment: Comment) -> str:
+
+    return json.dumps(CommentOut.from_orm(comment).dict())
+
+
+def publish_comments(comments: List[Comment]) -> None:
+
+    """
+
+    Push the visible ``comments`` to the streams of their posts.
+
+    Call once the comments are committed, e.g. from
+    ``transaction.on_commit``.
+
+    """
+
+    backend = get_backend()
+
+    for comment in comments:
+        if not comment.is_blocked:
+            backend.publish(comment.post_id,
+                            (comment.id, serialize(comment)))
+
+
+def subscribe(post_id: int) -> Subscription:
+
+    """
+
+    Subscribe to the comments of ``post_id``, listening for notifications
+    of other processes first.
+
+    Raises TooManySubscribers if this process holds
+    ``POSTS_STREAM_MAX_SUBSCRIBERS`` streams already.
+
+    """
+
+    get_backend().listen()
+
+    try:
+        return BROKER.subscribe(post_id)
+    except TooManySubscribers:
+        STREAM_CLOSED.inc('full')
+        raise
+
+
+async def missed_comments(post_id: int,
+                          last_id: int,
+                          ) -> Tuple[List[Event], bool]:
+
+    """
+
+    Return the events of the visible comments of ``post_id`` created
+    after comment ``last_id``, at most ``POSTS_STREAM_BACKLOG``, and
+    whether more were left out.
+
+    """
+
+    limit = getattr(settings, 'POSTS_STREAM_BACKLOG', 100)
+    comments = (Comment.objects.filter(post_id=post_id, id__gt=last_id)
+                .order_by('id')[:limit + 1])
+    events = [(comment.id, serialize(comment)) async for comment in comments]
+
+    return events[:limit], len(events) > limit
+
+
+def format_event(event: Event) -> str:
+
+    comment_id, data = event
+
+    return f"id: {comment_id}\nevent: comment\ndata: {data}\n\n"
+
+
+class EventStream:
+
+    """
+    The SSE messages of a subscription, for a ``StreamingHttpResponse``.
+
+    Closing the response releases the subscription, whether the client
+    disconnected or the stream ended.
+
+    With ``partial``, the backlog holds only the oldest missed comments:
+    the stream ends after it, and the client reconnects with the id of
+    the last one to receive the next.
+
+    """
+
+    def __init__(self, subscription: Subscription,
+                 backlog: List[Event],
+                 partial: bool = False) -> None:
+
+        self.subscription = subscription
+        self.backlog = backlog
+        self.partial = partial
+
+    def __aiter__(self) -> AsyncIterator[str]:
+
+        return self.messages()
+
+    async def messages(self) -> AsyncIterator[str]:
+
+        """
+
+        Yield the ``backlog`` of missed comments, then the comments of
+        the subscription as they arrive.
+
+        A comment is sent as a keep-alive every ``POSTS_STREAM_KEEPALIVE``
+        seconds without comments. The stream ends after a partial
+        backlog, and when the subscription is dropped for falling behind.
+
+        """
+
+        keepalive = getattr(settings, 'POSTS_STREAM_KEEPALIVE', 15)
+        backlog_id = self.backlog[-1][0] if self.backlog else 0
+
+        try:
+            yield f"retry: {RETRY}\n\n"
+
+            for event in self.backlog:
+                yield format_event(event)
+
+            # Live comments would skip the ones not sent yet.
+            while not self.partial:
+                try:
+                    event = await self.subscription.get(keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                if event is None:
+                    break
+
+                # Published while the backlog was read.
+                if event[0] <= backlog_id:
+                    continue
+
+                yield format_event(event)
+        finally:
+            self.close()
+
+    def close(self) -> None:
+
+        BROKER.unsubscribe(self.subscription)
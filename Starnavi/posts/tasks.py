@@ -0,0 +1,401 @@
+"""
+tasks.py
+
+In-process background workers that process submitted items in batches.
+
+A ``BatchWorker`` owns a queue and a daemon thread started on first use.
+The thread waits for an item, then keeps collecting items for up to
+``max_wait`` seconds or until ``batch_size`` items are queued, and passes
+the whole batch to its handler. Work still queued when the process exits
+is lost, so handlers must only do work that can be rebuilt or retried.
+
+A ``TimerScheduler`` holds items until a delay has passed. Due times are
+rounded up to a tick, kept in one heap and fired by one daemon thread,
+so every item due in the same tick reaches the handler as one batch.
+
+A ``WriteBehindCounter`` sums increments per key in memory and hands the
+accumulated deltas to its handler every ``interval`` seconds and at exit.
+Deltas not yet handed over are lost if the process is killed.
+
+With ``POSTS_BACKGROUND_TASKS_EAGER`` set, items are handled inline in
+the submitting thread instead (useful for tests and management commands).
+
+"""
+
+import atexit
+import heapq
+import logging
+import math
+import queue
+import threading
+import time
+from time import monotonic
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from posts.metrics import BACKGROUND_DROPPED, BACKGROUND_QUEUE_DEPTH, Gauge
+
+
+logger = logging.getLogger("posts.tasks")
+
+
+class BatchWorker:
+
+    """
+    Queue plus daemon thread handing items to ``handler`` in batches.
+
+    """
+
+    def __init__(self,
+                 name: str,
+                 handler: Callable[[List[Any]], None],
+                 batch_size: int = 500,
+                 max_wait: float = 0.05,
+                 ) -> None:
+
+        self.name = name
+        self.handler = handler
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.queue: "queue.Queue[Any]" = queue.Queue()
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+
+    def submit(self, item: Any) -> None:
+
+        """Queue ``item`` for the next batch."""
+
+        if getattr(settings, "POSTS_BACKGROUND_TASKS_EAGER", False):
+            self.handler([item])
+            return
+
+        self.start()
+        BACKGROUND_QUEUE_DEPTH.inc(self.name)
+        self.queue.put(item)
+
+    def start(self) -> None:
+
+        """Start the worker thread if it is not running."""
+
+        if self.thread is not None and self.thread.is_alive():
+            return
+
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name=f"posts-{self.name}", daemon=True)
+                self.thread.start()
+
+    def join(self) -> None:
+
+        """Block until every submitted item has been handled."""
+
+        self.queue.join()
+
+    @property
+    def depth(self) -> int:
+
+        """Number of items waiting to be handled."""
+
+        return self.queue.qsize()
+
+    def collect(self) -> List[Any]:
+
+        """Wait for one item, then gather a batch behind it."""
+
+        batch = [self.queue.get()]
+        deadline = monotonic() + self.max_wait
+
+        while len(batch) < self.batch_size:
+            remaining = deadline - monotonic()
+
+            try:
+                if remaining > 0:
+                    batch.append(self.queue.get(timeout=remaining))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return batch
+
+    def run(self) -> None:
+
+        while True:
+            batch = self.collect()
+
+            try:
+                self.handler(batch)
+            except Exception:
+                logger.exception("%s worker failed on a batch of %d items",
+                                 self.name, len(batch))
+            finally:
+                BACKGROUND_QUEUE_DEPTH.dec(self.name, amount=len(batch))
+
+                for _ in batch:
+                    self.queue.task_done()
+
+                close_old_connections()
+
+
+class TimerScheduler:
+
+    """
+    Heap of delayed items plus a daemon thread firing them tick by tick.
+
+    A pending item is stored as a ``(due_tick, sequence, item)`` tuple;
+    with an integer item that is about 170 bytes including its heap slot.
+    At most ``max_pending`` items are held; ``schedule`` refuses the rest.
+
+    """
+
+    def __init__(self,
+                 name: str,
+                 handler: Callable[[List[Any]], None],
+                 tick: float = 0.1,
+                 max_pending: int = 100_000,
+                 gauge: Optional[Gauge] = None,
+                 ) -> None:
+
+        self.name = name
+        self.handler = handler
+        self.tick = tick
+        self.max_pending = max_pending
+        self.gauge = gauge
+        self.heap: List[Tuple[int, int, Any]] = []
+        self.sequence = 0
+        self.running = 0
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+
+    def _gauge(self, amount: int) -> None:
+
+        if self.gauge is None:
+            BACKGROUND_QUEUE_DEPTH.inc(self.name, amount=amount)
+        else:
+            self.gauge.inc(amount=amount)
+
+    def schedule(self, item: Any, delay: float) -> bool:
+
+        """
+
+        Hand ``item`` to the handler once ``delay`` seconds have passed.
+
+        Returns False, without scheduling, if ``max_pending`` items are
+        already waiting.
+
+        """
+
+        if getattr(settings, "POSTS_BACKGROUND_TASKS_EAGER", False):
+            self.handler([item])
+            return True
+
+        due_tick = math.ceil((monotonic() + max(delay, 0)) / self.tick)
+
+        with self.condition:
+            if len(self.heap) >= self.max_pending:
+                BACKGROUND_DROPPED.inc(self.name)
+                logger.warning("%s scheduler is full, dropping an item",
+                               self.name)
+                return False
+
+            self.sequence += 1
+            heapq.heappush(self.heap, (due_tick, self.sequence, item))
+            self.condition.notify_all()
+
+        self._gauge(1)
+        self.start()
+
+        return True
+
+    def start(self) -> None:
+
+        """Start the timer thread if it is not running."""
+
+        with self.condition:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name=f"posts-{self.name}", daemon=True)
+                self.thread.start()
+
+    @property
+    def depth(self) -> int:
+
+        """Number of items waiting for their due time."""
+
+        return len(self.heap)
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+
+        """
+
+        Block until every scheduled item has been handled. Returns False
+        if ``timeout`` seconds passed first.
+
+        """
+
+        deadline = None if timeout is None else monotonic() + timeout
+
+        with self.condition:
+            while self.heap or self.running:
+                remaining = None if deadline is None else deadline - monotonic()
+
+                if remaining is not None and remaining <= 0:
+                    return False
+
+                self.condition.wait(remaining)
+
+        return True
+
+    def collect(self) -> List[Any]:
+
+        """Wait for the next tick with due items and pop all of them."""
+
+        with self.condition:
+            while True:
+                if self.heap:
+                    wait = self.heap[0][0] * self.tick - monotonic()
+
+                    if wait <= 0:
+                        break
+
+                    self.condition.wait(wait)
+                else:
+                    self.condition.wait()
+
+            now = monotonic()
+            batch = []
+
+            while self.heap and self.heap[0][0] * self.tick <= now:
+                batch.append(heapq.heappop(self.heap)[2])
+
+            self.running = len(batch)
+
+        return batch
+
+    def run(self) -> None:
+
+        while True:
+            batch = self.collect()
+
+            try:
+                self.handler(batch)
+            except Exception:
+                logger.exception("%s scheduler failed on a batch of %d items",
+                                 self.name, len(batch))
+            finally:
+                self._gauge(-len(batch))
+
+                with self.condition:
+                    self.running = 0
+                    self.condition.notify_all()
+
+                close_old_connections()
+
+
+class WriteBehindCounter:
+
+    """
+    Per-key counters buffered in memory and flushed periodically.
+
+    """
+
+    def __init__(self,
+                 name: str,
+                 handler: Callable[[Dict[Hashable, int]], None],
+                 interval: float = 5.0,
+                 ) -> None:
+
+        self.name = name
+        self.handler = handler
+        self.interval = interval
+        self.deltas: Dict[Hashable, int] = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+
+        # Once per counter, however often the flush thread is restarted.
+        atexit.register(self.run_once)
+
+    def add(self, key: Hashable, amount: int = 1) -> None:
+
+        """Add ``amount`` to the counter of ``key``."""
+
+        if getattr(settings, "POSTS_BACKGROUND_TASKS_EAGER", False):
+            self.handler({key: amount})
+            return
+
+        with self.lock:
+            new = key not in self.deltas
+            self.deltas[key] = self.deltas.get(key, 0) + amount
+
+        if new:
+            BACKGROUND_QUEUE_DEPTH.inc(self.name)
+
+        self.start()
+
+    def start(self) -> None:
+
+        """Start the flush thread if it is not running."""
+
+        if self.thread is not None and self.thread.is_alive():
+            return
+
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name=f"posts-{self.name}", daemon=True)
+                self.thread.start()
+
+    @property
+    def depth(self) -> int:
+
+        """Number of keys with buffered increments."""
+
+        return len(self.deltas)
+
+    def flush(self) -> int:
+
+        """
+
+        Hand the buffered deltas to the handler and return how many keys
+        they cover. Deltas are put back if the handler fails.
+
+        """
+
+        with self.flush_lock:
+            with self.lock:
+                deltas, self.deltas = self.deltas, {}
+
+            if not deltas:
+                return 0
+
+            try:
+                self.handler(deltas)
+            except Exception:
+                with self.lock:
+                    for key, amount in deltas.items():
+                        self.deltas[key] = self.deltas.get(key, 0) + amount
+
+                raise
+            finally:
+                BACKGROUND_QUEUE_DEPTH.set(len(self.deltas), self.name)
+
+        return len(deltas)
+
+    def run_once(self) -> None:
+
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("%s counter failed to flush", self.name)
+        finally:
+            close_old_connections()
+
+    def run(self) -> None:
+
+        while True:
+            time.sleep(self.interval)
+            self.run_once()
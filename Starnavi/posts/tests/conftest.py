@@ -0,0 +1,39 @@
+import pytest
+
+from django.contrib.auth.models import User
+
+from posts.ratelimit import MEMORY_LIMITER
+from posts.services import create_jwt_token
+
+
+@pytest.fixture(autouse=True)
+def reset_rate_limits():
+
+    """
+
+    Fixture starting every test with fresh in-memory rate limits, since
+    user ids are reused between tests.
+
+    """
+
+    MEMORY_LIMITER.clear()
+    yield
+    MEMORY_LIMITER.clear()
+
+
+@pytest.fixture
+def auth_client(client, db):
+
+    """
+
+    Fixture authenticating the client as a new user, available as
+    ``auth_client.user``.
+
+    """
+
+    user = User.objects.create_user(username='member',
+                                    password='password123')
+    client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {create_jwt_token(user)}'
+    client.user = user
+
+    return client
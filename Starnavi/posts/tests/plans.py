@@ -0,0 +1,47 @@
+"""
+plans.py
+
+Query plan helpers for the tests asserting which index a query reads.
+
+"""
+
+import re
+
+from django.db import connection, transaction
+
+
+# "Index Scan using x", "Bitmap Index Scan on x" (PostgreSQL) and
+# "USING INDEX x", "USING COVERING INDEX x" (SQLite).
+INDEX_PATTERN = re.compile(
+    r'(?:Index (?:Only )?Scan using|Index Scan on|USING (?:COVERING )?INDEX)'
+    r' (\w+)')
+
+
+def explain(queryset):
+
+    """
+
+    Return the query plan of ``queryset``.
+
+    On PostgreSQL sequential scans are disfavoured, so small test tables
+    are planned like large ones. The setting is local to a transaction
+    rolled back with it, and never leaks into later queries.
+
+    """
+
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+        plan = queryset.explain()
+        transaction.set_rollback(True)
+
+    return plan
+
+
+def indexes_used(plan):
+
+    """Return the names of the indexes read by ``plan``."""
+
+    return set(INDEX_PATTERN.findall(plan))
@@ -0,0 +1,266 @@
+import json
+
+import pytest
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from posts.models import AutoReplyLog, Comment, Post
+from posts.services import create_jwt_token, send_auto_replies
+
+
+@pytest.fixture
+def author(db):
+
+    """
+
+    Fixture to create the author of the posts.
+
+    """
+
+    return User.objects.create_user(username='author', password='password123')
+
+
+@pytest.fixture
+def commenters(db):
+
+    """
+
+    Fixture to create three commenters.
+
+    """
+
+    return [User.objects.create_user(username=name, password='password123')
+            for name in ('alice', 'bob', 'carol')]
+
+
+def make_post(author, **options):
+
+    """Create a post with auto-replies enabled."""
+
+    return Post.objects.create(title='Post', content='Content', author=author,
+                               auto_reply_enabled=True,
+                               auto_reply_text='Thanks!', **options)
+
+
+def comment(post, user):
+
+    """Create a comment on ``post`` by ``user`` and return its id."""
+
+    return Comment.objects.create(post=post, author=user, content='Hi').id
+
+
+def replies(post):
+
+    """Return the contents of the automatic replies on ``post``."""
+
+    return list(Comment.objects.filter(post=post, author=post.author)
+                .order_by('id').values_list('content', flat=True))
+
+
+@pytest.mark.django_db
+def test_per_commenter_policy_answers_each_commenter_once(author, commenters):
+
+    """
+
+    Test that a per-commenter post answers a commenter only once.
+
+    """
+
+    alice, bob, _ = commenters
+    post = make_post(author, auto_reply_policy='per_commenter')
+
+    send_auto_replies([comment(post, alice), comment(post, alice),
+                       comment(post, bob)])
+
+    assert replies(post) == ['Thanks!', 'Thanks!']
+
+    send_auto_replies([comment(post, alice)])
+
+    assert len(replies(post)) == 2
+
+    assert set(AutoReplyLog.objects.values_list('commenter_id', flat=True)) == {
+        alice.id, bob.id}
+
+
+@pytest.mark.django_db
+def test_max_replies_per_window(author, commenters):
+
+    """
+
+    Test that replies stop once the window's limit is reached.
+
+    """
+
+    post = make_post(author, auto_reply_max_per_window=2)
+
+    send_auto_replies([comment(post, user) for user in commenters])
+
+    assert len(replies(post)) == 2
+
+    send_auto_replies([comment(post, commenters[0])])
+
+    assert len(replies(post)) == 2
+
+    assert Post.objects.get(id=post.id).comment_count == 2
+
+
+@pytest.mark.django_db
+def test_coalesce_policy_sends_one_reply_per_burst(author, commenters):
+
+    """
+
+    Test that a burst of comments gets one reply mentioning everyone.
+
+    """
+
+    post = make_post(author, auto_reply_policy='coalesce')
+    burst = [comment(post, user) for user in commenters]
+
+    send_auto_replies(burst)
+
+    assert replies(post) == ['Thanks! @alice @bob @carol']
+
+    send_auto_replies(burst)
+
+    assert len(replies(post)) == 1
+
+    send_auto_replies([comment(post, commenters[1])])
+
+    assert replies(post)[-1] == 'Thanks! @bob'
+
+
+@pytest.mark.django_db
+def test_coalesce_policy_caps_mentions(author, commenters, settings):
+
+    """
+
+    Test that a coalesced reply names at most the configured commenters.
+
+    """
+
+    settings.POSTS_AUTO_REPLY_MAX_MENTIONS = 2
+    post = make_post(author, auto_reply_policy='coalesce')
+
+    send_auto_replies([comment(post, user) for user in commenters])
+
+    assert replies(post) == ['Thanks! @alice @bob and others']
+
+
+@pytest.mark.django_db
+def test_coalesced_posts_read_their_commenters_together(author, commenters,
+                                                        settings):
+
+    """
+
+    Test that a batch reads the commenters of all coalescing posts in one
+    query, capping mentions per post and never naming the post's author.
+
+    """
+
+    settings.POSTS_AUTO_REPLY_MAX_MENTIONS = 2
+    alice, bob, carol = commenters
+
+    def burst(post):
+        return [comment(post, user) for user in (author, carol, bob, alice)]
+
+    single = make_post(author, auto_reply_policy='coalesce')
+    ids = burst(single)
+
+    with CaptureQueriesContext(connection) as one_post:
+        send_auto_replies(ids)
+
+    posts = [make_post(author, auto_reply_policy='coalesce')
+             for _ in range(3)]
+    ids = [comment_id for post in posts for comment_id in burst(post)]
+
+    with CaptureQueriesContext(connection) as three_posts:
+        send_auto_replies(ids)
+
+    assert len(three_posts) == len(one_post)
+
+    for post in [single, *posts]:
+        assert replies(post) == ['Hi', 'Thanks! @alice @bob and others']
+
+
+@pytest.mark.django_db
+def test_coalesce_policy_ignores_the_authors_own_comments(author, commenters):
+
+    """
+
+    Test that the author's comments alone get no coalesced reply, and that
+    every reply sent is logged against the window's limit.
+
+    """
+
+    post = make_post(author, auto_reply_policy='coalesce',
+                     auto_reply_max_per_window=1)
+
+    for _ in range(3):
+        send_auto_replies([comment(post, author)])
+
+    send_auto_replies([comment(post, commenters[1])])
+    send_auto_replies([comment(post, commenters[2])])
+
+    assert replies(post) == ['Hi', 'Hi', 'Hi', 'Thanks! @bob']
+
+    assert AutoReplyLog.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_auto_replies_are_not_answered(author, commenters):
+
+    """
+
+    Test that an automatic reply never triggers another one.
+
+    """
+
+    post = make_post(author)
+
+    send_auto_replies([comment(post, commenters[0])])
+
+    reply_id = AutoReplyLog.objects.get().reply_id
+
+    send_auto_replies([reply_id])
+
+    assert len(replies(post)) == 1
+
+
+@pytest.mark.django_db
+def test_create_post_with_auto_reply_policy(client, author):
+
+    """
+
+    Test setting the auto-reply policy through the API.
+
+    """
+
+    headers = {'HTTP_AUTHORIZATION': f'Bearer {create_jwt_token(author)}'}
+    data = {
+        'title': 'Post',
+        'content': 'Content',
+        'auto_reply_enabled': True,
+        'auto_reply_text': 'Thanks!',
+        'auto_reply_policy': 'coalesce',
+        'auto_reply_max_per_window': 5,
+        'auto_reply_window': 60,
+    }
+
+    response = client.post('/api/posts/', json.dumps(data),
+                           content_type='application/json', **headers)
+
+    assert response.status_code == 201
+
+    post = Post.objects.get(id=response.json()['id'])
+
+    assert (post.auto_reply_policy, post.auto_reply_max_per_window,
+            post.auto_reply_window) == ('coalesce', 5, 60)
+
+    data['auto_reply_policy'] = 'sometimes'
+
+    response = client.post('/api/posts/', json.dumps(data),
+                           content_type='application/json', **headers)
+
+    assert response.status_code == 422
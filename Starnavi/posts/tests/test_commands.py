@@ -0,0 +1,185 @@
+import pytest
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.contrib.auth.models import User
+
+from posts.loadtest import (
+    NinjaClientDriver, format_report, percentile, run_load_test)
+from posts.duplicates import signature_fields, simhash
+from posts.models import Post, Comment
+from posts.services import update_trending
+
+
+@pytest.mark.django_db
+def test_seed_data_creates_rows():
+
+    """
+
+    Test that seed_data creates the requested users and posts.
+
+    """
+
+    call_command('seed_data', users=5, posts=20, comments_per_post=3,
+                 seed=1, batch_size=7)
+
+    assert User.objects.filter(username__startswith='seed1_').count() == 5
+
+    assert Post.all_objects.count() == 20
+
+    assert Comment.objects.count() > 0
+
+
+@pytest.mark.django_db
+def test_seed_data_scores_trending_posts():
+
+    """
+
+    Test that a seeded database has trending posts without waiting for
+    update_trending.
+
+    """
+
+    call_command('seed_data', users=5, posts=20, comments_per_post=5, seed=4,
+                 days=1)
+
+    scores = dict(Post.objects.values_list('id', 'trending_score'))
+
+    assert any(score > 0 for score in scores.values())
+
+    update_trending()
+
+    assert dict(Post.objects.values_list('id', 'trending_score')) == (
+        pytest.approx(scores, rel=1e-3))
+
+
+@pytest.mark.django_db
+def test_seed_data_signs_comments():
+
+    """
+
+    Test that seeded comments carry the signature duplicate detection
+    compares new comments against.
+
+    """
+
+    call_command('seed_data', users=5, posts=20, comments_per_post=3, seed=2)
+
+    comments = Comment.all_objects.all()
+
+    assert any(comment.simhash is not None for comment in comments)
+
+    for comment in comments:
+        fields = signature_fields(simhash(comment.content))
+
+        assert comment.simhash == fields.get('simhash')
+        assert comment.simhash_band0 == fields.get('simhash_band0')
+
+
+@pytest.mark.django_db
+def test_seed_data_is_deterministic():
+
+    """
+
+    Test that equal seeds produce the same content.
+
+    """
+
+    call_command('seed_data', users=3, posts=10, comments_per_post=2, seed=7)
+
+    first = list(Post.objects.order_by('id').values_list('title', flat=True))
+
+    Post.objects.all().delete()
+    User.objects.all().delete()
+
+    call_command('seed_data', users=3, posts=10, comments_per_post=2, seed=7)
+
+    second = list(Post.objects.order_by('id').values_list('title', flat=True))
+
+    assert first == second
+
+
+@pytest.mark.django_db
+def test_seed_data_rejects_reused_seed():
+
+    """
+
+    Test that seeding twice with the same seed is refused.
+
+    """
+
+    call_command('seed_data', users=2, posts=1, comments_per_post=0, seed=3)
+
+    with pytest.raises(CommandError):
+        call_command('seed_data', users=2, posts=1, comments_per_post=0,
+                     seed=3)
+
+
+def test_percentile():
+
+    """
+
+    Test the nearest-rank percentile helper.
+
+    """
+
+    values = [float(i) for i in range(1, 101)]
+
+    assert percentile(values, 50) == 50.0
+
+    assert percentile(values, 99) == 99.0
+
+    assert percentile([], 95) == 0.0
+
+
+@pytest.mark.django_db
+def test_load_test_covers_every_endpoint():
+
+    """
+
+    Test that the load harness exercises every endpoint without errors.
+
+    """
+
+    results = run_load_test(NinjaClientDriver(), requests=2)
+
+    assert {result.name for result in results} == {
+        'register', 'login', 'create_post', 'list_posts',
+        'create_comment', 'list_comments', 'comments_daily_breakdown',
+        'get_post', 'list_trending_posts', 'post_comment_counts',
+        'like_post', 'unlike_post', 'like_comment', 'unlike_comment',
+        'list_reactions', 'follow', 'unfollow', 'feed', 'notifications',
+        'read_notifications', 'jwks', 'metrics', 'list_profiles',
+        'blocked_content', 'export',
+    }
+
+    for result in results:
+        assert len(result.latencies) == 2
+
+        assert result.errors == 0
+
+
+@pytest.mark.django_db
+def test_load_test_lifts_rate_limits_in_process(settings):
+
+    """
+
+    Test that in-process runs are not rate limited unless asked to be,
+    and that 429 responses are counted apart from errors.
+
+    """
+
+    settings.POSTS_RATE_LIMITS = {'posts': '5/m'}
+
+    [result] = run_load_test(NinjaClientDriver(), requests=10,
+                             only=['create_post'])
+
+    assert (result.errors, result.rate_limited) == (0, 0)
+
+    [result] = run_load_test(NinjaClientDriver(rate_limits=True),
+                             requests=10, only=['create_post'],
+                             username='limited')
+
+    assert result.errors == 0
+    assert result.rate_limited == 6
+    assert '429' in format_report([result])
@@ -0,0 +1,172 @@
+import re
+
+import pytest
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Count
+
+from posts.models import Comment, Post
+from posts.services import comment_counts
+from posts.tests.plans import explain
+
+
+def add_comments(post, author, visible, blocked):
+
+    """Add comments to ``post`` and keep its ``comment_count`` in step."""
+
+    Comment.objects.bulk_create(
+        [Comment(post=post, author=author, content='Nice',
+                 is_blocked=False) for _ in range(visible)]
+        + [Comment(post=post, author=author, content='Rude',
+                   is_blocked=True) for _ in range(blocked)])
+
+    Post.all_objects.filter(id=post.id).update(comment_count=visible)
+
+
+@pytest.mark.django_db
+def test_comment_counts_returns_total_and_blocked(auth_client):
+
+    """
+
+    Test that every requested post gets its total and blocked counts, in
+    the requested order.
+
+    """
+
+    user = auth_client.user
+    first = Post.objects.create(title='First', content='Text', author=user)
+    second = Post.objects.create(title='Second', content='Text', author=user)
+    empty = Post.objects.create(title='Empty', content='Text', author=user)
+    add_comments(first, user, visible=3, blocked=2)
+    add_comments(second, user, visible=0, blocked=1)
+
+    response = auth_client.get('/api/posts/comment-counts/',
+                               {'ids': f'{empty.id},{second.id},{first.id}'})
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {'post_id': empty.id, 'total': 0, 'blocked': 0},
+        {'post_id': second.id, 'total': 1, 'blocked': 1},
+        {'post_id': first.id, 'total': 5, 'blocked': 2},
+    ]
+
+
+@pytest.mark.django_db
+def test_comment_counts_leaves_out_unknown_and_blocked_posts(auth_client):
+
+    """
+
+    Test that missing and blocked posts are not in the response.
+
+    """
+
+    user = auth_client.user
+    post = Post.objects.create(title='Post', content='Text', author=user)
+    blocked = Post.objects.create(title='Blocked', content='Text',
+                                  author=user, is_blocked=True)
+
+    response = auth_client.get(
+        '/api/posts/comment-counts/',
+        {'ids': f'{post.id},{blocked.id},{post.id},999999'})
+
+    assert response.status_code == 200
+    assert response.json() == [{'post_id': post.id, 'total': 0, 'blocked': 0}]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('ids', ['', '1,two', '1,,2'])
+def test_comment_counts_rejects_invalid_ids(auth_client, ids):
+
+    """
+
+    Test that malformed id lists are rejected.
+
+    """
+
+    response = auth_client.get('/api/posts/comment-counts/', {'ids': ids})
+
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_comment_counts_caps_the_number_of_ids(auth_client, settings):
+
+    """
+
+    Test that more than ``POSTS_COMMENT_COUNTS_MAX_IDS`` ids are rejected.
+
+    """
+
+    settings.POSTS_COMMENT_COUNTS_MAX_IDS = 3
+
+    response = auth_client.get('/api/posts/comment-counts/',
+                               {'ids': '1,2,3,4'})
+
+    assert response.status_code == 400
+    assert response.json() == {'error': 'At most 3 ids are allowed.'}
+
+    response = auth_client.get('/api/posts/comment-counts/',
+                               {'ids': '1,2,3,3'})
+
+    assert response.status_code == 200
+
+
+def test_comment_counts_requires_authentication(client):
+
+    """
+
+    Test that anonymous requests are rejected.
+
+    """
+
+    response = client.get('/api/posts/comment-counts/', {'ids': '1'})
+
+    assert response.status_code == 401
+
+
+@pytest.mark.django_db
+def test_comment_counts_reads_in_one_query(django_assert_num_queries):
+
+    """
+
+    Test that the counts of many posts are read in a single query.
+
+    """
+
+    user = User.objects.create_user(username='author', password='secret')
+    posts = [Post.objects.create(title=f'Post {i}', content='Text',
+                                 author=user) for i in range(20)]
+
+    for post in posts:
+        add_comments(post, user, visible=2, blocked=1)
+
+    with django_assert_num_queries(1):
+        counts = comment_counts([post.id for post in posts])
+
+    assert len(counts) == 20
+
+
+@pytest.mark.django_db
+def test_comment_counts_only_reads_the_blocked_comments_index():
+
+    """
+
+    Test that blocked comments are counted from their partial index
+    without reading the comment table.
+
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+    blocked = (Comment.all_objects.filter(post_id=1, is_blocked=True)
+               .values('post').annotate(count=Count('pk')).values('count'))
+
+    plan = explain(blocked)
+
+    if connection.vendor == 'postgresql':
+        assert 'Index Only Scan using comment_blocked_post_idx' in plan
+    else:
+        assert re.search(r'USING COVERING INDEX comment_blocked_post_idx',
+                         plan), plan
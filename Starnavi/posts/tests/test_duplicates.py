@@ -0,0 +1,207 @@
+import pytest
+
+from django.contrib.auth.models import User
+
+from posts import metrics
+from posts.duplicates import find_duplicate, signature_fields, simhash
+from posts.models import Comment, Post
+from posts.services import create_jwt_token
+
+
+SPAM = ("Earn money fast from home with this one simple trick, "
+        "visit my profile for the link and start today")
+
+
+@pytest.fixture
+def post(db):
+
+    """
+
+    Fixture to create a post by a freshly registered user.
+
+    """
+
+    author = User.objects.create_user(username='author',
+                                      password='password123')
+
+    return Post.objects.create(title='Post', content='Content', author=author)
+
+
+@pytest.fixture
+def bot_client(client, db):
+
+    """
+
+    Fixture authenticating the client as another user.
+
+    """
+
+    bot = User.objects.create_user(username='bot', password='password123')
+    client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {create_jwt_token(bot)}'
+
+    return client
+
+
+def comment(client, post, content):
+
+    """Create a comment through the API and return its JSON."""
+
+    response = client.post(f"/api/posts/{post.id}/comments/",
+                           {'content': content},
+                           content_type='application/json')
+
+    assert response.status_code == 201
+
+    return response.json()
+
+
+def distance(a, b):
+
+    return (a ^ b).bit_count()
+
+
+def test_simhash_is_stable_under_small_edits():
+
+    """
+
+    Test that re-formatted and lightly edited texts get close signatures,
+    and unrelated texts distant ones.
+
+    """
+
+    signature = simhash(SPAM)
+
+    assert 0 <= signature < 1 << 64
+    assert simhash("  " + SPAM.upper() + "\n") == signature
+    assert distance(signature, simhash(SPAM.replace("today", "now"))) <= 12
+    assert distance(signature, simhash(
+        "I disagree with the second paragraph, the benchmark numbers "
+        "do not account for the warm cache at all")) > 12
+
+
+def test_short_texts_are_not_signed(settings):
+
+    """
+
+    Test that texts below the minimum length get no signature.
+
+    """
+
+    settings.POSTS_DUPLICATE_MIN_LENGTH = 40
+
+    assert simhash("Great post!") is None
+    assert signature_fields(None) == {}
+
+
+def test_signature_fields_round_trip():
+
+    """
+
+    Test that the stored signed value and bands describe the signature.
+
+    """
+
+    signature = (1 << 63) | 0xABCD
+
+    fields = signature_fields(signature)
+
+    assert fields['simhash'] < 0
+    assert fields['simhash'] % (1 << 64) == signature
+    assert fields['simhash_band0'] == 0xABCD
+    assert fields['simhash_band3'] == 1 << 15
+
+
+def test_find_duplicate_within_distance(post):
+
+    """
+
+    Test that signatures up to the maximum distance are found through a
+    shared band, and farther ones are not.
+
+    """
+
+    signature = simhash(SPAM)
+    existing = Comment.objects.create(post=post, author=post.author,
+                                      content=SPAM,
+                                      **signature_fields(signature))
+
+    # One flipped bit in three of the four bands.
+    close = signature ^ (1 | 1 << 16 | 1 << 32)
+    # One flipped bit in every band.
+    far = close ^ 1 << 48
+
+    assert find_duplicate(signature) == existing.id
+    assert find_duplicate(close) == existing.id
+    assert find_duplicate(far) is None
+
+
+def test_find_duplicate_ignores_old_comments(post, settings):
+
+    """
+
+    Test that only comments within the window are compared.
+
+    """
+
+    signature = simhash(SPAM)
+    Comment.objects.create(post=post, author=post.author, content=SPAM,
+                           **signature_fields(signature))
+    settings.POSTS_DUPLICATE_WINDOW = 0
+
+    assert find_duplicate(signature) is None
+
+
+def test_duplicate_comments_are_flagged(bot_client, post, settings):
+
+    """
+
+    Test that a repeated comment is flagged but kept visible.
+
+    """
+
+    settings.POSTS_DUPLICATE_ACTION = 'flag'
+    flagged = metrics.DUPLICATE_COMMENTS.samples.get(('flag',), 0)
+
+    first = comment(bot_client, post, SPAM)
+    second = comment(bot_client, post, SPAM.replace("link", "url"))
+
+    assert first['is_duplicate'] is False
+    assert second['is_duplicate'] is True
+    assert second['is_blocked'] is False
+    assert metrics.DUPLICATE_COMMENTS.samples[('flag',)] == flagged + 1
+    assert Comment.objects.get(id=second['id']).simhash is not None
+
+
+def test_duplicate_comments_are_blocked(bot_client, post, settings):
+
+    """
+
+    Test that with the block action duplicates are hidden from listings.
+
+    """
+
+    settings.POSTS_DUPLICATE_ACTION = 'block'
+
+    first = comment(bot_client, post, SPAM)
+    second = comment(bot_client, post, SPAM)
+
+    assert second['is_blocked'] is True
+
+    listed = bot_client.get(f"/api/posts/{post.id}/comments/").json()
+
+    assert [c['id'] for c in listed] == [first['id']]
+
+
+def test_short_comments_are_never_duplicates(bot_client, post):
+
+    """
+
+    Test that short repeated comments are accepted unsigned.
+
+    """
+
+    comment(bot_client, post, 'Great post!')
+    second = comment(bot_client, post, 'Great post!')
+
+    assert second['is_duplicate'] is False
+    assert Comment.objects.get(id=second['id']).simhash is None
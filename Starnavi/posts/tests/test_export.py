@@ -0,0 +1,275 @@
+import gzip
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import AsyncClient
+
+from posts import export
+from posts.export import export_watermark, iter_export
+from posts.models import Post, Comment
+from posts.services import create_jwt_token
+
+
+@pytest.fixture
+def staff(db):
+
+    """
+
+    Fixture to create a staff user.
+
+    """
+
+    return User.objects.create_user(username='staff', password='password123',
+                                    is_staff=True)
+
+
+@pytest.fixture
+def content(staff):
+
+    """
+
+    Fixture creating two posts, one blocked, with comments.
+
+    """
+
+    first = Post.objects.create(title='First', content='Content', author=staff)
+    second = Post.objects.create(title='Second', content='Content',
+                                 author=staff, is_blocked=True)
+
+    for post in (second, first, second):
+        Comment.objects.create(post=post, author=staff, content='Comment')
+
+    return first, second
+
+
+def parse(data):
+
+    """Parse NDJSON bytes into a list of records."""
+
+    return [json.loads(line) for line in data.decode().splitlines()]
+
+
+def stream(client, user, **params):
+
+    """Request an export and return the response and its body."""
+
+    headers = {'HTTP_AUTHORIZATION': f'Bearer {create_jwt_token(user)}'}
+    response = client.get('/api/export/', params, **headers)
+
+    return response, b''.join(response.streaming_content)
+
+
+@pytest.mark.django_db
+def test_export_streams_posts_with_their_comments(client, staff, content):
+
+    """
+
+    Test that every post is followed by its comments.
+
+    """
+
+    first, second = content
+
+    response, body = stream(client, staff)
+
+    assert response.status_code == 200
+
+    assert response['Content-Type'] == 'application/x-ndjson'
+
+    records = parse(body)
+
+    assert [(r['type'], r.get('post_id', r['id'])) for r in records] == [
+        ('post', first.id), ('comment', first.id),
+        ('post', second.id), ('comment', second.id), ('comment', second.id)]
+
+    assert records[2]['is_blocked'] is True
+
+    assert 'X-Export-Watermark' in response
+
+
+@pytest.mark.django_db
+def test_export_gzip(client, staff, content):
+
+    """
+
+    Test that a gzipped export holds the same lines.
+
+    """
+
+    _, plain = stream(client, staff)
+    response, body = stream(client, staff, gzip=True)
+
+    assert response['Content-Type'] == 'application/gzip'
+
+    assert gzip.decompress(body) == plain
+
+
+@pytest.mark.django_db
+def test_export_since_watermark(client, staff, content):
+
+    """
+
+    Test that an export since a watermark only holds newer rows.
+
+    """
+
+    first, _ = content
+    response, _ = stream(client, staff)
+    watermark = response['X-Export-Watermark']
+
+    comment = Comment.objects.create(post=first, author=staff, content='New')
+
+    _, body = stream(client, staff, since=watermark)
+
+    assert [(r['type'], r['id']) for r in parse(body)] == [
+        ('comment', comment.id)]
+
+
+@pytest.mark.django_db
+def test_export_since_includes_rows_with_older_created_at(client, staff,
+                                                          content):
+
+    """
+
+    Test that rows inserted after a watermark are exported incrementally
+    whatever their ``created_at``, like imported or late committed ones.
+
+    """
+
+    first, _ = content
+    response, _ = stream(client, staff)
+    watermark = response['X-Export-Watermark']
+
+    old = datetime(2001, 1, 1, tzinfo=timezone.utc)
+    post = Post.objects.create(title='Imported', content='Content',
+                               author=staff, created_at=old)
+    comment = Comment.objects.create(post=first, author=staff,
+                                     content='Imported', created_at=old)
+
+    response, body = stream(client, staff, since=watermark)
+
+    assert [(r['type'], r['id']) for r in parse(body)] == [
+        ('comment', comment.id), ('post', post.id)]
+
+    _, body = stream(client, staff, since=response['X-Export-Watermark'])
+
+    assert body == b''
+
+
+@pytest.mark.django_db
+def test_export_rejects_invalid_watermark(client, staff):
+
+    """
+
+    Test that a malformed ``since`` is rejected.
+
+    """
+
+    response = client.get(
+        '/api/export/', {'since': '2024-01-01T00:00:00'},
+        HTTP_AUTHORIZATION=f'Bearer {create_jwt_token(staff)}')
+
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_export_streams_chunk_by_chunk_under_asgi(
+        client, staff, content, monkeypatch):
+
+    """
+
+    Test that under ASGI the export is streamed as it is read, rather
+    than read whole before the first chunk is sent.
+
+    """
+
+    read = []
+    iter_chunks = export.iter_chunks
+
+    def tracked(lines, **kwargs):
+        for chunk in iter_chunks(lines, size=1, **kwargs):
+            read.append(chunk)
+            yield chunk
+
+    monkeypatch.setattr(export, 'iter_chunks', tracked)
+
+    async def scenario():
+        response = await AsyncClient().get(
+            '/api/export/',
+            headers={'Authorization': f'Bearer {create_jwt_token(staff)}'})
+        assert response.is_async
+
+        chunks = aiter(response.streaming_content)
+        body = [await anext(chunks)]
+        read_before_first = len(read)
+        body += [chunk async for chunk in chunks]
+
+        return response, b''.join(body), read_before_first
+
+    response, body, read_before_first = async_to_sync(scenario)()
+
+    assert response.status_code == 200
+    assert read_before_first == 1
+    assert body == stream(client, staff)[1]
+
+
+@pytest.mark.django_db
+def test_export_requires_staff(client):
+
+    """
+
+    Test that regular users cannot export.
+
+    """
+
+    user = User.objects.create_user(username='user', password='password123')
+    headers = {'HTTP_AUTHORIZATION': f'Bearer {create_jwt_token(user)}'}
+
+    response = client.get('/api/export/', **headers)
+
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_export_reads_with_two_queries(content, django_assert_num_queries):
+
+    """
+
+    Test that the export reads each table with a single cursor.
+
+    """
+
+    watermark = export_watermark()
+
+    with django_assert_num_queries(2):
+        lines = list(iter_export(watermark, chunk_size=1))
+
+    assert len(lines) == 5
+
+
+@pytest.mark.django_db
+def test_export_content_command(tmp_path, content):
+
+    """
+
+    Test writing a gzipped export to a file.
+
+    """
+
+    path = tmp_path / 'export.ndjson.gz'
+
+    call_command('export_content', output=str(path), gzip=True)
+
+    records = parse(gzip.decompress(path.read_bytes()))
+
+    assert len(records) == 5
+
+    call_command('export_content', output=str(path),
+                 since=str(export_watermark()))
+
+    assert path.read_bytes() == b''
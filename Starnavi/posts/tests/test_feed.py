@@ -0,0 +1,215 @@
+import json
+import threading
+
+import pytest
+
+from django.contrib.auth.models import User
+
+from posts.models import FeedEntry, Follow, FollowerCount, Post
+from posts.services import create_jwt_token, fan_out_posts, get_feed
+from posts.tasks import BatchWorker
+
+
+@pytest.fixture
+def users(db):
+
+    """
+
+    Fixture with a reader and an author.
+
+    """
+
+    reader = User.objects.create_user(username='reader', password='pass123')
+    author = User.objects.create_user(username='author', password='pass123')
+
+    return reader, author
+
+
+def auth(user):
+
+    """Return client keyword arguments authenticating ``user``."""
+
+    return {'HTTP_AUTHORIZATION': f'Bearer {create_jwt_token(user)}'}
+
+
+def test_batch_worker_batches_items():
+
+    """
+
+    Test that the background worker hands queued items over in batches.
+
+    """
+
+    batches = []
+    release = threading.Event()
+
+    def handler(batch):
+        release.wait(1)
+        batches.append(batch)
+
+    worker = BatchWorker('test', handler, batch_size=10, max_wait=0.2)
+
+    for item in range(25):
+        worker.submit(item)
+
+    release.set()
+    worker.join()
+
+    assert sorted(item for batch in batches for item in batch) == list(range(25))
+
+    assert all(len(batch) <= 10 for batch in batches)
+
+    assert len(batches) < 25
+
+
+@pytest.mark.django_db
+def test_follow_and_unfollow(client, users):
+
+    """
+
+    Test the follow endpoints and the follower counter.
+
+    """
+
+    reader, author = users
+    url = f'/api/users/{author.id}/follow/'
+
+    response = client.post(url, **auth(reader))
+
+    assert response.status_code == 201
+
+    assert client.post(url, **auth(reader)).status_code == 200
+
+    assert FollowerCount.objects.get(author=author).count == 1
+
+    response = client.delete(url, **auth(reader))
+
+    assert response.json() == {'author_id': author.id, 'following': False}
+
+    assert not Follow.objects.exists()
+
+    assert FollowerCount.objects.get(author=author).count == 0
+
+
+@pytest.mark.django_db
+def test_cannot_follow_self(client, users):
+
+    """
+
+    Test that following yourself is rejected.
+
+    """
+
+    reader, _ = users
+
+    response = client.post(f'/api/users/{reader.id}/follow/', **auth(reader))
+
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_create_post_fans_out(client, users, settings,
+                              django_capture_on_commit_callbacks):
+
+    """
+
+    Test that a new post is written to followers' feeds.
+
+    """
+
+    settings.POSTS_BACKGROUND_TASKS_EAGER = True
+    reader, author = users
+    client.post(f'/api/users/{author.id}/follow/', **auth(reader))
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.post(
+                        '/api/posts/',
+                        json.dumps({'title': 'Hello', 'content': 'World'}),
+                        content_type='application/json',
+                        **auth(author),
+                        )
+
+    post_id = response.json()['id']
+
+    assert FeedEntry.objects.filter(user=reader, post_id=post_id).exists()
+
+    response = client.get('/api/feed/', **auth(reader))
+
+    assert response.status_code == 200
+
+    assert [item['id'] for item in response.json()['items']] == [post_id]
+
+
+@pytest.mark.django_db
+def test_feed_keyset_pagination(users):
+
+    """
+
+    Test that feed pages follow each other without gaps or repeats.
+
+    """
+
+    reader, author = users
+    Follow.objects.create(follower=reader, author=author)
+    posts = [Post.objects.create(title=f'Post {i}', content='Content',
+                                 author=author) for i in range(5)]
+    fan_out_posts([post.id for post in posts])
+
+    seen, cursor = [], None
+
+    while True:
+        page, cursor = get_feed(reader, cursor, limit=2)
+        seen.extend(post.id for post in page)
+
+        if cursor is None:
+            break
+
+    assert seen == [post.id for post in reversed(posts)]
+
+
+@pytest.mark.django_db
+def test_popular_authors_are_merged_on_read(users, settings):
+
+    """
+
+    Test the fan-out-on-read path for authors with many followers.
+
+    """
+
+    settings.POSTS_FEED_FANOUT_LIMIT = 0
+    reader, author = users
+    other = User.objects.create_user(username='other', password='pass123')
+
+    Follow.objects.create(follower=reader, author=author)
+    Follow.objects.create(follower=reader, author=other)
+    FollowerCount.objects.create(author=author, count=1)
+
+    popular = Post.objects.create(title='Popular', content='Content',
+                                  author=author)
+    regular = Post.objects.create(title='Regular', content='Content',
+                                  author=other)
+    fan_out_posts([popular.id, regular.id])
+
+    assert not FeedEntry.objects.filter(post=popular).exists()
+
+    page, cursor = get_feed(reader)
+
+    assert [post.id for post in page] == [regular.id, popular.id]
+
+    assert cursor is None
+
+
+@pytest.mark.django_db
+def test_invalid_cursor(client, users):
+
+    """
+
+    Test that a malformed cursor is rejected.
+
+    """
+
+    reader, _ = users
+
+    response = client.get('/api/feed/', {'cursor': 'nope'}, **auth(reader))
+
+    assert response.status_code == 400
@@ -0,0 +1,186 @@
+import itertools
+from datetime import timedelta
+
+import pytest
+
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from django.db import connection
+from django.utils import timezone
+
+from posts.models import Post, Comment
+from posts.schemas import PostFilterSchema
+from posts.services import create_jwt_token, filter_posts
+from posts.tests.plans import explain, indexes_used
+
+
+@pytest.fixture
+def user(db):
+
+    """
+
+    Fixture to create the user issuing the requests.
+
+    """
+
+    return User.objects.create_user(username='testuser',
+                                    password='password123')
+
+
+@pytest.fixture
+def auth_headers(user):
+
+    """
+
+    Fixture with an Authorization header for ``user``.
+
+    """
+
+    return {'HTTP_AUTHORIZATION': f'Bearer {create_jwt_token(user)}'}
+
+
+@pytest.mark.django_db
+def test_list_posts_filters(client, user, auth_headers):
+
+    """
+
+    Test filtering posts by author, date and, for staff, blocked state.
+
+    """
+
+    other = User.objects.create_user(username='other', password='pass123')
+    now = timezone.now()
+
+    old = Post.objects.create(title='Old', content='Content', author=user,
+                              created_at=now - timedelta(days=10))
+    new = Post.objects.create(title='New', content='Content', author=user)
+    Post.objects.create(title='Other', content='Content', author=other)
+    Post.objects.create(title='Blocked', content='Content', author=user,
+                        is_blocked=True)
+
+    def titles(**params):
+        response = client.get('/api/posts/', params, **auth_headers)
+        assert response.status_code == 200
+        return [post['title'] for post in response.json()]
+
+    assert 'Blocked' not in titles()
+
+    response = client.get('/api/posts/', {'include_blocked': True},
+                          **auth_headers)
+
+    assert response.status_code == 403
+
+    user.is_staff = True
+    user.save()
+
+    assert 'Blocked' in titles(include_blocked=True)
+
+    assert titles(author_id=user.id) == ['New', 'Old']
+
+    assert titles(created_before=(now - timedelta(days=1)).isoformat()) == [
+        old.title]
+
+    assert new.title in titles(created_after=(now - timedelta(days=1))
+                               .isoformat())
+
+
+@pytest.mark.django_db
+def test_list_posts_most_commented(client, user, auth_headers):
+
+    """
+
+    Test ordering posts by their number of visible comments.
+
+    """
+
+    quiet = Post.objects.create(title='Quiet', content='Content', author=user)
+    busy = Post.objects.create(title='Busy', content='Content', author=user)
+
+    for content in ('First', 'Second'):
+        client.post(f'/api/posts/{busy.id}/comments/', {'content': content},
+                    content_type='application/json', **auth_headers)
+
+    response = client.get('/api/posts/', {'order_by': 'most_commented'},
+                          **auth_headers)
+
+    assert [post['id'] for post in response.json()] == [busy.id, quiet.id]
+
+    assert response.json()[0]['comment_count'] == 2
+
+
+@pytest.mark.django_db
+def test_list_posts_rejects_unknown_ordering(client, auth_headers):
+
+    """
+
+    Test that unsupported orderings are rejected.
+
+    """
+
+    response = client.get('/api/posts/', {'order_by': 'random'},
+                          **auth_headers)
+
+    assert response.status_code == 422
+
+
+LISTING_INDEXES = {
+    'newest': 'post_newest_idx',
+    'most_commented': 'post_commented_idx',
+    'most_viewed': 'post_viewed_idx',
+}
+
+# Listings without blocked posts read the partial indexes of visible ones.
+VISIBLE_LISTING_INDEXES = {
+    'newest': 'post_visible_newest_idx',
+    'most_commented': 'post_visible_commented_idx',
+    'most_viewed': 'post_visible_viewed_idx',
+}
+
+
+@pytest.mark.django_db
+def test_every_filter_combination_uses_an_index():
+
+    """
+
+    Test that every supported filter combination reads a listing index:
+    the author's posts for an author, the index of the ordering without
+    date filters. Visible listings read the partial indexes of visible
+    posts, listings including blocked posts the full ones.
+
+    """
+
+    call_command('seed_data', users=50, posts=5000, comments_per_post=1,
+                 seed=11)
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+    author_id = Post.objects.values_list('author_id', flat=True).first()
+    now = timezone.now()
+
+    options = {
+        'author_id': [None, author_id],
+        'created_after': [None, now - timedelta(days=7)],
+        'created_before': [None, now - timedelta(days=1)],
+        'include_blocked': [False, True],
+        'order_by': list(LISTING_INDEXES),
+    }
+
+    for values in itertools.product(*options.values()):
+        filters = PostFilterSchema(**dict(zip(options, values)))
+        plan = explain(filter_posts(filters))
+
+        if filters.include_blocked:
+            author_index, indexes = 'post_author_idx', LISTING_INDEXES
+        else:
+            author_index = 'post_visible_author_idx'
+            indexes = VISIBLE_LISTING_INDEXES
+
+        if filters.author_id:
+            expected = {author_index}
+        elif filters.created_after or filters.created_before:
+            expected = set(indexes.values())
+        else:
+            expected = {indexes[filters.order_by]}
+
+        assert indexes_used(plan) & expected, (filters, plan)
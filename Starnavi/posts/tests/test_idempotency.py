@@ -0,0 +1,311 @@
+from datetime import timedelta
+
+import pytest
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.utils import timezone
+
+from posts import idempotency, views
+from posts.idempotency import claim
+from posts.models import Comment, IdempotencyKey, Post
+from posts.services import create_jwt_token
+
+
+@pytest.fixture
+def moderation_calls(monkeypatch):
+
+    """
+
+    Fixture counting the calls to moderation from the views.
+
+    """
+
+    calls = []
+    moderate = views.moderate_content
+
+    def counting(content):
+        calls.append(content)
+        return moderate(content)
+
+    monkeypatch.setattr(views, 'moderate_content', counting)
+
+    return calls
+
+
+POST = {'title': 'Title', 'content': 'Content'}
+
+
+def create_post(client, key, payload=POST):
+
+    return client.post('/api/posts/', payload,
+                       content_type='application/json',
+                       HTTP_IDEMPOTENCY_KEY=key)
+
+
+@pytest.mark.django_db
+def test_retry_replays_the_first_response(auth_client, moderation_calls):
+
+    """
+
+    Test that retrying with the same key returns the stored response
+    without creating or moderating again.
+
+    """
+
+    first = create_post(auth_client, 'key-1')
+    retry = create_post(auth_client, 'key-1')
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry['Idempotent-Replayed'] == 'true'
+    assert 'Idempotent-Replayed' not in first
+    assert Post.objects.count() == 1
+    assert len(moderation_calls) == 1
+
+
+@pytest.mark.django_db
+def test_comment_retry_does_not_schedule_another_auto_reply(
+        auth_client, monkeypatch, django_capture_on_commit_callbacks):
+
+    """
+
+    Test that a retried comment is neither inserted nor given another
+    automatic reply.
+
+    """
+
+    scheduled = []
+    monkeypatch.setattr(views, 'schedule_auto_reply', scheduled.append)
+    post = Post.objects.create(title='Post', content='Text',
+                               author=auth_client.user)
+
+    for _ in range(2):
+        with django_capture_on_commit_callbacks(execute=True):
+            response = auth_client.post(
+                f'/api/posts/{post.id}/comments/', {'content': 'Hello'},
+                content_type='application/json',
+                HTTP_IDEMPOTENCY_KEY='retry')
+
+        assert response.status_code == 201
+
+    assert Comment.objects.count() == 1
+    assert len(scheduled) == 1
+
+
+@pytest.mark.django_db
+def test_keys_are_scoped_to_user_and_endpoint(auth_client, client):
+
+    """
+
+    Test that the same key from another user, or on another endpoint,
+    is a new request.
+
+    """
+
+    create_post(auth_client, 'shared')
+
+    other = User.objects.create_user(username='other',
+                                     password='password123')
+    response = client.post(
+        '/api/posts/', POST, content_type='application/json',
+        HTTP_IDEMPOTENCY_KEY='shared',
+        HTTP_AUTHORIZATION=f'Bearer {create_jwt_token(other)}')
+
+    assert response.status_code == 201
+    assert 'Idempotent-Replayed' not in response
+
+    post = Post.objects.first()
+    response = auth_client.post(
+        f'/api/posts/{post.id}/comments/', {'content': 'Hello'},
+        content_type='application/json', HTTP_IDEMPOTENCY_KEY='shared')
+
+    assert response.status_code == 201
+    assert 'Idempotent-Replayed' not in response
+    assert Post.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_reused_key_with_another_body_is_rejected(auth_client):
+
+    """
+
+    Test that a key sent with a different request is refused.
+
+    """
+
+    create_post(auth_client, 'key')
+
+    response = create_post(auth_client, 'key',
+                           {'title': 'Other', 'content': 'Content'})
+
+    assert response.status_code == 422
+    assert Post.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_retry_during_the_first_request_conflicts(auth_client):
+
+    """
+
+    Test that a retry while the first request holds the key gets 409,
+    and that an abandoned claim is taken over.
+
+    """
+
+    create_post(auth_client, 'key')
+    IdempotencyKey.objects.update(status_code=None, response=None)
+
+    response = create_post(auth_client, 'key')
+
+    assert response.status_code == 409
+    assert response['Retry-After'] == '1'
+
+    IdempotencyKey.objects.update(
+        created_at=timezone.now() - timedelta(minutes=5))
+
+    response = create_post(auth_client, 'key')
+
+    assert response.status_code == 201
+    assert Post.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_unsuccessful_responses_release_the_key(auth_client, settings):
+
+    """
+
+    Test that a request answered with an error can be retried with the
+    same key.
+
+    """
+
+    settings.POSTS_RATE_LIMITS = {'posts': '1/m'}
+
+    create_post(auth_client, 'first')
+    limited = create_post(auth_client, 'second')
+
+    assert limited.status_code == 429
+    assert not IdempotencyKey.objects.filter(status_code=429).exists()
+    assert IdempotencyKey.objects.count() == 1
+
+    settings.POSTS_RATE_LIMITS = {}
+
+    assert create_post(auth_client, 'second').status_code == 201
+
+
+@pytest.mark.django_db
+def test_requests_without_a_key_are_not_recorded(auth_client):
+
+    """
+
+    Test that requests without the header behave as before.
+
+    """
+
+    for _ in range(2):
+        response = auth_client.post('/api/posts/', POST,
+                                    content_type='application/json')
+
+        assert response.status_code == 201
+
+    assert Post.objects.count() == 2
+    assert not IdempotencyKey.objects.exists()
+
+
+@pytest.mark.django_db
+def test_invalid_key_is_rejected(auth_client):
+
+    """
+
+    Test that empty and overlong keys are rejected.
+
+    """
+
+    assert create_post(auth_client, '').status_code == 400
+    assert create_post(auth_client, 'k' * 256).status_code == 400
+    assert not Post.objects.exists()
+
+
+@pytest.mark.django_db
+def test_expired_keys_are_claimed_again_and_purged(settings):
+
+    """
+
+    Test that keys older than the TTL no longer replay and are deleted
+    by the purge command.
+
+    """
+
+    settings.POSTS_IDEMPOTENCY_TTL = 60
+    long_ago = timezone.now() - timedelta(seconds=61)
+
+    IdempotencyKey.objects.bulk_create([
+        IdempotencyKey(key=f'{i:032x}', request_hash='0' * 32,
+                       status_code=201, response=b'{}', created_at=long_ago)
+        for i in range(5)])
+
+    record, claimed = claim(f'{0:032x}', '1' * 32)
+
+    assert claimed
+    assert record.status_code is None
+
+    call_command('purge_idempotency_keys', batch_size=2)
+
+    assert list(IdempotencyKey.objects.values_list('key', flat=True)) == [
+        f'{0:032x}']
+
+
+@pytest.mark.django_db
+def test_view_and_response_are_committed_together(auth_client, monkeypatch):
+
+    """
+
+    Test that a failure after the view ran rolls back its post along with
+    the claim's response, so the retry creates the post once.
+
+    """
+
+    def failing_store(record, response):
+        raise RuntimeError('worker died')
+
+    monkeypatch.setattr(idempotency, '_store', failing_store)
+
+    with pytest.raises(RuntimeError):
+        create_post(auth_client, 'key')
+
+    assert not Post.objects.exists()
+    assert not IdempotencyKey.objects.exists()
+
+    monkeypatch.undo()
+
+    assert create_post(auth_client, 'key').status_code == 201
+    assert create_post(auth_client, 'key')['Idempotent-Replayed'] == 'true'
+    assert Post.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_request_whose_claim_was_taken_over_is_rolled_back(auth_client,
+                                                           monkeypatch):
+
+    """
+
+    Test that a request outliving the lock timeout, whose claim a retry
+    took over meanwhile, rolls its post back instead of duplicating it.
+
+    """
+
+    moderate = views.moderate_content
+
+    def taken_over(content):
+        IdempotencyKey.objects.update(
+            created_at=timezone.now() + timedelta(seconds=1))
+        return moderate(content)
+
+    monkeypatch.setattr(views, 'moderate_content', taken_over)
+
+    response = create_post(auth_client, 'key')
+
+    assert response.status_code == 409
+    assert not Post.objects.exists()
+    assert IdempotencyKey.objects.get().status_code is None
@@ -0,0 +1,275 @@
+import gzip
+import json
+
+import pytest
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+
+from posts.duplicates import find_duplicate, simhash
+from posts.importing import Importer
+from posts.models import Comment, ImportCheckpoint, Post
+
+
+@pytest.fixture
+def author(db):
+
+    """
+
+    Fixture to create the author of the imported content.
+
+    """
+
+    return User.objects.create_user(username='author', password='password123')
+
+
+def write_ndjson(path, records):
+
+    """Write ``records`` as NDJSON to ``path``."""
+
+    data = ''.join(json.dumps(record) + '\n' for record in records)
+
+    if str(path).endswith('.gz'):
+        path.write_bytes(gzip.compress(data.encode()))
+    else:
+        path.write_text(data)
+
+    return str(path)
+
+
+def records(author, posts=3, comments=2):
+
+    """Build post records, each followed by its comment records."""
+
+    for post_id in range(1000, 1000 + posts):
+        yield {'type': 'post', 'id': post_id, 'author_id': author.id,
+               'title': f'Post {post_id}', 'content': 'Content',
+               'created_at': '2024-01-01T00:00:00+00:00'}
+
+        for _ in range(comments):
+            yield {'type': 'comment', 'post_id': post_id,
+                   'author_id': author.id, 'content': 'Comment'}
+
+
+@pytest.mark.django_db
+def test_import_content(tmp_path, author, capsys):
+
+    """
+
+    Test importing posts and comments from a gzipped file.
+
+    """
+
+    path = write_ndjson(tmp_path / 'content.ndjson.gz', records(author))
+
+    call_command('import_content', path, batch_size=4, workers=0)
+
+    assert sorted(Post.objects.values_list('id', flat=True)) == [
+        1000, 1001, 1002]
+
+    assert Comment.objects.count() == 6
+
+    assert Post.objects.get(id=1000).comment_count == 2
+
+    assert Post.objects.get(id=1000).created_at.year == 2024
+
+    assert 'rows/s' in capsys.readouterr().out
+
+
+@pytest.mark.django_db
+def test_import_skips_invalid_records(tmp_path, author):
+
+    """
+
+    Test that invalid records are skipped and reported.
+
+    """
+
+    path = write_ndjson(tmp_path / 'content.ndjson', [
+        {'type': 'post', 'id': 1, 'author_id': author.id, 'title': '',
+         'content': 'Empty title'},
+        {'type': 'post', 'id': 2, 'author_id': 999, 'title': 'Unknown author',
+         'content': 'Content'},
+        {'type': 'comment', 'post_id': 3, 'author_id': author.id,
+         'content': 'Unknown post'},
+        {'type': 'like', 'author_id': author.id},
+        {'type': 'post', 'id': 4, 'author_id': author.id, 'title': 'Valid',
+         'content': 'damn this is blocked'},
+    ])
+
+    stats = Importer(path).run()
+
+    assert (stats.posts, stats.comments, stats.skipped) == (1, 0, 4)
+
+    assert Post.all_objects.get(id=4).is_blocked
+
+
+@pytest.mark.django_db
+def test_import_resumes_from_checkpoint(tmp_path, author):
+
+    """
+
+    Test that a re-run continues after the last committed batch.
+
+    """
+
+    path = write_ndjson(tmp_path / 'content.ndjson', records(author))
+
+    Importer(path, batch_size=3).run()
+
+    assert ImportCheckpoint.objects.get(name=path).position > 0
+
+    with open(path, 'a') as f:
+        f.write(json.dumps({'type': 'comment', 'post_id': 1000,
+                            'author_id': author.id,
+                            'content': 'Appended'}) + '\n')
+
+    stats = Importer(path, batch_size=3).run()
+
+    assert (stats.posts, stats.comments) == (0, 1)
+
+    assert Comment.objects.count() == 7
+
+
+@pytest.mark.django_db(transaction=True)
+def test_import_moderates_in_worker_processes(tmp_path, author):
+
+    """
+
+    Test moderation in a pool of worker processes.
+
+    """
+
+    rows = list(records(author, posts=2, comments=3))
+    rows[1]['content'] = 'shit'
+    path = write_ndjson(tmp_path / 'content.ndjson', rows)
+
+    stats = Importer(path, batch_size=3, workers=2).run()
+
+    assert (stats.posts, stats.comments) == (2, 6)
+
+    assert Comment.all_objects.filter(is_blocked=True).count() == 1
+
+
+@pytest.mark.django_db
+def test_import_skips_existing_ids(tmp_path, author):
+
+    """
+
+    Test that importing a file twice does not duplicate its records.
+
+    """
+
+    path = write_ndjson(tmp_path / 'content.ndjson', records(author))
+
+    Importer(path, name='first').run()
+    stats = Importer(path, name='second').run()
+
+    assert (stats.posts, stats.skipped) == (0, 3)
+
+    assert Post.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_import_reports_colliding_ids(tmp_path, author, capsys):
+
+    """
+
+    Test that records colliding with rows inserted meanwhile are counted
+    and reported, and that later inserts get ids past the imported ones.
+
+    """
+
+    Post.objects.create(id=1001, title='Taken', content='Content',
+                        author=author)
+    path = write_ndjson(tmp_path / 'content.ndjson', records(author))
+
+    call_command('import_content', path, batch_size=4, workers=0)
+
+    captured = capsys.readouterr()
+
+    assert 'post 1001 already exists' in captured.err
+
+    assert '(1 with existing ids)' in captured.out
+
+    assert Post.objects.get(id=1001).title == 'Taken'
+
+    assert Post.objects.create(title='New', content='Content',
+                               author=author).id > 1002
+
+
+@pytest.mark.django_db
+def test_imported_comments_are_signed(tmp_path, author):
+
+    """
+
+    Test that imported comments are seen by duplicate detection.
+
+    """
+
+    text = 'A long enough comment to be signed for duplicate detection.'
+    rows = list(records(author, posts=1, comments=0))
+    rows.append({'type': 'comment', 'post_id': 1000, 'author_id': author.id,
+                 'content': text})
+    path = write_ndjson(tmp_path / 'content.ndjson', rows)
+
+    Importer(path).run()
+
+    assert find_duplicate(simhash(text)) == Comment.objects.get().id
+
+
+@pytest.mark.django_db
+def test_old_imported_comments_do_not_trend(tmp_path, author):
+
+    """
+
+    Test that trending scores follow the imported comments' ages.
+
+    """
+
+    rows = list(records(author, posts=2, comments=0))
+    rows += [{'type': 'comment', 'post_id': 1000, 'author_id': author.id,
+              'content': 'Old', 'created_at': '2024-01-01T00:00:00+00:00'}
+             for _ in range(5)]
+    rows.append({'type': 'comment', 'post_id': 1001, 'author_id': author.id,
+                 'content': 'New'})
+    path = write_ndjson(tmp_path / 'content.ndjson', rows)
+
+    Importer(path).run()
+
+    assert Post.objects.get(id=1000).trending_score == 0
+
+    assert Post.objects.get(id=1001).trending_score == pytest.approx(1, 0.01)
+
+
+@pytest.mark.django_db
+def test_import_rejects_mixed_ids(tmp_path, author):
+
+    """
+
+    Test that records without an id are skipped in a file whose records
+    of the same type have one, and the other way round.
+
+    """
+
+    path = write_ndjson(tmp_path / 'content.ndjson', [
+        {'type': 'post', 'id': 1000, 'author_id': author.id,
+         'title': 'Explicit', 'content': 'Content'},
+        {'type': 'post', 'author_id': author.id, 'title': 'Implicit',
+         'content': 'Content'},
+        {'type': 'comment', 'post_id': 1000, 'author_id': author.id,
+         'content': 'Implicit'},
+        {'type': 'comment', 'id': 5, 'post_id': 1000,
+         'author_id': author.id, 'content': 'Explicit'},
+    ])
+
+    stats = Importer(path).run()
+
+    assert (stats.posts, stats.comments, stats.skipped) == (1, 1, 2)
+
+    assert 'mix explicit and implicit ids' in stats.errors[0]
+
+    assert list(Post.objects.values_list('title', flat=True)) == ['Explicit']
+
+    assert list(Comment.objects.values_list('content', flat=True)) == [
+        'Implicit']
@@ -0,0 +1,296 @@
+import contextlib
+import json
+import logging
+import threading
+
+import pytest
+from asgiref.sync import async_to_sync, iscoroutinefunction
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.http import HttpResponse
+from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext
+from ninja import NinjaAPI, Router
+
+from posts import views
+from posts.instrumentation import (
+    InstrumentationMiddleware, current_metrics, instrument_api, timed)
+from posts.metrics import REGISTRY
+from posts.profiling import ProfilingMiddleware
+from posts.routers import StickyPrimaryMiddleware
+from posts.streams import BROKER
+from posts.models import Post, Comment
+from posts.services import create_jwt_token
+
+
+@pytest.fixture
+def user(db):
+
+    """
+
+    Fixture to create the user issuing the requests.
+
+    """
+
+    return User.objects.create_user(username='testuser',
+                                    password='password123')
+
+
+@pytest.fixture
+def auth_headers(user):
+
+    """
+
+    Fixture with an Authorization header for ``user``.
+
+    """
+
+    return {'HTTP_AUTHORIZATION': f'Bearer {create_jwt_token(user)}'}
+
+
+def test_timed_is_noop_outside_requests():
+
+    """
+
+    Test that timed blocks outside a request record nothing.
+
+    """
+
+    with timed('moderation'):
+        pass
+
+    assert current_metrics() is None
+
+
+@pytest.mark.django_db
+def test_server_timing_header(client, user, auth_headers):
+
+    """
+
+    Test that responses carry database and serialization timings.
+
+    """
+
+    Post.objects.create(title='Post', content='Content', author=user)
+
+    response = client.get('/api/posts/', **auth_headers)
+
+    header = response['Server-Timing']
+
+    assert 'db;dur=' in header
+
+    assert 'desc="2 queries"' in header
+
+    assert 'serialization;dur=' in header
+
+    assert 'total;dur=' in header
+
+
+@pytest.mark.django_db
+def test_moderation_timing(client, auth_headers):
+
+    """
+
+    Test that moderation time is reported for create endpoints.
+
+    """
+
+    response = client.post(
+                        '/api/posts/',
+                        json.dumps({'title': 'Post', 'content': 'Clean'}),
+                        content_type='application/json',
+                        **auth_headers,
+                        )
+
+    assert 'moderation;dur=' in response['Server-Timing']
+
+
+@pytest.mark.django_db
+def test_list_comments_query_count_is_constant(
+        client, user, auth_headers, django_assert_num_queries):
+
+    """
+
+    Test that listing comments does not issue a query per comment.
+
+    """
+
+    post = Post.objects.create(title='Post', content='Content', author=user)
+
+    Comment.objects.bulk_create(
+        Comment(post=post, author=user, content=f'Comment {i}')
+        for i in range(10)
+    )
+
+    with django_assert_num_queries(2):
+        response = client.get(f'/api/posts/{post.id}/comments/',
+                              **auth_headers)
+
+    assert len(response.json()) == 10
+
+
+@pytest.mark.django_db
+def test_query_budget_logs_warning(client, user, auth_headers, settings,
+                                   caplog):
+
+    """
+
+    Test that requests over the query budget are logged as warnings.
+
+    """
+
+    settings.POSTS_QUERY_BUDGET = 1
+
+    with caplog.at_level(logging.INFO, logger='posts.instrumentation'):
+        client.get('/api/posts/', **auth_headers)
+
+    record = caplog.records[-1]
+
+    assert record.levelno == logging.WARNING
+
+    data = json.loads(record.getMessage())
+
+    assert data['operation'] == 'list_posts'
+
+    assert data['queries'] == 2
+
+    assert data['query_budget'] == 1
+
+
+@pytest.mark.django_db
+def test_comment_queries_are_not_timed_as_serialization(
+        client, user, auth_headers, monkeypatch):
+
+    """
+
+    Test that the comment list is read before its serialization is timed.
+
+    """
+
+    post = Post.objects.create(title='Post', content='Content', author=user)
+    Comment.objects.create(post=post, author=user, content='Comment')
+    serialization_queries = []
+
+    @contextlib.contextmanager
+    def counting(name):
+        with CaptureQueriesContext(connection) as queries, timed(name):
+            yield
+        serialization_queries.extend(queries)
+
+    monkeypatch.setattr(views, 'timed', counting)
+
+    response = client.get(f'/api/posts/{post.id}/comments/', **auth_headers)
+
+    assert len(response.json()) == 1
+
+    assert serialization_queries == []
+
+
+def test_operations_of_every_router_are_instrumented():
+
+    """
+
+    Test that operations on attached and nested routers are hooked, not
+    only those of the default router.
+
+    """
+
+    api = NinjaAPI(urls_namespace='instrumentation-test')
+    router = Router()
+    nested = Router()
+
+    @api.get('/root')
+    def root(request):
+        return {}
+
+    @router.get('/attached')
+    def attached(request):
+        return {}
+
+    @nested.get('/nested')
+    def nested_view(request):
+        return {}
+
+    router.add_router('/nested', nested)
+    api.add_router('/router', router)
+
+    instrument_api(api)
+
+    operations = [operation
+                  for _, attached_router in api._routers
+                  for path_view in attached_router.path_operations.values()
+                  for operation in path_view.operations]
+
+    assert len(operations) == 3
+
+    assert all(hasattr(operation.view_func, '__wrapped__')
+               for operation in operations)
+
+
+@pytest.mark.parametrize('middleware', [
+    InstrumentationMiddleware, ProfilingMiddleware, StickyPrimaryMiddleware])
+def test_middlewares_serve_async_requests_in_the_event_loop(middleware):
+
+    """
+
+    Test that under ASGI the middlewares await the rest of the chain in
+    the event loop's thread instead of switching to a worker thread.
+
+    """
+
+    threads = []
+
+    async def get_response(request):
+        threads.append(threading.get_ident())
+        return HttpResponse()
+
+    instance = middleware(get_response)
+
+    assert iscoroutinefunction(instance)
+
+    async def call():
+        threads.append(threading.get_ident())
+        request = type('Request', (), {'method': 'GET', 'path': '/'})()
+        return await instance(request)
+
+    async_to_sync(call)()
+
+    assert len(threads) == 2 and threads[0] == threads[1]
+
+
+@pytest.mark.django_db
+def test_async_requests_are_instrumented(user, auth_headers):
+
+    """
+
+    Test that requests served over ASGI, synchronous views and the
+    comment stream included, are timed and their queries counted.
+
+    """
+
+    post = Post.objects.create(title='Post', content='Content', author=user)
+    headers = {'Authorization': auth_headers['HTTP_AUTHORIZATION']}
+
+    async def scenario():
+        client = AsyncClient()
+        listing = await client.get('/api/posts/', headers=headers)
+        stream = await client.get(f'/api/posts/{post.id}/comments/stream/',
+                                  headers=headers)
+        stream.close()
+
+        return listing, stream
+
+    try:
+        listing, stream = async_to_sync(scenario)()
+    finally:
+        BROKER.clear()
+
+    assert 'desc="2 queries"' in listing['Server-Timing']
+
+    assert stream.status_code == 200
+
+    assert 'desc="0 queries"' not in stream['Server-Timing']
+
+    assert ('posts_request_duration_seconds_count'
+            '{operation="stream_comments",method="GET"}') in REGISTRY.render()
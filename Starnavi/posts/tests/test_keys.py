@@ -0,0 +1,231 @@
+import json
+from datetime import timedelta
+
+import jwt
+import pytest
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.utils import timezone
+
+from posts.keys import KeySet, get_keyset
+from posts.services import create_jwt_token
+
+
+OLD = {'kid': 'old', 'alg': 'HS256', 'secret': 'old-secret-' * 4}
+NEW = {'kid': 'new', 'alg': 'HS256', 'secret': 'new-secret-' * 4}
+
+
+@pytest.fixture
+def user(db):
+
+    """
+
+    Fixture to create a user to authenticate.
+
+    """
+
+    return User.objects.create_user(username='testuser',
+                                    password='password123')
+
+
+def asymmetric_key(alg):
+
+    """Generate a key entry for ``alg``, skipping without cryptography."""
+
+    pytest.importorskip('cryptography')
+
+    from io import StringIO
+
+    out = StringIO()
+    call_command('generate_jwt_key', alg=alg, kid=alg.lower(), stdout=out)
+
+    return json.loads(out.getvalue())
+
+
+def status(client, token):
+
+    return client.get('/api/posts/',
+                      HTTP_AUTHORIZATION=f'Bearer {token}').status_code
+
+
+def test_tokens_carry_the_signing_kid(settings):
+
+    """
+
+    Test that tokens are signed with the signing key and name it.
+
+    """
+
+    settings.POSTS_JWT_KEYS = [OLD, NEW]
+    settings.POSTS_JWT_SIGNING_KID = 'new'
+
+    token = get_keyset().sign({'user_id': 1})
+
+    assert jwt.get_unverified_header(token)['kid'] == 'new'
+    assert jwt.decode(token, NEW['secret'], algorithms=['HS256']) == {
+        'user_id': 1}
+
+
+def test_rotation_keeps_old_tokens_valid(client, user, settings):
+
+    """
+
+    Test that tokens signed with a retired signing key stay valid while
+    the key is in the keyset, and are rejected once it is removed.
+
+    """
+
+    settings.POSTS_JWT_KEYS = [OLD]
+    settings.POSTS_JWT_SIGNING_KID = 'old'
+    old_token = create_jwt_token(user)
+
+    settings.POSTS_JWT_KEYS = [OLD, NEW]
+    settings.POSTS_JWT_SIGNING_KID = 'new'
+    new_token = create_jwt_token(user)
+
+    assert status(client, old_token) == 200
+    assert status(client, new_token) == 200
+
+    settings.POSTS_JWT_KEYS = [NEW]
+
+    assert status(client, old_token) == 401
+    assert status(client, new_token) == 200
+
+
+def test_tokens_without_kid_use_the_signing_key(client, user, settings):
+
+    """
+
+    Test that tokens issued before keysets, without a kid, are accepted
+    when signed with the default SECRET_KEY key.
+
+    """
+
+    legacy = jwt.encode({'user_id': user.id,
+                         'exp': timezone.now() + timedelta(days=1)},
+                        settings.SECRET_KEY, algorithm='HS256')
+
+    assert status(client, legacy) == 200
+
+
+def test_default_key_verifies_until_retired(client, user, settings):
+
+    """
+
+    Test that tokens signed with the SECRET_KEY before POSTS_JWT_KEYS was
+    set stay valid after the rollout, until the default key is retired.
+
+    """
+
+    token = create_jwt_token(user)
+    legacy = jwt.encode({'user_id': user.id,
+                         'exp': timezone.now() + timedelta(days=1)},
+                        settings.SECRET_KEY, algorithm='HS256')
+
+    settings.POSTS_JWT_KEYS = [NEW]
+    settings.POSTS_JWT_SIGNING_KID = 'new'
+
+    assert status(client, token) == 200
+    assert status(client, legacy) == 200
+
+    settings.POSTS_JWT_RETIRE_DEFAULT_KEY = True
+
+    assert status(client, token) == 401
+    assert status(client, legacy) == 401
+    assert status(client, create_jwt_token(user)) == 200
+
+
+def test_algorithm_is_pinned_by_the_key(settings):
+
+    """
+
+    Test that a token is only accepted with the algorithm of its key.
+
+    """
+
+    settings.POSTS_JWT_KEYS = [OLD]
+    settings.POSTS_JWT_SIGNING_KID = 'old'
+    forged = jwt.encode({'user_id': 1}, OLD['secret'], algorithm='HS512',
+                        headers={'kid': 'old'})
+
+    with pytest.raises(jwt.InvalidAlgorithmError):
+        get_keyset().verify(forged)
+
+    with pytest.raises(jwt.InvalidKeyError):
+        get_keyset().verify(jwt.encode({'user_id': 1}, 'x',
+                                       headers={'kid': 'missing'}))
+
+
+def test_invalid_keysets_are_rejected():
+
+    """
+
+    Test the configuration errors of a keyset.
+
+    """
+
+    with pytest.raises(ImproperlyConfigured):
+        KeySet([OLD], 'missing')
+
+    with pytest.raises(ImproperlyConfigured):
+        KeySet([{'kid': 'k', 'alg': 'none'}], 'k')
+
+    with pytest.raises(ImproperlyConfigured):
+        KeySet([{'alg': 'HS256', 'secret': 's'}], 'k')
+
+
+def test_keys_are_read_from_a_file(settings, tmp_path):
+
+    """
+
+    Test that POSTS_JWT_KEYS may name a JSON file.
+
+    """
+
+    path = tmp_path / 'keys.json'
+    path.write_text(json.dumps([OLD, NEW]))
+    settings.POSTS_JWT_KEYS = str(path)
+    settings.POSTS_JWT_SIGNING_KID = 'old'
+
+    assert set(get_keyset().keys) == {'old', 'new', 'default'}
+
+
+@pytest.mark.parametrize('alg', ['EdDSA', 'RS256'])
+def test_asymmetric_keys(client, user, settings, alg):
+
+    """
+
+    Test signing with a private key, verifying with a public-only key and
+    publishing the public keys.
+
+    """
+
+    key = asymmetric_key(alg)
+    verify_only = dict(asymmetric_key(alg), kid='retired')
+    del verify_only['private_key']
+
+    settings.POSTS_JWT_KEYS = [key, verify_only, OLD]
+    settings.POSTS_JWT_SIGNING_KID = key['kid']
+
+    assert status(client, create_jwt_token(user)) == 200
+
+    jwks = client.get('/api/jwks.json').json()
+
+    assert {k['kid'] for k in jwks['keys']} == {key['kid'], 'retired'}
+    assert all('d' not in k for k in jwks['keys'])
+
+    with pytest.raises(ImproperlyConfigured):
+        KeySet([verify_only], 'retired')
+
+
+def test_jwks_omits_shared_secrets(client):
+
+    """
+
+    Test that HS256 secrets are never published.
+
+    """
+
+    assert client.get('/api/jwks.json').json() == {'keys': []}
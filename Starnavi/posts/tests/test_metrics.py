@@ -0,0 +1,224 @@
+import multiprocessing
+import os
+
+import pytest
+
+from django.contrib.auth.models import User
+
+from posts.metrics import (
+    REGISTRY, AUTO_REPLY_QUEUE_DEPTH, JWT_FAILURES, REQUEST_LATENCY)
+from posts.services import create_jwt_token
+
+
+@pytest.fixture(autouse=True)
+def clean_registry(settings):
+
+    """
+
+    Fixture resetting process metrics and the shared directory.
+
+    """
+
+    settings.POSTS_METRICS_DIR = None
+    REGISTRY.reset()
+    yield
+    REGISTRY.reset()
+
+
+def _child(count, flushed, done):
+
+    JWT_FAILURES.inc('expired', amount=count)
+    AUTO_REPLY_QUEUE_DEPTH.inc(amount=5)
+    REGISTRY.flush()
+    flushed.release()
+    done.wait()
+
+
+def test_render_exposition_format():
+
+    """
+
+    Test the Prometheus text rendering of counters and histograms.
+
+    """
+
+    JWT_FAILURES.inc('missing')
+    JWT_FAILURES.inc('missing')
+    REQUEST_LATENCY.observe(0.02, 'list_posts', 'GET')
+    REQUEST_LATENCY.observe(3.0, 'list_posts', 'GET')
+
+    text = REGISTRY.render()
+
+    assert '# TYPE posts_jwt_failures_total counter' in text
+
+    assert 'posts_jwt_failures_total{reason="missing"} 2' in text
+
+    assert ('posts_request_duration_seconds_bucket'
+            '{operation="list_posts",method="GET",le="0.025"} 1') in text
+
+    assert ('posts_request_duration_seconds_bucket'
+            '{operation="list_posts",method="GET",le="+Inf"} 2') in text
+
+    assert ('posts_request_duration_seconds_count'
+            '{operation="list_posts",method="GET"} 2') in text
+
+
+def test_label_count_is_checked():
+
+    """
+
+    Test that metrics reject a wrong number of label values.
+
+    """
+
+    with pytest.raises(ValueError):
+        JWT_FAILURES.inc()
+
+
+def test_aggregates_across_processes(settings, tmp_path):
+
+    """
+
+    Test that the samples of live processes are summed, and that the
+    snapshots of exited processes are dropped and removed.
+
+    """
+
+    settings.POSTS_METRICS_DIR = str(tmp_path)
+
+    context = multiprocessing.get_context('fork')
+    flushed, done = context.Semaphore(0), context.Event()
+    processes = [context.Process(target=_child,
+                                 args=(count, flushed, done))
+                 for count in (2, 3)]
+
+    for process in processes:
+        process.start()
+        flushed.acquire()
+
+    JWT_FAILURES.inc('expired')
+    AUTO_REPLY_QUEUE_DEPTH.inc()
+
+    text = REGISTRY.render()
+
+    assert 'posts_jwt_failures_total{reason="expired"} 6' in text
+
+    assert 'posts_auto_reply_queue_depth 11' in text
+
+    done.set()
+
+    for process in processes:
+        process.join()
+
+    text = REGISTRY.render()
+
+    assert 'posts_jwt_failures_total{reason="expired"} 1' in text
+
+    assert 'posts_auto_reply_queue_depth 1' in text
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        f'{os.getpid()}.json']
+
+
+def test_snapshot_is_removed_at_exit(settings, tmp_path):
+
+    """
+
+    Test that a process removes its own snapshot when it exits.
+
+    """
+
+    settings.POSTS_METRICS_DIR = str(tmp_path)
+    REGISTRY.flush()
+
+    REGISTRY.remove()
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def bearer(user):
+
+    """Return an Authorization header for ``user``."""
+
+    return {'HTTP_AUTHORIZATION': f'Bearer {create_jwt_token(user)}'}
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint(client):
+
+    """
+
+    Test that /api/metrics exposes request and JWT failure metrics.
+
+    """
+
+    staff = User.objects.create_user(username='staff', password='password123',
+                                     is_staff=True)
+
+    client.get('/api/posts/')
+
+    response = client.get('/api/metrics', **bearer(staff))
+
+    assert response.status_code == 200
+
+    assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+
+    text = response.content.decode()
+
+    assert 'posts_jwt_failures_total{reason="missing"} 1' in text
+
+    assert ('posts_request_duration_seconds_count'
+            '{operation="list_posts",method="GET"} 1') in text
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint_is_restricted(client, settings):
+
+    """
+
+    Test that only staff users and bearers of the metrics token read the
+    metrics.
+
+    """
+
+    settings.POSTS_METRICS_TOKEN = 'scrape-token'
+    user = User.objects.create_user(username='user', password='password123')
+
+    assert client.get('/api/metrics').status_code == 401
+
+    assert client.get('/api/metrics', **bearer(user)).status_code == 403
+
+    assert client.get('/api/metrics',
+                      HTTP_AUTHORIZATION='Bearer wrong').status_code == 401
+
+    assert client.get('/api/metrics',
+                      HTTP_AUTHORIZATION='Bearer scrape-token'
+                      ).status_code == 200
+
+    settings.POSTS_METRICS_TOKEN = None
+
+    assert client.get('/api/metrics',
+                      HTTP_AUTHORIZATION='Bearer scrape-token'
+                      ).status_code == 401
+
+
+@pytest.mark.django_db
+def test_blocked_comments_on_missing_posts_are_not_counted(client):
+
+    """
+
+    Test that a blocked comment answered with 404 is not counted as a
+    moderation block.
+
+    """
+
+    user = User.objects.create_user(username='user', password='password123')
+
+    response = client.post('/api/posts/999/comments/',
+                           {'content': 'damn this is blocked'},
+                           content_type='application/json', **bearer(user))
+
+    assert response.status_code == 404
+
+    assert 'posts_moderation_blocks_total{kind="comment"}' not in (
+        REGISTRY.render())
@@ -0,0 +1,182 @@
+import pytest
+
+from django.contrib.auth.models import User
+
+from posts.models import Post, Comment
+from posts.services import create_jwt_token, list_blocked
+from posts.tests.plans import explain, indexes_used
+
+
+@pytest.fixture
+def user(db):
+
+    """
+
+    Fixture to create a regular user.
+
+    """
+
+    return User.objects.create_user(username='testuser',
+                                    password='password123')
+
+
+@pytest.fixture
+def staff_headers(db):
+
+    """
+
+    Fixture with an Authorization header for a staff user.
+
+    """
+
+    staff = User.objects.create_user(username='staff', password='password123',
+                                     is_staff=True)
+
+    return {'HTTP_AUTHORIZATION': f'Bearer {create_jwt_token(staff)}'}
+
+
+@pytest.mark.django_db
+def test_default_managers_hide_blocked_rows(user):
+
+    """
+
+    Test that blocked rows are only reachable through ``all_objects``.
+
+    """
+
+    post = Post.objects.create(title='Post', content='Content', author=user)
+    blocked = Post.objects.create(title='Blocked', content='Content',
+                                  author=user, is_blocked=True)
+    Comment.objects.create(post=post, author=user, content='Visible')
+    hidden = Comment.objects.create(post=post, author=user, content='Hidden',
+                                    is_blocked=True)
+
+    assert list(Post.objects.all()) == [post]
+
+    assert Post.all_objects.count() == 2
+
+    assert [c.content for c in post.comments.all()] == ['Visible']
+
+    assert Comment.all_objects.filter(post=post).count() == 2
+
+    assert hidden.post == post
+
+    assert Post.all_objects.get(id=blocked.id).is_blocked
+
+
+@pytest.mark.django_db
+def test_list_comments_hides_blocked(client, user):
+
+    """
+
+    Test that blocked comments are not listed.
+
+    """
+
+    headers = {'HTTP_AUTHORIZATION': f'Bearer {create_jwt_token(user)}'}
+    post = Post.objects.create(title='Post', content='Content', author=user)
+    Comment.objects.create(post=post, author=user, content='Visible')
+    Comment.objects.create(post=post, author=user, content='Hidden',
+                           is_blocked=True)
+
+    response = client.get(f'/api/posts/{post.id}/comments/', **headers)
+
+    assert [c['content'] for c in response.json()] == ['Visible']
+
+
+@pytest.mark.django_db
+def test_blocked_content_is_paginated(client, user, staff_headers):
+
+    """
+
+    Test paging through blocked comments with the keyset cursor.
+
+    """
+
+    post = Post.objects.create(title='Post', content='Content', author=user)
+    Comment.objects.create(post=post, author=user, content='Visible')
+    blocked = [Comment.objects.create(post=post, author=user,
+                                      content=f'Blocked {i}', is_blocked=True)
+               for i in range(5)]
+
+    seen, cursor = [], None
+
+    while True:
+        params = {'kind': 'comments', 'limit': 2}
+
+        if cursor:
+            params['cursor'] = cursor
+
+        response = client.get('/api/moderation/blocked/', params,
+                              **staff_headers)
+
+        assert response.status_code == 200
+
+        seen += [item['id'] for item in response.json()['items']]
+        cursor = response.json()['next_cursor']
+
+        if cursor is None:
+            break
+
+    assert seen == [comment.id for comment in reversed(blocked)]
+
+    assert response.json()['items'][0]['post_id'] == post.id
+
+
+@pytest.mark.django_db
+def test_blocked_content_requires_staff(client, user):
+
+    """
+
+    Test that regular users cannot list blocked content.
+
+    """
+
+    headers = {'HTTP_AUTHORIZATION': f'Bearer {create_jwt_token(user)}'}
+
+    response = client.get('/api/moderation/blocked/', **headers)
+
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_blocked_content_rejects_bad_cursor(client, staff_headers):
+
+    """
+
+    Test that a malformed cursor is reported as a client error.
+
+    """
+
+    response = client.get('/api/moderation/blocked/', {'cursor': 'nope'},
+                          **staff_headers)
+
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_visibility_queries_use_partial_indexes(user):
+
+    """
+
+    Test that comment listings and blocked listings read partial indexes.
+
+    """
+
+    post = Post.objects.create(title='Post', content='Content', author=user)
+
+    queries = [
+        (Comment.objects.filter(post=post).order_by('created_at', 'id'),
+         'comment_visible_post_idx'),
+        (Comment.all_objects.filter(is_blocked=True)
+                            .order_by('-created_at', '-id'),
+         'comment_blocked_idx'),
+        (Post.all_objects.filter(is_blocked=True)
+                         .order_by('-created_at', '-id'),
+         'post_blocked_idx'),
+    ]
+
+    for queryset, index in queries:
+        plan = explain(queryset)
+
+        assert index in indexes_used(plan), plan
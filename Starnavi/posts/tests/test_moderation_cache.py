@@ -0,0 +1,135 @@
+import pytest
+
+from better_profanity import profanity
+
+from posts import metrics
+from posts.cache import LRUCache
+from posts.services import MODERATION_CACHE, moderate_content
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+
+    """
+
+    Fixture starting every test with an empty verdict cache.
+
+    """
+
+    MODERATION_CACHE.clear()
+    yield
+    MODERATION_CACHE.clear()
+
+
+def lookups(result):
+
+    """Return the number of cache lookups with ``result`` so far."""
+
+    return metrics.MODERATION_CACHE_REQUESTS.samples.get((result,), 0)
+
+
+@pytest.fixture
+def scans(monkeypatch):
+
+    """
+
+    Fixture counting the texts actually scanned by better-profanity.
+
+    """
+
+    scanned = []
+    original = profanity.contains_profanity
+
+    def contains_profanity(text):
+        scanned.append(text)
+        return original(text)
+
+    monkeypatch.setattr(profanity, 'contains_profanity', contains_profanity)
+
+    return scanned
+
+
+def test_repeated_content_is_scanned_once(scans):
+
+    """
+
+    Test that repeated and re-formatted texts reuse one verdict.
+
+    """
+
+    hits = lookups('local_hit')
+
+    assert moderate_content('Buy cheap damn pills') is True
+
+    assert moderate_content('buy  CHEAP damn\npills ') is True
+
+    assert moderate_content('A clean comment') is False
+
+    assert len(scans) == 2
+
+    assert lookups('local_hit') == hits + 1
+
+
+def test_wordlist_change_invalidates_verdicts(scans):
+
+    """
+
+    Test that verdicts are recomputed after the wordlist changes.
+
+    """
+
+    assert moderate_content('zorblax') is False
+
+    profanity.add_censor_words(['zorblax'])
+
+    try:
+        assert moderate_content('zorblax') is True
+    finally:
+        profanity.load_censor_words()
+
+    assert moderate_content('zorblax') is False
+
+    assert len(scans) == 3
+
+
+def test_verdicts_are_shared_through_django_cache(scans, settings):
+
+    """
+
+    Test that another process's verdict is read from the shared cache.
+
+    """
+
+    settings.POSTS_MODERATION_CACHE_ALIAS = 'default'
+    misses = lookups('miss')
+
+    moderate_content('Shared comment')
+    MODERATION_CACHE.clear()
+    shared_hits = lookups('shared_hit')
+
+    assert moderate_content('Shared comment') is False
+
+    assert lookups('shared_hit') == shared_hits + 1
+
+    assert lookups('miss') == misses + 1
+
+    assert len(scans) == 1
+
+
+def test_lru_cache_evicts_least_recently_used():
+
+    """
+
+    Test that the cache keeps only its most recently used entries.
+
+    """
+
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+
+    assert len(cache) == 2
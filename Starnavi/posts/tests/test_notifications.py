@@ -0,0 +1,360 @@
+from datetime import timedelta
+
+import pytest
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from posts.models import Comment, Notification, NotificationKind, Post
+from posts.services import (
+    NOTIFICATIONS, create_jwt_token, create_notifications,
+    mark_notifications_read, send_auto_replies, unread_notifications)
+
+
+@pytest.fixture(autouse=True)
+def unread_cache():
+
+    """
+
+    Fixture clearing the unread counts cached by other tests.
+
+    """
+
+    caches['shared'].clear()
+    yield
+    caches['shared'].clear()
+
+
+@pytest.fixture
+def author(db):
+
+    return User.objects.create_user(username='author',
+                                    password='password123')
+
+
+@pytest.fixture
+def post(author):
+
+    return Post.objects.create(title='Post', content='Text', author=author)
+
+
+@pytest.fixture
+def author_client(client, author):
+
+    """
+
+    Fixture authenticating the client as the post author.
+
+    """
+
+    client.defaults['HTTP_AUTHORIZATION'] = (
+        f'Bearer {create_jwt_token(author)}')
+
+    return client
+
+
+def make_users(count):
+
+    return User.objects.bulk_create([User(username=f'reader{i}')
+                                     for i in range(count)])
+
+
+def comment_event(post, actor, comment_id=None):
+
+    return (post.author_id, post.id, NotificationKind.COMMENT, actor.id,
+            comment_id)
+
+
+@pytest.mark.django_db
+def test_comments_on_a_post_collapse_into_one_digest(post):
+
+    """
+
+    Test that comments on the same post, in one batch or later ones,
+    collapse into the author's unread digest.
+
+    """
+
+    first, second, third = make_users(3)
+
+    create_notifications([comment_event(post, first),
+                          comment_event(post, second)])
+    create_notifications([comment_event(post, third)])
+
+    [digest] = Notification.objects.all()
+
+    assert digest.recipient_id == post.author_id
+    assert digest.count == 3
+    assert digest.actor_id == third.id
+
+
+@pytest.mark.django_db
+def test_digests_close_when_read_or_old(post, settings):
+
+    """
+
+    Test that comments after a digest is read, or older than the digest
+    window, start a new digest.
+
+    """
+
+    settings.POSTS_NOTIFICATION_DIGEST_WINDOW = 60
+    [reader] = make_users(1)
+
+    create_notifications([comment_event(post, reader)])
+    Notification.objects.update(read_at=Notification.objects.get().updated_at)
+    create_notifications([comment_event(post, reader)])
+    Notification.objects.filter(read_at__isnull=True).update(
+        created_at=Notification.objects.get(read_at__isnull=True).created_at
+        - timedelta(seconds=61))
+    create_notifications([comment_event(post, reader)])
+
+    assert list(Notification.objects.order_by('id')
+                .values_list('count', flat=True)) == [1, 1, 1]
+
+
+@pytest.mark.django_db
+def test_batch_is_written_with_a_fixed_number_of_queries(post):
+
+    """
+
+    Test that a batch of events for many posts and recipients costs one
+    read, one update and one insert, besides the cached unread counts.
+
+    """
+
+    readers = make_users(10)
+    posts = [Post.objects.create(title=f'Post {i}', content='Text',
+                                 author=reader)
+             for i, reader in enumerate(readers)]
+
+    create_notifications([comment_event(posts[0], readers[1])])
+
+    events = [comment_event(target, reader)
+              for target in posts for reader in readers
+              if reader.id != target.author_id]
+
+    with CaptureQueriesContext(connection) as queries:
+        create_notifications(events)
+
+    # Read, update and insert; without Redis the shared cache is a table.
+    assert len([query for query in queries
+                if 'posts_cache' not in query['sql']]) == 3
+
+    assert Notification.objects.count() == 10
+    assert Notification.objects.get(post=posts[0]).count == 10
+
+
+@pytest.mark.django_db
+def test_create_comment_notifies_the_post_author(
+        post, author, client, settings, django_capture_on_commit_callbacks):
+
+    """
+
+    Test that comments notify the post's author in the background, except
+    the author's own.
+
+    """
+
+    settings.POSTS_BACKGROUND_TASKS_EAGER = True
+    [reader] = make_users(1)
+
+    for user in (reader, author):
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.post(
+                f'/api/posts/{post.id}/comments/',
+                {'content': f'Comment by {user.username}'},
+                content_type='application/json',
+                HTTP_AUTHORIZATION=f'Bearer {create_jwt_token(user)}')
+
+        assert response.status_code == 201
+
+    [digest] = Notification.objects.all()
+
+    assert (digest.recipient_id, digest.actor_id, digest.kind) == (
+        author.id, reader.id, NotificationKind.COMMENT)
+
+
+@pytest.mark.django_db
+def test_auto_replies_notify_the_commenters(
+        post, author, settings, django_capture_on_commit_callbacks):
+
+    """
+
+    Test that an automatic reply notifies the commenter it answers.
+
+    """
+
+    settings.POSTS_BACKGROUND_TASKS_EAGER = True
+    Post.objects.filter(id=post.id).update(auto_reply_enabled=True,
+                                           auto_reply_text='Thanks!')
+    [reader] = make_users(1)
+    comment = Comment.objects.create(post=post, author=reader,
+                                     content='Nice post')
+
+    with django_capture_on_commit_callbacks(execute=True):
+        send_auto_replies([comment.id])
+
+    [digest] = Notification.objects.all()
+
+    assert (digest.recipient_id, digest.actor_id, digest.kind) == (
+        reader.id, author.id, NotificationKind.REPLY)
+    assert Comment.objects.get(id=digest.comment_id).content == 'Thanks!'
+
+
+@pytest.mark.django_db
+def test_create_comment_queues_notifications(
+        post, client, monkeypatch, django_capture_on_commit_callbacks):
+
+    """
+
+    Test that creating a comment hands its notification to the
+    background worker instead of writing it.
+
+    """
+
+    queued = []
+    monkeypatch.setattr(NOTIFICATIONS, 'submit', queued.append)
+    [reader] = make_users(1)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.post(
+            f'/api/posts/{post.id}/comments/', {'content': 'Hello'},
+            content_type='application/json',
+            HTTP_AUTHORIZATION=f'Bearer {create_jwt_token(reader)}')
+
+    assert queued == [comment_event(post, reader, response.json()['id'])]
+    assert not Notification.objects.exists()
+
+
+@pytest.mark.django_db
+def test_unread_count_is_shared_by_workers(post, author):
+
+    """
+
+    Test that the unread count cached by one worker follows the digests
+    created and read through another.
+
+    """
+
+    # Each worker holds its own connection to the shared cache.
+    other_worker = caches.create_connection('shared')
+    key = f'posts:notifications:unread:{author.id}'
+    first, second = make_users(2)
+    other = Post.objects.create(title='Other', content='Text', author=author)
+
+    create_notifications([comment_event(post, first)])
+
+    assert unread_notifications(author) == 1
+
+    create_notifications([comment_event(post, second),
+                          comment_event(other, second)])
+
+    assert other_worker.get(key) == 2
+
+    assert unread_notifications(author) == 2
+
+    mark_notifications_read(author)
+
+    assert other_worker.get(key) is None
+
+    create_notifications([comment_event(other, first)])
+
+    assert unread_notifications(author) == 1
+
+    assert other_worker.get(key) == 1
+
+    with CaptureQueriesContext(connection) as queries:
+        other_worker.delete(key)
+        assert unread_notifications(author) == 1
+
+    assert any('"read_at" IS NULL' in query['sql'] for query in queries)
+
+
+@pytest.mark.django_db
+def test_list_and_read_notifications(post, author, author_client):
+
+    """
+
+    Test paging through notifications, most recently updated first, and
+    marking them read.
+
+    """
+
+    readers = make_users(3)
+    posts = [post] + [Post.objects.create(title=f'Post {i}', content='Text',
+                                          author=author) for i in range(2)]
+
+    for target, reader in zip(posts, readers):
+        create_notifications([comment_event(target, reader)])
+
+    # Bumped to the top.
+    create_notifications([comment_event(post, readers[1])])
+
+    response = author_client.get('/api/notifications/', {'limit': 2})
+
+    assert response.status_code == 200
+    page = response.json()
+    assert [item['post_id'] for item in page['items']] == [
+        post.id, posts[2].id]
+    assert page['items'][0]['count'] == 2
+    assert page['unread_count'] == 3
+    assert not page['items'][0]['read']
+
+    response = author_client.get('/api/notifications/',
+                                 {'cursor': page['next_cursor']})
+    page = response.json()
+
+    assert [item['post_id'] for item in page['items']] == [posts[1].id]
+    assert page['next_cursor'] is None
+
+    response = author_client.post('/api/notifications/read/')
+
+    assert response.json() == {'unread_count': 0}
+
+    page = author_client.get('/api/notifications/').json()
+
+    assert page['unread_count'] == 0
+    assert all(item['read'] for item in page['items'])
+
+
+@pytest.mark.django_db
+def test_notifications_reject_invalid_cursor(author_client):
+
+    """
+
+    Test that malformed cursors are rejected.
+
+    """
+
+    response = author_client.get('/api/notifications/', {'cursor': 'bad'})
+
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_deleting_comments_does_not_update_digests(post, author):
+
+    """
+
+    Test that deleting a user's comments leaves the digests pointing to
+    them alone, so the delete doesn't grow with the number of comments.
+
+    """
+
+    [reader] = make_users(1)
+    comments = Comment.objects.bulk_create([
+        Comment(post=post, author=reader, content=f'Comment {i}')
+        for i in range(3)])
+
+    create_notifications([comment_event(post, reader, comments[-1].id)])
+
+    with CaptureQueriesContext(connection) as queries:
+        reader.delete()
+
+    assert not [query for query in queries
+                if 'SET "comment_id"' in query['sql']]
+    assert Notification.objects.get().comment_id == comments[-1].id
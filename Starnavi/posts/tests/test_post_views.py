@@ -0,0 +1,178 @@
+import pytest
+
+from posts.models import Post
+from posts.services import POST_VIEWS, flush_post_views
+from posts.tasks import WriteBehindCounter
+
+
+@pytest.fixture
+def posts(auth_client):
+
+    """
+
+    Fixture creating three posts.
+
+    """
+
+    return [Post.objects.create(title=f'Post {i}', content='Content',
+                                author=auth_client.user)
+            for i in range(3)]
+
+
+@pytest.fixture(autouse=True)
+def empty_buffer():
+
+    """
+
+    Fixture discarding views buffered by other tests.
+
+    """
+
+    POST_VIEWS.deltas.clear()
+    yield
+    POST_VIEWS.deltas.clear()
+
+
+def test_counter_sums_increments_until_flushed():
+
+    """
+
+    Test that increments are summed per key and handed over in one batch.
+
+    """
+
+    flushed = []
+    counter = WriteBehindCounter('test', flushed.append, interval=3600)
+
+    for key in (1, 2, 1, 1):
+        counter.add(key)
+
+    assert counter.depth == 2
+    assert flushed == []
+    assert counter.flush() == 2
+    assert flushed == [{1: 3, 2: 1}]
+    assert counter.flush() == 0
+    assert flushed == [{1: 3, 2: 1}]
+
+
+def test_counter_keeps_deltas_when_the_flush_fails():
+
+    """
+
+    Test that deltas survive a failed flush and are merged with new ones.
+
+    """
+
+    def fail(deltas):
+        raise RuntimeError('database is down')
+
+    counter = WriteBehindCounter('test', fail, interval=3600)
+    counter.add('a', 2)
+
+    with pytest.raises(RuntimeError):
+        counter.flush()
+
+    counter.add('a')
+
+    assert counter.deltas == {'a': 3}
+
+    # Nothing left for the flush at exit.
+    counter.deltas.clear()
+
+
+def test_counter_flushes_once_at_exit_whatever_the_restarts(monkeypatch):
+
+    """
+
+    Test that restarting the flush thread, e.g. after a fork, does not
+    register another flush at exit.
+
+    """
+
+    registered = []
+    monkeypatch.setattr('posts.tasks.atexit.register', registered.append)
+
+    counter = WriteBehindCounter('test', lambda deltas: None, interval=3600)
+
+    for _ in range(3):
+        counter.add('a')
+        # The thread of the parent process, as seen after a fork.
+        counter.thread = None
+
+    assert registered == [counter.run_once]
+
+
+def test_flush_batches_updates(posts, django_assert_num_queries, settings):
+
+    """
+
+    Test that a flush writes any number of deltas with one UPDATE per
+    batch.
+
+    """
+
+    settings.POSTS_VIEW_FLUSH_BATCH_SIZE = 2
+    deltas = {posts[0].id: 5, posts[1].id: 1, posts[2].id: 7}
+
+    with django_assert_num_queries(2):
+        flush_post_views(deltas)
+
+    assert [Post.objects.get(id=post.id).view_count for post in posts] == [
+        5, 1, 7]
+
+
+def test_views_are_written_on_flush(auth_client, posts,
+                                    django_assert_num_queries):
+
+    """
+
+    Test that the detail endpoint only buffers views, and that one flush
+    writes the views of every post in one statement.
+
+    """
+
+    for post in (posts[0], posts[1], posts[0]):
+        response = auth_client.get(f'/api/posts/{post.id}/')
+
+        assert response.status_code == 200
+        assert response.json()['id'] == post.id
+
+    assert Post.objects.get(id=posts[0].id).view_count == 0
+    assert POST_VIEWS.deltas == {posts[0].id: 2, posts[1].id: 1}
+
+    with django_assert_num_queries(1):
+        POST_VIEWS.flush()
+
+    assert auth_client.get(f'/api/posts/{posts[0].id}/').json()[
+        'view_count'] == 2
+
+
+def test_blocked_posts_have_no_detail(auth_client, posts):
+
+    """
+
+    Test that blocked posts are not found and not counted.
+
+    """
+
+    Post.all_objects.filter(id=posts[0].id).update(is_blocked=True)
+
+    assert auth_client.get(f'/api/posts/{posts[0].id}/').status_code == 404
+    assert POST_VIEWS.deltas == {}
+
+
+def test_most_viewed_ordering(auth_client, posts):
+
+    """
+
+    Test ordering the post list by view count.
+
+    """
+
+    flush_post_views({posts[1].id: 10, posts[2].id: 3})
+
+    response = auth_client.get('/api/posts/?order_by=most_viewed')
+
+    assert [post['id'] for post in response.json()] == [
+        posts[1].id, posts[2].id, posts[0].id]
+    assert response.json()[0]['view_count'] == 10
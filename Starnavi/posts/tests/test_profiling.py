@@ -0,0 +1,173 @@
+import json
+import time
+
+import pytest
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth.models import User
+from django.test import AsyncClient
+
+from posts.profiling import clear_profiles, recent_profiles
+from posts.services import create_jwt_token
+
+
+@pytest.fixture(autouse=True)
+def profiling(settings):
+
+    """
+
+    Fixture enabling profiling with an empty ring buffer.
+
+    """
+
+    settings.POSTS_PROFILING_ENABLED = True
+    settings.POSTS_PROFILING_SAMPLE_RATE = 0.0
+    settings.POSTS_PROFILING_SLOW_MS = 10_000
+    clear_profiles()
+    yield
+    clear_profiles()
+
+
+@pytest.fixture
+def staff_headers(db):
+
+    """
+
+    Fixture with an Authorization header for a staff user.
+
+    """
+
+    user = User.objects.create_user(username='staff', password='password123',
+                                    is_staff=True)
+
+    return {'HTTP_AUTHORIZATION': f'Bearer {create_jwt_token(user)}'}
+
+
+@pytest.mark.django_db
+def test_fast_requests_are_not_stored(client, staff_headers):
+
+    """
+
+    Test that requests neither sampled nor slow leave no profile.
+
+    """
+
+    client.get('/api/posts/', **staff_headers)
+
+    assert recent_profiles() == []
+
+
+@pytest.mark.django_db
+def test_sampled_request_is_profiled(client, settings, staff_headers):
+
+    """
+
+    Test that sampled requests store cProfile frames and their queries.
+
+    """
+
+    settings.POSTS_PROFILING_SAMPLE_RATE = 1.0
+
+    client.get('/api/posts/', **staff_headers)
+
+    profile = recent_profiles()[0]
+
+    assert profile['mode'] == 'sampled'
+
+    assert profile['operation'] == 'list_posts'
+
+    assert profile['query_count'] == 2
+
+    assert profile['frames'][0]['cumulative_ms'] >= 0
+
+
+@pytest.mark.django_db
+def test_slow_request_stacks_are_sampled(client, settings, staff_headers,
+                                         monkeypatch):
+
+    """
+
+    Test that slow requests store statistically sampled frames.
+
+    """
+
+    settings.POSTS_PROFILING_SLOW_MS = 0
+    settings.POSTS_PROFILING_INTERVAL_MS = 1
+
+    def slow_moderation(content):
+        time.sleep(0.1)
+        return False
+
+    monkeypatch.setattr('posts.views.moderate_content', slow_moderation)
+
+    client.post('/api/posts/',
+                json.dumps({'title': 'Post', 'content': 'Content'}),
+                content_type='application/json',
+                **staff_headers)
+
+    profile = recent_profiles()[0]
+
+    assert profile['mode'] == 'slow'
+
+    assert profile['operation'] == 'create_post'
+
+    assert 'slow_moderation' in profile['frames'][0]['frame']
+
+
+@pytest.mark.django_db
+def test_async_requests_profile_their_view(settings, staff_headers,
+                                           monkeypatch):
+
+    """
+
+    Test that a profiled request served over ASGI profiles the thread
+    running its synchronous view.
+
+    """
+
+    settings.POSTS_PROFILING_SAMPLE_RATE = 1.0
+    settings.POSTS_PROFILING_TOP_FRAMES = 10_000
+
+    def moderate_for_profile(content):
+        return False
+
+    monkeypatch.setattr('posts.views.moderate_content', moderate_for_profile)
+
+    async_to_sync(AsyncClient().post)(
+        '/api/posts/', {'title': 'Post', 'content': 'Content'},
+        content_type='application/json',
+        headers={'Authorization': staff_headers['HTTP_AUTHORIZATION']})
+
+    profile = recent_profiles()[0]
+
+    assert profile['operation'] == 'create_post'
+
+    assert profile['query_count'] > 0
+
+    assert any('moderate_for_profile' in frame['frame']
+               for frame in profile['frames'])
+
+
+@pytest.mark.django_db
+def test_profiles_endpoint_is_staff_only(client, staff_headers):
+
+    """
+
+    Test that only staff users can read profiles.
+
+    """
+
+    user = User.objects.create_user(username='user', password='password123')
+
+    response = client.get(
+                    '/api/profiles/',
+                    HTTP_AUTHORIZATION=f'Bearer {create_jwt_token(user)}',
+                    )
+
+    assert response.status_code == 403
+
+    response = client.get('/api/profiles/', **staff_headers)
+
+    assert response.status_code == 200
+
+    assert response.json() == []
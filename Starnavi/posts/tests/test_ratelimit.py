@@ -0,0 +1,187 @@
+import pytest
+
+from django.contrib.auth.models import User
+
+from posts import metrics
+from posts.models import Post
+from posts.ratelimit import (
+    CacheRateLimiter, MemoryRateLimiter, parse_rate)
+from posts.services import create_jwt_token
+
+
+@pytest.fixture
+def clock(monkeypatch):
+
+    """
+
+    Fixture replacing both clocks of the rate limiters with a settable one.
+
+    """
+
+    class Clock:
+        now = 1_000_000.0
+
+        def __call__(self):
+            return self.now
+
+    clock = Clock()
+    monkeypatch.setattr('posts.ratelimit.time.monotonic', clock)
+    monkeypatch.setattr('posts.ratelimit.time.time', clock)
+
+    return clock
+
+
+def test_parse_rate():
+
+    """
+
+    Test parsing rates and rejecting invalid ones.
+
+    """
+
+    assert parse_rate('30/m') == (30, 60)
+    assert parse_rate('1/s') == (1, 1)
+    assert parse_rate('1000/d') == (1000, 86400)
+
+    for rate in ('30', '0/m', 'x/m', '30/w'):
+        with pytest.raises(ValueError):
+            parse_rate(rate)
+
+
+def test_memory_limiter_allows_burst_then_spaces_requests(clock):
+
+    """
+
+    Test that GCRA allows ``limit`` requests at once, then one request per
+    ``period / limit`` seconds.
+
+    """
+
+    limiter = MemoryRateLimiter()
+
+    assert [limiter.hit('k', 3, 60) for _ in range(3)] == [0, 0, 0]
+    assert limiter.hit('k', 3, 60) == pytest.approx(20)
+    assert limiter.hit('other', 3, 60) == 0
+
+    clock.now += 20
+
+    assert limiter.hit('k', 3, 60) == 0
+    assert limiter.hit('k', 3, 60) == pytest.approx(20)
+
+
+def test_memory_limiter_is_bounded(clock):
+
+    """
+
+    Test that the limiter keeps at most ``max_keys`` keys, forgetting idle
+    ones first.
+
+    """
+
+    limiter = MemoryRateLimiter(max_keys=2)
+    limiter.hit('idle', 10, 1)
+    clock.now += 10
+    limiter.hit('active', 10, 60)
+    limiter.hit('new', 10, 60)
+
+    assert set(limiter.due) == {'active', 'new'}
+
+    limiter.hit('newer', 10, 60)
+
+    assert len(limiter.due) == 2
+
+
+def test_cache_limiter_sliding_window(clock, settings):
+
+    """
+
+    Test that the cache limiter weighs the previous window by the part
+    of it still covered.
+
+    """
+
+    settings.CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ratelimit-tests',
+    }}
+    limiter = CacheRateLimiter('default')
+    clock.now = 600.0
+
+    assert [limiter.hit('k', 4, 60) for _ in range(4)] == [0, 0, 0, 0]
+    assert limiter.hit('k', 4, 60) == pytest.approx(60)
+
+    # A quarter into the next window the previous one weighs 3.
+    clock.now = 675.0
+
+    assert limiter.hit('k', 4, 60) == 0
+    assert limiter.hit('k', 4, 60) == pytest.approx(15)
+
+    # Halfway it weighs 2.
+    clock.now = 690.0
+
+    assert limiter.hit('k', 4, 60) == 0
+    assert limiter.hit('k', 4, 60) > 0
+
+
+@pytest.mark.django_db
+def test_rate_limited_requests_get_429(auth_client, settings):
+
+    """
+
+    Test that requests over the limit are rejected with Retry-After and
+    counted, without creating anything.
+
+    """
+
+    settings.POSTS_RATE_LIMITS = {'posts': '2/m'}
+    limited = metrics.RATE_LIMITED.samples.get(('posts',), 0)
+
+    data = {'title': 'Title', 'content': 'Content'}
+    statuses = [auth_client.post('/api/posts/', data,
+                                 content_type='application/json').status_code
+                for _ in range(3)]
+
+    assert statuses == [201, 201, 429]
+
+    response = auth_client.post('/api/posts/', data,
+                                content_type='application/json')
+
+    assert response.status_code == 429
+    assert response.json() == {'error': 'Rate limit exceeded'}
+    assert 1 <= int(response['Retry-After']) <= 30
+    assert Post.objects.count() == 2
+    assert metrics.RATE_LIMITED.samples[('posts',)] == limited + 2
+
+
+@pytest.mark.django_db
+def test_scopes_and_users_are_limited_separately(auth_client, settings):
+
+    """
+
+    Test that a user's limit in one scope does not affect other scopes or
+    other users.
+
+    """
+
+    settings.POSTS_RATE_LIMITS = {'posts': '1/m', 'comments': None}
+    data = {'title': 'Title', 'content': 'Content'}
+
+    post_id = auth_client.post('/api/posts/', data,
+                               content_type='application/json').json()['id']
+
+    assert auth_client.post('/api/posts/', data,
+                            content_type='application/json'
+                            ).status_code == 429
+
+    for _ in range(3):
+        assert auth_client.post(f'/api/posts/{post_id}/comments/',
+                                {'content': 'Comment'},
+                                content_type='application/json'
+                                ).status_code == 201
+
+    other = User.objects.create_user(username='other', password='password123')
+
+    assert auth_client.post(
+        '/api/posts/', data, content_type='application/json',
+        HTTP_AUTHORIZATION=f'Bearer {create_jwt_token(other)}',
+    ).status_code == 201
@@ -0,0 +1,284 @@
+import pytest
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+
+from posts.models import Comment, Post, Reaction, ReactionCount, ReactionTarget
+from posts.reactions import (
+    compact_reaction_counts, delete_orphan_reactions, react, reaction_count,
+    unreact)
+
+
+@pytest.fixture
+def post(db):
+
+    author = User.objects.create_user(username='author',
+                                      password='password123')
+
+    return Post.objects.create(title='Post', content='Text', author=author)
+
+
+def make_users(count):
+
+    return User.objects.bulk_create([User(username=f'fan{i}')
+                                     for i in range(count)])
+
+
+@pytest.mark.django_db
+def test_likes_spread_over_shards_and_sum_on_read(post, settings):
+
+    """
+
+    Test that likes are added to several count slots and the count is
+    their sum.
+
+    """
+
+    settings.POSTS_REACTION_SHARDS = 4
+
+    for user in make_users(40):
+        assert react(user, ReactionTarget.POST, post.id)
+
+    slots = ReactionCount.objects.filter(target_type=ReactionTarget.POST,
+                                         target_id=post.id)
+
+    assert 1 < slots.count() <= 4
+    assert set(slots.values_list('shard', flat=True)) <= {0, 1, 2, 3}
+    assert reaction_count(ReactionTarget.POST, post.id) == 40
+
+
+@pytest.mark.django_db
+def test_react_and_unreact_are_idempotent(post):
+
+    """
+
+    Test that a user likes a target at most once and unliking twice
+    removes one like.
+
+    """
+
+    [user] = make_users(1)
+
+    assert react(user, ReactionTarget.POST, post.id)
+    assert not react(user, ReactionTarget.POST, post.id)
+    assert reaction_count(ReactionTarget.POST, post.id) == 1
+
+    assert unreact(user, ReactionTarget.POST, post.id)
+    assert not unreact(user, ReactionTarget.POST, post.id)
+    assert reaction_count(ReactionTarget.POST, post.id) == 0
+    assert not Reaction.objects.exists()
+
+
+@pytest.mark.django_db
+def test_compaction_folds_slots_into_one_row(post, settings):
+
+    """
+
+    Test that compaction keeps one row per target with the total, and
+    none for targets whose likes were all removed.
+
+    """
+
+    settings.POSTS_REACTION_SHARDS = 8
+    users = make_users(30)
+    comment = Comment.objects.create(post=post, author=users[0],
+                                     content='Comment')
+
+    for user in users:
+        react(user, ReactionTarget.POST, post.id)
+        react(user, ReactionTarget.COMMENT, comment.id)
+
+    for user in users[:10]:
+        unreact(user, ReactionTarget.POST, post.id)
+
+    for user in users:
+        unreact(user, ReactionTarget.COMMENT, comment.id)
+
+    assert compact_reaction_counts(batch_size=1) == 2
+
+    [slot] = ReactionCount.objects.all()
+
+    assert (slot.target_type, slot.target_id) == (ReactionTarget.POST,
+                                                  post.id)
+    assert slot.count == 20
+    assert reaction_count(ReactionTarget.COMMENT, comment.id) == 0
+    assert compact_reaction_counts() == 0
+
+
+@pytest.mark.django_db
+def test_reactions_of_deleted_targets_are_removed(post, settings):
+
+    """
+
+    Test that compaction deletes the reactions and counts of posts and
+    comments deleted since, including through a user's deletion.
+
+    """
+
+    settings.POSTS_REACTION_SHARDS = 4
+    fans = make_users(5)
+    commenter = User.objects.create(username='commenter')
+    kept = Post.objects.create(title='Kept', content='Text',
+                               author=post.author)
+    comment = Comment.objects.create(post=kept, author=commenter,
+                                     content='Comment')
+
+    for fan in fans:
+        for target_type, target_id in ((ReactionTarget.POST, post.id),
+                                       (ReactionTarget.COMMENT, comment.id),
+                                       (ReactionTarget.POST, kept.id)):
+            react(fan, target_type, target_id)
+
+    post.delete()
+    commenter.delete()
+
+    compact_reaction_counts()
+
+    assert set(Reaction.objects.values_list('target_id', flat=True)) == {
+        kept.id}
+    assert set(ReactionCount.objects.values_list('target_id',
+                                                 flat=True)) == {kept.id}
+    assert reaction_count(ReactionTarget.POST, kept.id) == 5
+    assert delete_orphan_reactions() == 0
+
+
+@pytest.mark.django_db
+def test_compact_reactions_command(post, capsys):
+
+    """
+
+    Test that the command compacts the counts and reports how many.
+
+    """
+
+    ReactionCount.objects.bulk_create([
+        ReactionCount(target_type=ReactionTarget.POST, target_id=post.id,
+                      shard=shard, count=2)
+        for shard in range(3)])
+
+    call_command('compact_reactions')
+
+    assert 'Compacted the reaction counts of 1 targets' in (
+        capsys.readouterr().out)
+    assert reaction_count(ReactionTarget.POST, post.id) == 6
+
+
+@pytest.mark.django_db
+def test_like_and_unlike_post(auth_client, post):
+
+    """
+
+    Test liking a post twice and unliking it through the API.
+
+    """
+
+    url = f'/api/posts/{post.id}/like/'
+
+    response = auth_client.post(url)
+
+    assert response.status_code == 201
+    assert response.json() == {'target_id': post.id, 'reacted': True,
+                               'count': 1}
+
+    assert auth_client.post(url).status_code == 200
+
+    response = auth_client.delete(url)
+
+    assert response.status_code == 200
+    assert response.json() == {'target_id': post.id, 'reacted': False,
+                               'count': 0}
+
+
+@pytest.mark.django_db
+def test_like_comment(auth_client, post):
+
+    """
+
+    Test liking a comment through the API.
+
+    """
+
+    comment = Comment.objects.create(post=post, author=post.author,
+                                     content='Comment')
+
+    response = auth_client.post(f'/api/comments/{comment.id}/like/')
+
+    assert response.status_code == 201
+    assert response.json()['count'] == 1
+
+    response = auth_client.delete(f'/api/comments/{comment.id}/like/')
+
+    assert response.json()['count'] == 0
+
+
+@pytest.mark.django_db
+def test_hidden_targets_cannot_be_liked(auth_client, post):
+
+    """
+
+    Test that blocked and missing posts and comments are not found.
+
+    """
+
+    blocked_post = Post.objects.create(title='Blocked', content='Text',
+                                       author=post.author, is_blocked=True)
+    blocked_comment = Comment.objects.create(post=post, author=post.author,
+                                             content='Rude', is_blocked=True)
+
+    for url in (f'/api/posts/{blocked_post.id}/like/', '/api/posts/0/like/',
+                f'/api/comments/{blocked_comment.id}/like/'):
+        assert auth_client.post(url).status_code == 404
+
+    assert not Reaction.objects.exists()
+
+
+@pytest.mark.django_db
+def test_list_reactions_in_bulk(auth_client, post,
+                                django_assert_max_num_queries):
+
+    """
+
+    Test that the counts of many targets and the user's own likes are
+    returned in the requested order.
+
+    """
+
+    other = Post.objects.create(title='Other', content='Text',
+                                author=post.author)
+
+    for user in make_users(3):
+        react(user, ReactionTarget.POST, other.id)
+
+    react(auth_client.user, ReactionTarget.POST, post.id)
+
+    # Authentication, the counts and the user's likes.
+    with django_assert_max_num_queries(3):
+        response = auth_client.get(
+            '/api/reactions/', {'ids': f'{other.id},{post.id},0'})
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {'target_id': other.id, 'count': 3, 'reacted': False},
+        {'target_id': post.id, 'count': 1, 'reacted': True},
+        {'target_id': 0, 'count': 0, 'reacted': False},
+    ]
+
+
+@pytest.mark.django_db
+def test_list_reactions_validates_ids(auth_client, settings):
+
+    """
+
+    Test that malformed and too many ids are rejected.
+
+    """
+
+    settings.POSTS_REACTIONS_MAX_IDS = 2
+
+    assert auth_client.get('/api/reactions/',
+                           {'ids': 'x'}).status_code == 400
+    assert auth_client.get('/api/reactions/',
+                           {'ids': '1,2,3'}).status_code == 400
+    assert auth_client.get('/api/reactions/',
+                           {'ids': '1,2', 'target': 'users'}
+                           ).status_code == 422
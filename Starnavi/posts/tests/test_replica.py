@@ -0,0 +1,153 @@
+import pytest
+
+from django.conf import settings as django_settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+
+from posts.models import Post, Comment
+from posts.services import create_jwt_token
+
+
+pytestmark = [
+    pytest.mark.skipif('replica' not in django_settings.DATABASES,
+                       reason='no replica database configured'),
+    pytest.mark.django_db(databases=['default', 'replica']),
+]
+
+
+@pytest.fixture(autouse=True)
+def replica(settings):
+
+    """
+
+    Fixture routing replica reads to the second test database.
+
+    """
+
+    settings.POSTS_READ_REPLICA = 'replica'
+    caches['shared'].clear()
+    yield
+    caches['shared'].clear()
+
+
+def create_user(username):
+
+    """Create a user on the primary and copy it to the replica."""
+
+    user = User.objects.create_user(username=username, password='pass123')
+    User.objects.using('replica').create(id=user.id, username=username)
+
+    return user
+
+
+def headers(user):
+
+    """Return an Authorization header for ``user``."""
+
+    return {'HTTP_AUTHORIZATION': f'Bearer {create_jwt_token(user)}'}
+
+
+def test_list_endpoints_read_the_replica(client):
+
+    """
+
+    Test that list and analytics reads are served by the replica.
+
+    """
+
+    user = create_user('reader')
+    Post.objects.create(title='Primary', content='Content', author=user)
+    post = Post.objects.using('replica').create(title='Replica',
+                                                content='Content',
+                                                author_id=user.id)
+    Comment.objects.using('replica').create(post=post, author_id=user.id,
+                                            content='Replicated')
+
+    response = client.get('/api/posts/', **headers(user))
+
+    assert [p['title'] for p in response.json()] == ['Replica']
+
+    response = client.get(f'/api/posts/{post.id}/comments/', **headers(user))
+
+    assert [c['content'] for c in response.json()] == ['Replicated']
+
+    response = client.get('/api/comments-daily-breakdown/',
+                          {'date_from': '2000-01-01',
+                           'date_to': '2100-01-01'},
+                          **headers(user))
+
+    assert response.json()['total_comments'] == 1
+
+
+def test_writer_reads_own_writes_from_the_primary(client):
+
+    """
+
+    Test that a user who just wrote is served by the primary.
+
+    """
+
+    writer = create_user('writer')
+    other = create_user('other')
+    post = Post.objects.create(title='Post', content='Content', author=writer)
+    Post.objects.using('replica').create(id=post.id, title='Post',
+                                         content='Content',
+                                         author_id=writer.id)
+
+    response = client.post(f'/api/posts/{post.id}/comments/',
+                           {'content': 'Fresh'},
+                           content_type='application/json', **headers(writer))
+
+    assert response.status_code == 201
+
+    assert not Comment.objects.using('replica').exists()
+
+    response = client.get(f'/api/posts/{post.id}/comments/', **headers(writer))
+
+    assert [c['content'] for c in response.json()] == ['Fresh']
+
+    response = client.get(f'/api/posts/{post.id}/comments/', **headers(other))
+
+    assert response.json() == []
+
+
+def test_writers_stay_on_the_primary_across_workers(client):
+
+    """
+
+    Test that the read-your-writes marker is kept in the shared cache,
+    not in the cache of the process that handled the write.
+
+    """
+
+    writer = create_user('writer')
+
+    response = client.post('/api/posts/', {'title': 'Post',
+                                           'content': 'Content'},
+                           content_type='application/json', **headers(writer))
+
+    assert response.status_code == 201
+
+    # Another worker's per-process cache.
+    caches['default'].clear()
+
+    response = client.get('/api/posts/', **headers(writer))
+
+    assert [p['title'] for p in response.json()] == ['Post']
+
+
+def test_reads_stay_on_the_primary_without_a_replica(client, settings):
+
+    """
+
+    Test that nothing is read from the replica unless it is configured.
+
+    """
+
+    settings.POSTS_READ_REPLICA = None
+    user = create_user('reader')
+    Post.objects.create(title='Primary', content='Content', author=user)
+
+    response = client.get('/api/posts/', **headers(user))
+
+    assert [p['title'] for p in response.json()] == ['Primary']
@@ -0,0 +1,150 @@
+import tracemalloc
+
+import pytest
+
+from django.contrib.auth.models import User
+
+from posts.models import Post, Comment
+from posts.services import create_jwt_token, send_auto_replies
+from posts.tasks import TimerScheduler
+
+
+@pytest.fixture
+def user(db):
+
+    """
+
+    Fixture to create the author of the posts.
+
+    """
+
+    return User.objects.create_user(username='testuser',
+                                    password='password123')
+
+
+def test_items_due_in_the_same_tick_fire_together(monkeypatch):
+
+    """
+
+    Test that items due in one tick reach the handler as one batch.
+
+    """
+
+    batches = []
+    scheduler = TimerScheduler('test', batches.append, tick=0.1)
+
+    monkeypatch.setattr('posts.tasks.monotonic', lambda: 0.0)
+
+    for item in range(3):
+        scheduler.schedule(item, delay=0.05)
+
+    monkeypatch.undo()
+
+    assert scheduler.join(timeout=5)
+
+    assert batches == [[0, 1, 2]]
+
+
+def test_scheduler_refuses_items_beyond_max_pending():
+
+    """
+
+    Test that the number of pending items is bounded.
+
+    """
+
+    scheduler = TimerScheduler('test', lambda batch: None, max_pending=2)
+
+    assert scheduler.schedule(1, delay=3600)
+
+    assert scheduler.schedule(2, delay=3600)
+
+    assert not scheduler.schedule(3, delay=3600)
+
+    assert scheduler.depth == 2
+
+
+def test_pending_item_memory_is_bounded():
+
+    """
+
+    Test the memory held per pending item.
+
+    """
+
+    scheduler = TimerScheduler('test', lambda batch: None)
+    scheduler.start()
+    count = 10_000
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+
+    for comment_id in range(10**9, 10**9 + count):
+        scheduler.schedule(comment_id, delay=3600)
+
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    used = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+
+    assert used / count < 256
+
+
+@pytest.mark.django_db
+def test_send_auto_replies_batches_writes(user, django_assert_num_queries):
+
+    """
+
+    Test that a batch of replies costs a fixed number of queries.
+
+    """
+
+    posts = [Post.objects.create(title=f'Post {i}', content='Content',
+                                 author=user, auto_reply_enabled=True,
+                                 auto_reply_text='Thanks!')
+             for i in range(2)]
+    quiet = Post.objects.create(title='Quiet', content='Content', author=user)
+
+    comments = [Comment.objects.create(post=post, author=user, content='Hi')
+                for post in (posts[0], posts[0], posts[1], quiet)]
+
+    with django_assert_num_queries(5):
+        send_auto_replies([comment.id for comment in comments])
+
+    replies = Comment.objects.filter(content='Thanks!')
+
+    assert sorted(reply.post_id for reply in replies) == [
+        posts[0].id, posts[0].id, posts[1].id]
+
+    assert Post.objects.get(id=posts[0].id).comment_count == 2
+
+    assert Post.objects.get(id=quiet.id).comment_count == 0
+
+
+@pytest.mark.django_db
+def test_create_comment_schedules_auto_reply(
+        client, user, settings, django_capture_on_commit_callbacks):
+
+    """
+
+    Test that commenting on a post with auto-replies schedules a reply
+    once the comment is committed.
+
+    """
+
+    settings.POSTS_BACKGROUND_TASKS_EAGER = True
+    headers = {'HTTP_AUTHORIZATION': f'Bearer {create_jwt_token(user)}'}
+    post = Post.objects.create(title='Post', content='Content', author=user,
+                               auto_reply_enabled=True, auto_reply_delay=5,
+                               auto_reply_text='Thanks!')
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.post(f'/api/posts/{post.id}/comments/',
+                               {'content': 'Hi'},
+                               content_type='application/json', **headers)
+
+    assert response.status_code == 201
+
+    assert Comment.objects.filter(post=post, content='Thanks!').exists()
+
+    assert Post.objects.get(id=post.id).comment_count == 2
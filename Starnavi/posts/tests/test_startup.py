@@ -0,0 +1,125 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from better_profanity import profanity
+
+from django.conf import settings
+from django.urls import get_resolver
+
+from posts import services
+
+
+STARTUP = ("import django; django.setup(); "
+           "from Starnavi.wsgi import application")
+
+# Modules only needed by rarely used paths (profiling, export, import).
+DEFERRED = ("cProfile", "pstats", "posts.export", "posts.importing")
+
+
+def importtime_report(path):
+
+    """
+
+    Start a worker under ``python -X importtime``, write the report sorted
+    by cumulative time to ``path`` and return the imported modules with
+    their cumulative microseconds.
+
+    """
+
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE,
+               PYTHONPATH=str(settings.BASE_DIR))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                             STARTUP],
+                            capture_output=True, text=True, env=env,
+                            cwd=settings.BASE_DIR, check=True)
+
+    modules = {}
+
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+
+        _, cumulative, name = line.split("|")
+
+        if cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative)
+
+    Path(path).write_text("".join(
+        f"{micros / 1000:10.1f} ms  {name}\n"
+        for name, micros in sorted(modules.items(), key=lambda item: -item[1])
+    ))
+
+    return modules
+
+
+def test_importtime_report(tmp_path):
+
+    """
+
+    Test that a worker starts without importing modules of rarely used
+    paths, and keep its ``-X importtime`` profile as an artifact (in
+    ``POSTS_IMPORTTIME_REPORT`` if set).
+
+    """
+
+    path = os.getenv("POSTS_IMPORTTIME_REPORT",
+                     str(tmp_path / "importtime.txt"))
+    modules = importtime_report(path)
+
+    assert "posts.views" in modules
+    assert [name for name in DEFERRED if name in modules] == []
+    assert Path(path).read_text().strip()
+
+
+def test_warm_up_preloads_the_request_path():
+
+    """
+
+    Test that warming up loads the URLconf and the moderation wordlist.
+
+    """
+
+    assert services.warm_up() >= 0
+    assert profanity.CENSOR_WORDSET
+    assert services._wordlist[0] is not None
+    assert "posts.views" in sys.modules
+    assert get_resolver().resolve("/api/posts/")
+
+
+def run_worker(code):
+
+    """Run ``code`` in a new process with the project's settings."""
+
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE,
+               PYTHONPATH=str(settings.BASE_DIR), POSTS_WARM_UP="1")
+
+    return subprocess.run([sys.executable, "-c", code], capture_output=True,
+                          text=True, env=env, cwd=settings.BASE_DIR,
+                          check=True)
+
+
+def test_only_serving_processes_warm_up():
+
+    """
+
+    Test that setting Django up, as management commands do, neither warms
+    up nor starts the scheduler, and that the server entry points do.
+
+    """
+
+    report = ("import sys, threading; "
+              "print('posts.views' in sys.modules, "
+              "'posts-auto-reply' in [t.name for t in threading.enumerate()])")
+
+    command = run_worker("import django; django.setup(); " + report)
+
+    assert command.stdout.split() == ["False", "False"]
+    assert "Warmed up" not in command.stderr
+
+    for entry_point in ("Starnavi.wsgi", "Starnavi.asgi"):
+        server = run_worker(f"import {entry_point}; " + report)
+
+        assert server.stdout.split() == ["True", "True"]
+        assert "Warmed up" in server.stderr
@@ -0,0 +1,425 @@
+import asyncio
+import json
+
+import pytest
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth.models import User
+from django.test import AsyncClient
+
+from posts.models import Comment, Post
+from posts.services import create_jwt_token, send_auto_replies
+from posts.streams import (
+    BROKER, Broker, PostgresBackend, TooManySubscribers, publish_comments)
+
+
+@pytest.fixture(autouse=True)
+def close_streams():
+
+    """
+
+    Fixture releasing the subscriptions left open by a test.
+
+    """
+
+    yield
+    BROKER.clear()
+
+
+@pytest.fixture
+def author(db):
+
+    return User.objects.create_user(username='author',
+                                    password='password123')
+
+
+@pytest.fixture
+def post(author):
+
+    return Post.objects.create(title='Live', content='Text', author=author)
+
+
+def stream_url(post):
+
+    return f'/api/posts/{post.id}/comments/stream/'
+
+
+def auth_headers(user):
+
+    return {'Authorization': f'Bearer {create_jwt_token(user)}'}
+
+
+async def next_message(response):
+
+    """Return the next SSE message of ``response`` as text."""
+
+    chunk = await asyncio.wait_for(anext(response.streaming_content), 1)
+
+    return chunk.decode()
+
+
+def parse_event(message):
+
+    """Return the id and data of an SSE ``comment`` event."""
+
+    fields = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+
+    assert fields['event'] == 'comment'
+
+    return int(fields['id']), json.loads(fields['data'])
+
+
+def test_broker_delivers_to_the_subscribers_of_the_post():
+
+    """
+
+    Test that an event only reaches the subscriptions of its post.
+
+    """
+
+    broker = Broker(max_subscribers=10, max_events=10)
+    first = broker.subscribe(1)
+    second = broker.subscribe(1)
+    other = broker.subscribe(2)
+
+    assert broker.deliver(1, (7, '{}')) == 2
+    assert list(first.events) == [(7, '{}')]
+    assert list(second.events) == [(7, '{}')]
+    assert not other.events
+
+
+def test_broker_refuses_subscribers_over_the_limit():
+
+    """
+
+    Test that a full broker refuses new subscriptions until one closes.
+
+    """
+
+    broker = Broker(max_subscribers=2, max_events=10)
+    first = broker.subscribe(1)
+    broker.subscribe(2)
+
+    with pytest.raises(TooManySubscribers):
+        broker.subscribe(3)
+
+    broker.unsubscribe(first)
+    broker.unsubscribe(first)
+
+    assert broker.count == 1
+    broker.subscribe(3)
+
+
+def test_broker_drops_subscribers_falling_behind():
+
+    """
+
+    Test that a subscription whose buffer is full is closed and removed
+    instead of buffering without bound.
+
+    """
+
+    broker = Broker(max_subscribers=10, max_events=2)
+    slow = broker.subscribe(1)
+
+    assert broker.deliver(1, (1, '{}')) == 1
+    assert broker.deliver(1, (2, '{}')) == 1
+    assert broker.deliver(1, (3, '{}')) == 0
+
+    assert slow.closed
+    assert broker.count == 0
+    assert async_to_sync(slow.get)(1) is None
+
+
+def test_subscription_wakes_up_on_events_from_other_threads():
+
+    """
+
+    Test that an event pushed from another thread wakes up the waiting
+    stream.
+
+    """
+
+    broker = Broker(max_subscribers=10, max_events=10)
+    subscription = broker.subscribe(1)
+
+    async def scenario():
+        waiting = asyncio.ensure_future(subscription.get(5))
+        await asyncio.sleep(0)
+        await asyncio.to_thread(broker.deliver, 1, (4, '{}'))
+
+        return await asyncio.wait_for(waiting, 1)
+
+    assert async_to_sync(scenario)() == (4, '{}')
+
+    with pytest.raises(asyncio.TimeoutError):
+        async_to_sync(subscription.get)(0.01)
+
+
+@pytest.mark.django_db
+def test_stream_pushes_new_visible_comments(author, post):
+
+    """
+
+    Test that visible comments published after connecting are streamed
+    and blocked ones are not.
+
+    """
+
+    async def scenario():
+        response = await AsyncClient().get(stream_url(post),
+                                           headers=auth_headers(author))
+
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'text/event-stream'
+        assert (await next_message(response)).startswith('retry:')
+
+        blocked = await Comment.objects.acreate(
+            post=post, author=author, content='Rude', is_blocked=True)
+        visible = await Comment.objects.acreate(
+            post=post, author=author, content='Hello')
+        publish_comments([blocked, visible])
+
+        event_id, data = parse_event(await next_message(response))
+        response.close()
+
+        return visible, event_id, data
+
+    visible, event_id, data = async_to_sync(scenario)()
+
+    assert event_id == visible.id
+    assert data['content'] == 'Hello'
+    assert data['post_id'] == post.id
+    assert BROKER.count == 0
+
+
+@pytest.mark.django_db
+def test_stream_sends_missed_comments_after_last_event_id(author, post):
+
+    """
+
+    Test that a reconnecting client first receives the comments created
+    after its ``Last-Event-ID``.
+
+    """
+
+    seen, first, second = [
+        Comment.objects.create(post=post, author=author, content=text)
+        for text in ('Seen', 'First', 'Second')]
+
+    async def scenario():
+        response = await AsyncClient().get(
+            stream_url(post), headers={**auth_headers(author),
+                                       'Last-Event-ID': str(seen.id)})
+        await next_message(response)
+        events = [parse_event(await next_message(response))
+                  for _ in range(2)]
+
+        # Already sent from the backlog.
+        publish_comments([second])
+        later = await Comment.objects.acreate(post=post, author=author,
+                                              content='Later')
+        publish_comments([later])
+        events.append(parse_event(await next_message(response)))
+        response.close()
+
+        return events, later
+
+    events, later = async_to_sync(scenario)()
+
+    assert [event_id for event_id, _ in events] == [
+        first.id, second.id, later.id]
+
+
+@pytest.mark.django_db
+def test_stream_ends_after_a_full_backlog(author, post, settings):
+
+    """
+
+    Test that a client missing more comments than the backlog holds
+    receives them all over successive reconnections, none skipped.
+
+    """
+
+    settings.POSTS_STREAM_BACKLOG = 100
+    seen = Comment.objects.create(post=post, author=author, content='Seen')
+    comments = Comment.objects.bulk_create([
+        Comment(post=post, author=author, content=f'Missed {i}')
+        for i in range(250)])
+
+    async def reconnect(last_id, expected):
+        response = await AsyncClient().get(
+            stream_url(post), headers={**auth_headers(author),
+                                       'Last-Event-ID': str(last_id)})
+        await next_message(response)
+        events = []
+
+        # The last connection stays open for live comments.
+        async for message in response.streaming_content:
+            events.append(parse_event(message.decode())[0])
+
+            if len(events) == expected:
+                break
+        else:
+            ended.append(len(events))
+
+        response.close()
+
+        return events
+
+    received, ended = [], []
+
+    while len(received) < len(comments):
+        received += async_to_sync(reconnect)(
+            received[-1] if received else seen.id,
+            len(comments) - len(received))
+
+    assert received == [comment.id for comment in comments]
+    assert ended == [100, 100]
+    assert BROKER.count == 0
+
+
+@pytest.mark.django_db
+def test_stream_pushes_auto_replies(author, post,
+                                    django_capture_on_commit_callbacks):
+
+    """
+
+    Test that automatic replies are published once committed.
+
+    """
+
+    Post.objects.filter(id=post.id).update(auto_reply_enabled=True,
+                                           auto_reply_text='Thanks!')
+    commenter = User.objects.create_user(username='commenter',
+                                         password='password123')
+    comment = Comment.objects.create(post=post, author=commenter,
+                                     content='Nice post')
+    subscription = BROKER.subscribe(post.id)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        send_auto_replies([comment.id])
+
+    [(reply_id, data)] = subscription.events
+
+    assert json.loads(data)['content'] == 'Thanks!'
+    assert Comment.objects.get(id=reply_id).author_id == author.id
+
+
+@pytest.mark.django_db
+def test_create_comment_publishes_the_comment(
+        author, post, client, django_capture_on_commit_callbacks):
+
+    """
+
+    Test that a comment created through the API reaches the streams of
+    its post.
+
+    """
+
+    subscription = BROKER.subscribe(post.id)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.post(
+            f'/api/posts/{post.id}/comments/',
+            {'content': 'Streamed'}, content_type='application/json',
+            HTTP_AUTHORIZATION=f'Bearer {create_jwt_token(author)}')
+
+    assert response.status_code == 201
+    [(comment_id, _)] = subscription.events
+    assert comment_id == response.json()['id']
+
+
+@pytest.mark.django_db
+def test_stream_refuses_clients_over_the_limit(author, post):
+
+    """
+
+    Test that streams over ``POSTS_STREAM_MAX_SUBSCRIBERS`` get 503.
+
+    """
+
+    for _ in range(BROKER.max_subscribers - BROKER.count):
+        BROKER.subscribe(post.id)
+
+    response = async_to_sync(AsyncClient().get)(
+        stream_url(post), headers=auth_headers(author))
+
+    assert response.status_code == 503
+    assert response['Retry-After'] == '5'
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('headers, status', [
+    ({}, 401),
+    ({'Authorization': 'Bearer invalid'}, 401),
+])
+def test_stream_requires_authentication(post, headers, status):
+
+    """
+
+    Test that streams require a valid token.
+
+    """
+
+    response = async_to_sync(AsyncClient().get)(stream_url(post),
+                                                headers=headers)
+
+    assert response.status_code == status
+    assert BROKER.count == 0
+
+
+@pytest.mark.django_db
+def test_stream_of_unknown_post_is_not_found(author):
+
+    """
+
+    Test that streaming a missing post returns 404.
+
+    """
+
+    response = async_to_sync(AsyncClient().get)(
+        '/api/posts/999999/comments/stream/', headers=auth_headers(author))
+
+    assert response.status_code == 404
+    assert BROKER.count == 0
+
+
+def test_postgres_backend_sends_long_comments_by_id(monkeypatch):
+
+    """
+
+    Test that notifications too long for NOTIFY carry the comment id
+    only.
+
+    """
+
+    sent = []
+
+    class Cursor:
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            return False
+
+        def execute(self, query, params):
+            sent.append(params)
+
+    class Connection:
+
+        def cursor(self):
+            return Cursor()
+
+    monkeypatch.setattr('posts.streams.connections',
+                        {'default': Connection()})
+    backend = PostgresBackend('default', 'posts_comments')
+
+    backend.publish(1, (10, '"short"'))
+    backend.publish(1, (11, json.dumps('x' * 8000)))
+
+    assert [json.loads(payload) for _, payload in sent] == [
+        {'post_id': 1, 'id': 10, 'data': '"short"'},
+        {'post_id': 1, 'id': 11},
+    ]
@@ -0,0 +1,164 @@
+from datetime import timedelta
+
+import pytest
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils import timezone
+
+from posts.models import Comment, Post
+from posts.services import update_trending
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+
+    """
+
+    Fixture discarding trending lists cached by other tests.
+
+    """
+
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def posts(auth_client):
+
+    """
+
+    Fixture creating three posts.
+
+    """
+
+    return [Post.objects.create(title=f'Post {i}', content='Content',
+                                author=auth_client.user)
+            for i in range(3)]
+
+
+def add_comments(post, count, age):
+
+    """Create ``count`` comments on ``post`` created ``age`` ago."""
+
+    Comment.objects.bulk_create(
+        Comment(post=post, author=post.author, content='Comment',
+                created_at=timezone.now() - age)
+        for _ in range(count))
+
+
+def scores(posts):
+
+    return [Post.all_objects.get(id=post.id).trending_score for post in posts]
+
+
+def test_new_comments_raise_the_score(auth_client, posts):
+
+    """
+
+    Test that every visible comment adds 1 to its post's score.
+
+    """
+
+    for content in ('First', 'Second'):
+        auth_client.post(f'/api/posts/{posts[0].id}/comments/',
+                         {'content': content},
+                         content_type='application/json')
+
+    assert scores(posts) == [2, 0, 0]
+
+
+def test_update_trending_decays_by_age(posts, settings):
+
+    """
+
+    Test that recomputed scores weigh comments by age and drop those
+    outside the window.
+
+    """
+
+    settings.POSTS_TRENDING_HALF_LIFE = 3600
+    settings.POSTS_TRENDING_WINDOW = 6 * 3600
+
+    add_comments(posts[0], 2, timedelta(hours=1))
+    add_comments(posts[1], 1, timedelta(seconds=0))
+    add_comments(posts[2], 5, timedelta(hours=7))
+    Post.all_objects.filter(id=posts[2].id).update(trending_score=5)
+
+    assert update_trending(batch_size=1) == 2
+    assert scores(posts) == [pytest.approx(1, rel=1e-3),
+                             pytest.approx(1, rel=1e-3), 0]
+
+
+def test_update_trending_ignores_blocked_comments(posts):
+
+    """
+
+    Test that blocked comments do not count.
+
+    """
+
+    add_comments(posts[0], 1, timedelta(0))
+    Comment.all_objects.update(is_blocked=True)
+
+    update_trending()
+
+    assert scores(posts) == [0, 0, 0]
+
+
+def test_update_trending_command(posts):
+
+    """
+
+    Test the management command wrapper.
+
+    """
+
+    add_comments(posts[1], 3, timedelta(0))
+
+    call_command('update_trending', batch_size=10)
+
+    assert scores(posts)[1] == pytest.approx(3, rel=1e-3)
+
+
+def test_trending_endpoint_is_ranked_and_cached(auth_client, posts,
+                                                 django_assert_num_queries):
+
+    """
+
+    Test that the endpoint ranks visible scored posts and serves repeated
+    requests from the cache.
+
+    """
+
+    Post.all_objects.filter(id=posts[0].id).update(trending_score=1)
+    Post.all_objects.filter(id=posts[1].id).update(trending_score=3)
+    Post.all_objects.filter(id=posts[2].id).update(trending_score=2,
+                                                   is_blocked=True)
+
+    response = auth_client.get('/api/posts/trending/?limit=5')
+
+    assert response.status_code == 200
+    assert [post['id'] for post in response.json()] == [posts[1].id,
+                                                        posts[0].id]
+
+    Post.all_objects.filter(id=posts[0].id).update(trending_score=10)
+
+    # Only authentication reads the database.
+    with django_assert_num_queries(1):
+        cached = auth_client.get('/api/posts/trending/?limit=5')
+
+    assert cached.json() == response.json()
+
+
+def test_trending_limit_is_bounded(auth_client):
+
+    """
+
+    Test that the limit is validated.
+
+    """
+
+    assert auth_client.get('/api/posts/trending/?limit=1000').status_code \
+        == 422
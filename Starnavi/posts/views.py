@@ -1,23 +1,45 @@
-import threading
 from datetime import datetime
 from ninja import NinjaAPI, Query
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Literal, Optional
 
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
-from django.shortcuts import get_object_or_404
-from django.http import JsonResponse
+from django.db import transaction
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 
-from posts.models import Post, Comment
+from posts import metrics
+from posts.duplicates import find_duplicate, signature_fields, simhash
+from posts.idempotency import idempotent
+from posts.instrumentation import instrument_api, timed
+from posts.keys import get_keyset
+from posts.profiling import recent_profiles
+from posts.ratelimit import rate_limit
+from posts.routers import replica_reads
+from posts.streams import (
+    BROKER, EventStream, TooManySubscribers, missed_comments,
+    publish_comments, subscribe)
+from posts.models import Post, Comment, ReactionTarget
+from posts.reactions import (
+    TARGETS, react, reaction_count, reaction_counts, unreact)
 from posts.services import (
     create_jwt_token, jwt_required, moderate_content,
-    send_auto_reply,register_user, authenticate_user)
+    schedule_auto_reply, register_user, authenticate_user, staff_required,
+    follow_user, unfollow_user, get_feed, FEED_FANOUT,
+    filter_posts, count_new_comment, count_post_view, list_blocked,
+    trending_posts, parse_ids, comment_counts, comment_notifications,
+    queue_notifications, list_notifications, unread_notifications,
+    mark_notifications_read, metrics_access_required)
 
 from posts.schemas import (
     PostIn, PostOut, CommentIn,
     CommentOut, UserRegistration,
-    UserResponse, Token, UserLogin
+    UserResponse, Token, UserLogin,
+    FeedOut, FollowOut, PostFilterSchema,
+    BlockedOut, CommentCountOut, ReactionOut, NotificationsOut, UnreadOut,
     )
 
 
@@ -89,6 +111,8 @@ def login(
 
 @api.post("/posts/", response=PostOut)
 @jwt_required
+@idempotent('posts')
+@rate_limit('posts')
 def create_post(
             request: Any,
             payload: PostIn,
@@ -99,13 +123,17 @@ def create_post(
     Create a new blog post with optional automatic reply settings.
 
     This endpoint allows users to create a blog post, including settings for
-    automatic replies if desired.
+    automatic replies if desired. Retries sending the same
+    ``Idempotency-Key`` header get the first response back.
 
 
     """
 
     is_blocked = moderate_content(payload.content)
 
+    if is_blocked:
+        metrics.MODERATION_BLOCKS.inc('post')
+
     post = Post.objects.create(
         title=payload.title,
         content=payload.content,
@@ -114,8 +142,14 @@ def create_post(
         auto_reply_enabled=payload.auto_reply_enabled,
         auto_reply_delay=payload.auto_reply_delay,
         auto_reply_text=payload.auto_reply_text,
+        auto_reply_policy=payload.auto_reply_policy,
+        auto_reply_max_per_window=payload.auto_reply_max_per_window,
+        auto_reply_window=payload.auto_reply_window,
     )
 
+    if not post.is_blocked:
+        transaction.on_commit(lambda: FEED_FANOUT.submit(post.id))
+
     return JsonResponse(
         {
             "id": post.id,
@@ -130,21 +164,100 @@ def create_post(
 
 @api.get("/posts/", response=List[PostOut])
 @jwt_required
-def list_posts(request: Any) -> List[PostOut]:
+@replica_reads
+def list_posts(
+            request: Any,
+            filters: PostFilterSchema = Query(...),
+            ) -> List[PostOut]:
+
+    """
+
+    Retrieve a list of blog posts.
+
+    Posts can be filtered by author and creation date and ordered by
+    newest first, most commented first or most viewed first. Blocked
+    posts are excluded unless a staff user sets ``include_blocked``.
+
+    """
+
+    if filters.include_blocked and not request.user.is_staff:
+        return JsonResponse({"error": "Staff access required"}, status=403)
+
+    return filter_posts(filters)
+
+
+@api.get("/posts/trending/", response=List[PostOut])
+@jwt_required
+@replica_reads
+def list_trending_posts(
+                    request: Any,
+                    limit: int = Query(20, ge=1, le=100),
+                    ) -> List[Post]:
+
+    """
+
+    Retrieve the posts with the most recent comment activity.
+
+    Posts are ranked by ``trending_score``, their comments weighted by
+    age. The ranking is cached for ``POSTS_TRENDING_CACHE_TIMEOUT``
+    seconds.
+
+    """
+
+    return trending_posts(limit)
+
+
+@api.get("/posts/comment-counts/", response=List[CommentCountOut])
+@jwt_required
+@replica_reads
+def post_comment_counts(
+                    request: Any,
+                    ids: str = Query(...),
+                    ) -> List[Dict[str, int]]:
+
+    """
+
+    Retrieve the total and blocked comment counts of up to
+    ``POSTS_COMMENT_COUNTS_MAX_IDS`` posts, e.g. ``?ids=1,2,3``.
+
+    Unknown and blocked posts are left out.
+
+    """
+
+    try:
+        post_ids = parse_ids(
+            ids, getattr(settings, "POSTS_COMMENT_COUNTS_MAX_IDS", 100))
+    except ValidationError as e:
+        return JsonResponse({"error": e.messages[0]}, status=400)
+
+    return comment_counts(post_ids)
+
+
+@api.get("/posts/{post_id}/", response=PostOut)
+@jwt_required
+@replica_reads
+def get_post(request: Any, post_id: int) -> Post:
 
     """
 
-    Retrieve a list of all blog posts.
+    Retrieve a visible blog post and count the view.
 
-    This endpoint returns all blog posts in the system.
+    ``view_count`` is written in batches, so it lags behind by up to
+    ``POSTS_VIEW_FLUSH_INTERVAL`` seconds.
 
     """
 
-    return Post.objects.all()
+    post = get_object_or_404(Post, id=post_id)
+
+    count_post_view(post)
+
+    return post
 
 
 @api.post("/posts/{post_id}/comments/", response=CommentOut)
 @jwt_required
+@idempotent('comments')
+@rate_limit('comments')
 def create_comment(request: Any,
                    post_id: int,
                    payload: CommentIn,
@@ -156,6 +269,8 @@ def create_comment(request: Any,
 
     This endpoint allows a user to add a comment to a specified blog post.
     The comment will be associated with the currently authenticated user.
+    Retries sending the same ``Idempotency-Key`` header get the first
+    response back.
 
 
     """
@@ -164,23 +279,45 @@ def create_comment(request: Any,
 
     post = get_object_or_404(Post, id=post_id)
 
+    if is_blocked:
+        metrics.MODERATION_BLOCKS.inc('comment')
+
+    signature = simhash(payload.content)
+    is_duplicate = (signature is not None
+                    and find_duplicate(signature) is not None)
+
+    if is_duplicate:
+        action = getattr(settings, "POSTS_DUPLICATE_ACTION", "flag")
+        metrics.DUPLICATE_COMMENTS.inc(action)
+        is_blocked = is_blocked or action == "block"
+
     comment = Comment.objects.create(
         post=post,
         author=request.user,
         content=payload.content,
         is_blocked=is_blocked,
+        is_duplicate=is_duplicate,
+        **signature_fields(signature),
     )
 
-    threading.Thread(target=send_auto_reply, args=(comment.id,)).start()
+    count_new_comment(comment)
 
-    return JsonResponse(
-        CommentOut.from_orm(comment).dict(),
-        status=201
-    )
+    transaction.on_commit(lambda: publish_comments([comment]))
+    transaction.on_commit(
+        lambda: queue_notifications(comment_notifications([comment])))
+
+    # Once committed, so the reply never looks for a rolled back comment.
+    transaction.on_commit(lambda: schedule_auto_reply(comment))
+
+    with timed("serialization"):
+        data = CommentOut.from_orm(comment).dict()
+
+    return JsonResponse(data, status=201)
 
 
 @api.get("/posts/{post_id}/comments/", response=List[CommentOut])
 @jwt_required
+@replica_reads
 def list_comments(
                 request: Any,
                 post_id: int,
@@ -188,16 +325,173 @@ def list_comments(
     """
     Retrieve a list of comments for a specific blog post.
 
-    This endpoint returns all comments associated with the specified post.
+    This endpoint returns all visible comments associated with the
+    specified post, oldest first.
+
+    """
+
+    # Evaluated here, so the query is timed as db and not serialization.
+    comments = list(Comment.objects.filter(post_id=post_id).order_by(
+        'created_at', 'id'))
+
+    with timed("serialization"):
+        return [CommentOut.from_orm(comment) for comment in comments]
+
+
+@api.get("/posts/{post_id}/comments/stream/")
+@jwt_required
+async def stream_comments(
+                    request: Any,
+                    post_id: int,
+                    ) -> StreamingHttpResponse:
+
+    """
+
+    Stream the new visible comments of a post as server-sent events.
+
+    Each ``comment`` event holds a comment as returned by
+    ``list_comments``, with its id as the event id. Reconnecting with a
+    ``Last-Event-ID`` header first sends the comments created since; when
+    there are more than ``POSTS_STREAM_BACKLOG``, the stream ends after
+    that many so the client reconnects for the rest.
+
+    """
+
+    await aget_object_or_404(Post, id=post_id)
+
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or 0)
+    except ValueError:
+        return JsonResponse({"error": "Invalid Last-Event-ID"}, status=400)
+
+    try:
+        subscription = subscribe(post_id)
+    except TooManySubscribers:
+        response = JsonResponse({"error": "Too many streams"}, status=503)
+        response['Retry-After'] = '5'
+        return response
+
+    # Subscribed first, so comments created meanwhile are not missed.
+    try:
+        backlog, partial = (await missed_comments(post_id, last_id)
+                            if last_id else ([], False))
+    except BaseException:
+        BROKER.unsubscribe(subscription)
+        raise
+
+    response = StreamingHttpResponse(
+        EventStream(subscription, backlog, partial),
+        content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+
+    return response
+
+
+@api.post("/posts/{post_id}/like/", response=ReactionOut)
+@jwt_required
+@rate_limit('reactions')
+def like_post(request: Any, post_id: int) -> JsonResponse:
+
+    """
+
+    Like a visible post.
+
+    """
+
+    post = get_object_or_404(Post, id=post_id)
+
+    created = react(request.user, ReactionTarget.POST, post.id)
+
+    return JsonResponse(
+        {"target_id": post.id, "reacted": True,
+         "count": reaction_count(ReactionTarget.POST, post.id)},
+        status=201 if created else 200)
+
+
+@api.delete("/posts/{post_id}/like/", response=ReactionOut)
+@jwt_required
+@rate_limit('reactions')
+def unlike_post(request: Any, post_id: int) -> Dict[str, Any]:
+
+    """
+
+    Remove a like from a post.
+
+    """
+
+    unreact(request.user, ReactionTarget.POST, post_id)
+
+    return {"target_id": post_id, "reacted": False,
+            "count": reaction_count(ReactionTarget.POST, post_id)}
+
+
+@api.post("/comments/{comment_id}/like/", response=ReactionOut)
+@jwt_required
+@rate_limit('reactions')
+def like_comment(request: Any, comment_id: int) -> JsonResponse:
+
+    """
+
+    Like a visible comment.
 
     """
 
-    comments = Comment.objects.filter(post_id=post_id)
-    return [CommentOut.from_orm(comment) for comment in comments]
+    comment = get_object_or_404(Comment, id=comment_id)
+
+    created = react(request.user, ReactionTarget.COMMENT, comment.id)
+
+    return JsonResponse(
+        {"target_id": comment.id, "reacted": True,
+         "count": reaction_count(ReactionTarget.COMMENT, comment.id)},
+        status=201 if created else 200)
+
+
+@api.delete("/comments/{comment_id}/like/", response=ReactionOut)
+@jwt_required
+@rate_limit('reactions')
+def unlike_comment(request: Any, comment_id: int) -> Dict[str, Any]:
+
+    """
+
+    Remove a like from a comment.
+
+    """
+
+    unreact(request.user, ReactionTarget.COMMENT, comment_id)
+
+    return {"target_id": comment_id, "reacted": False,
+            "count": reaction_count(ReactionTarget.COMMENT, comment_id)}
+
+
+@api.get("/reactions/", response=List[ReactionOut])
+@jwt_required
+@replica_reads
+def list_reactions(request: Any,
+                   ids: str = Query(...),
+                   target: Literal['posts', 'comments'] = 'posts',
+                   ) -> List[Dict[str, Any]]:
+
+    """
+
+    Retrieve the like counts of up to ``POSTS_REACTIONS_MAX_IDS`` posts
+    or comments, e.g. ``?target=comments&ids=1,2,3``, and whether the
+    user likes them.
+
+    """
+
+    try:
+        target_ids = parse_ids(
+            ids, getattr(settings, "POSTS_REACTIONS_MAX_IDS", 100))
+    except ValidationError as e:
+        return JsonResponse({"error": e.messages[0]}, status=400)
+
+    return reaction_counts(TARGETS[target], target_ids, request.user)
 
 
 @api.get("/comments-daily-breakdown/")
 @jwt_required
+@replica_reads
 def comments_daily_breakdown(request: Any, 
                              date_from: str = Query(...), 
                              date_to: str = Query(...)) -> Dict[str, int]:
@@ -220,7 +514,7 @@ def comments_daily_breakdown(request: Any,
 
         return {"error": "Invalid date format. Use YYYY-MM-DD."}
 
-    comments = Comment.objects.filter(created_at__range=(
+    comments = Comment.all_objects.filter(created_at__range=(
                                             date_from_dt,
                                             date_to_dt))
 
@@ -232,3 +526,231 @@ def comments_daily_breakdown(request: Any,
         "total_comments": total_comments,
         "blocked_comments": blocked_comments,
     }
+
+
+@api.post("/users/{user_id}/follow/", response=FollowOut)
+@jwt_required
+def follow(request: Any, user_id: int) -> JsonResponse:
+
+    """
+
+    Follow an author.
+
+    Posts by followed authors appear in the home feed.
+
+    """
+
+    author = get_object_or_404(User, id=user_id)
+
+    try:
+        created = follow_user(request.user, author)
+    except ValidationError as e:
+        return JsonResponse({"error": e.messages[0]}, status=400)
+
+    return JsonResponse({"author_id": author.id, "following": True},
+                        status=201 if created else 200)
+
+
+@api.delete("/users/{user_id}/follow/", response=FollowOut)
+@jwt_required
+def unfollow(request: Any, user_id: int) -> Dict[str, Any]:
+
+    """
+
+    Unfollow an author.
+
+    """
+
+    author = get_object_or_404(User, id=user_id)
+
+    unfollow_user(request.user, author)
+
+    return {"author_id": author.id, "following": False}
+
+
+@api.get("/feed/", response=FeedOut)
+@jwt_required
+def feed(request: Any,
+         cursor: Optional[str] = None,
+         limit: int = Query(20, ge=1, le=100),
+         ) -> Dict[str, Any]:
+
+    """
+
+    Retrieve the home feed of posts by followed authors, newest first.
+
+    Pass ``next_cursor`` from a response as ``cursor`` to get the next page.
+
+    """
+
+    try:
+        posts, next_cursor = get_feed(request.user, cursor, limit)
+    except ValidationError as e:
+        return JsonResponse({"error": e.messages[0]}, status=400)
+
+    return {"items": posts, "next_cursor": next_cursor}
+
+
+@api.get("/notifications/", response=NotificationsOut)
+@jwt_required
+def notifications(request: Any,
+                  cursor: Optional[str] = None,
+                  limit: int = Query(20, ge=1, le=100),
+                  ) -> Dict[str, Any]:
+
+    """
+
+    Retrieve the user's notifications, most recently updated first.
+
+    Comments on the same post are collapsed into one digest while it is
+    unread. Pass ``next_cursor`` from a response as ``cursor`` to get the
+    next page.
+
+    """
+
+    try:
+        items, next_cursor = list_notifications(request.user, cursor, limit)
+    except ValidationError as e:
+        return JsonResponse({"error": e.messages[0]}, status=400)
+
+    return {"items": items, "next_cursor": next_cursor,
+            "unread_count": unread_notifications(request.user)}
+
+
+@api.post("/notifications/read/", response=UnreadOut)
+@jwt_required
+def read_notifications(request: Any) -> Dict[str, int]:
+
+    """
+
+    Mark all of the user's notifications read.
+
+    """
+
+    mark_notifications_read(request.user)
+
+    return {"unread_count": 0}
+
+
+@api.get("/jwks.json")
+def jwks(request: Any) -> JsonResponse:
+
+    """
+
+    Publish the public keys verifying the JWTs issued by this API as a
+    JWK Set, for other services authenticating the same users.
+
+    """
+
+    return JsonResponse(get_keyset().public_jwks())
+
+
+@api.get("/metrics", include_in_schema=False)
+@metrics_access_required
+def metrics_endpoint(request: Any) -> HttpResponse:
+
+    """
+
+    Expose application metrics in the Prometheus text format, to
+    ``POSTS_METRICS_TOKEN`` bearers and staff users.
+
+    Samples are aggregated across all worker processes sharing
+    ``POSTS_METRICS_DIR``.
+
+    """
+
+    return HttpResponse(metrics.REGISTRY.render(),
+                        content_type=metrics.CONTENT_TYPE)
+
+
+@api.get("/profiles/")
+@jwt_required
+@staff_required
+def list_profiles(request: Any) -> List[Dict[str, Any]]:
+
+    """
+
+    Retrieve recent request profiles of this worker (staff only).
+
+    Profiles are captured for sampled and slow requests when
+    ``POSTS_PROFILING_ENABLED`` is set, newest first.
+
+    """
+
+    return recent_profiles()
+
+
+@api.get("/moderation/blocked/", response=BlockedOut)
+@jwt_required
+@staff_required
+def blocked_content(request: Any,
+                    kind: Literal['posts', 'comments'] = 'posts',
+                    cursor: Optional[str] = None,
+                    limit: int = Query(20, ge=1, le=100),
+                    ) -> Dict[str, Any]:
+
+    """
+
+    Retrieve posts or comments blocked by moderation, newest first
+    (staff only).
+
+    Pass ``next_cursor`` from a response as ``cursor`` to get the next page.
+
+    """
+
+    try:
+        items, next_cursor = list_blocked(kind, cursor, limit)
+    except ValidationError as e:
+        return JsonResponse({"error": e.messages[0]}, status=400)
+
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@api.get("/export/")
+@jwt_required
+@staff_required
+def export(request: Any,
+           since: Optional[str] = None,
+           gzip: bool = False,
+           ) -> StreamingHttpResponse:
+
+    """
+
+    Stream every post followed by its comments as NDJSON (staff only).
+
+    The ``X-Export-Watermark`` header holds the ``since`` to pass to the
+    next incremental export. Set ``gzip`` to download a compressed file.
+
+    """
+
+    # Rarely used; kept out of worker startup.
+    from posts.export import (
+        aiter_chunks, export_watermark, iter_chunks, iter_export,
+        parse_watermark)
+
+    try:
+        since = parse_watermark(since) if since else None
+    except ValueError:
+        return JsonResponse({"error": "Invalid since watermark"}, status=400)
+
+    watermark = export_watermark()
+    chunks = iter_chunks(iter_export(watermark, since), compress=gzip)
+
+    if isinstance(request, ASGIRequest):
+        chunks = aiter_chunks(chunks)
+
+    if gzip:
+        response = StreamingHttpResponse(chunks,
+                                         content_type="application/gzip")
+        response["Content-Disposition"] = (
+            'attachment; filename="export.ndjson.gz"')
+    else:
+        response = StreamingHttpResponse(chunks,
+                                         content_type="application/x-ndjson")
+
+    response["X-Export-Watermark"] = str(watermark)
+
+    return response
+
+
+instrument_api(api)